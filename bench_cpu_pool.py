@@ -0,0 +1,118 @@
+#!/usr/bin/python3
+
+# benchmark for cpu_pool.py: normalizes a batch of large formatted text documents in process, on
+# threads, and on process pools of 1, 2, 4 ... cores, and prints how each scales
+#
+#   python bench_cpu_pool.py [-n bills] [-m MB per bill] [-a archive dir] [-x transliterate]
+#
+# by default synthetic bills are written to a temporary archive; -a uses the html already in a
+# source archive (e.g. archive/) instead. every mode has to produce the same text as in process.
+
+import os
+import sys
+import time
+import getopt
+import shutil
+import tempfile
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from source_archive import SourceArchive
+from stream_normalize import normalize_blob
+
+CONTENT_TYPE = "text/html; charset=utf-8"
+
+# one section of a synthetic bill, with the entities, section signs, urls and non-ascii characters real ones have
+SECTION = """<p>SEC. {n}. AMENDMENTS TO THE ACT OF &#8220;{n}&#8221;.</p>
+<p>(a) In General.&#8212;Section {n} of title 42, United States Code (42 U.S.C. {n}), is amended&#8212;</p>
+<p>  (1) by striking &#8220;fiscal year 2024&#8221; and inserting &#8220;fiscal years 2025 through 2030&#8221;;</p>
+<p>  (2) in &sect;&sect; {n}(b) by inserting &lsquo;&lsquo;or tribal&rsquo;&rsquo; after &#8220;State&#8221; &amp; &ldquo;local&rdquo;; and</p>
+<p>  (3) see https://www.congress.gov/bill/119th-congress/senate-bill/{n} for the café provisions.</p>
+"""
+
+
+def synthetic_bill(size):
+    head = "<html><body><pre>\n119th CONGRESS\n1st Session\nS. 1001\n\nIN THE SENATE OF THE UNITED STATES\n\nMarch 10, 2025\n</pre>\n"
+    parts, total, n = [head], len(head), 0
+    while total < size:
+        n += 1
+        section = SECTION.format(n=n)
+        parts.append(section)
+        total += len(section)
+    parts.append("</body></html>")
+    return "".join(parts).encode("utf-8")
+
+
+# the formatted text blobs in an existing archive, largest first
+def archived_bills(root, count):
+    return SourceArchive(root).list_parts("html")[:count]
+
+
+def timed(label, run, docs, reference, total_bytes, baseline=None):
+    started = time.perf_counter()
+    texts = run()
+    seconds = time.perf_counter() - started
+    if reference is not None and texts != reference:
+        print(f"{label}: output differs from the in process run")
+        sys.exit(1)
+    speedup = f"{baseline / seconds:5.2f}x" if baseline else "1.00x"
+    print(f"  {label:<22} {seconds:8.2f}s  {total_bytes / 1024 ** 2 / seconds:8.1f} MB/s  {speedup}")
+    return texts, seconds
+
+
+def main(argv):
+    bills, size_mb, archive_dir, ascii_only = 16, 4, None, False
+    try:
+        opts, _ = getopt.getopt(argv, "n:m:a:x")
+    except getopt.GetoptError:
+        print("Usage: bench_cpu_pool.py [-n bills] [-m MB per bill] [-a archive dir] [-x]")
+        sys.exit(1)
+    for opt, arg in opts:
+        if opt == "-n":
+            bills = int(arg)
+        elif opt == "-m":
+            size_mb = float(arg)
+        elif opt == "-a":
+            archive_dir = arg
+        elif opt == "-x":
+            ascii_only = True
+
+    tmp_dir = None
+    if archive_dir:
+        root = archive_dir
+        docs = [(p["hash"], p["content_type"], p["size"]) for p in archived_bills(root, bills)]
+        if not docs:
+            print(f"No formatted text html in {archive_dir}")
+            sys.exit(1)
+    else:
+        root = tmp_dir = tempfile.mkdtemp(prefix="bench_cpu_pool.")
+        archive = SourceArchive(root)
+        # slightly different bills, so no two share a blob
+        docs = []
+        for i in range(bills):
+            data = synthetic_bill(int(size_mb * 1024 ** 2)) + f"<!-- {i} -->".encode("ascii")
+            docs.append((archive.put_blob(data), CONTENT_TYPE, len(data)))
+
+    total_bytes = sum(size for _, _, size in docs)
+    cores = os.cpu_count() or 1
+    print(f"{len(docs)} bill(s), {total_bytes / 1024 ** 2:.1f} MB of html, {cores} core(s)")
+
+    args = [(root, digest, content_type, True, ascii_only) for digest, content_type, _ in docs]
+    try:
+        reference, baseline = timed("in process", lambda: [normalize_blob(*a) for a in args], docs, None, total_bytes)
+
+        counts = sorted({1, 2, 4, 8, 16, 32, cores} & set(range(1, cores + 1)))
+        for workers in counts:
+            with ThreadPoolExecutor(workers) as threads:
+                timed(f"threads x{workers}", lambda: list(threads.map(lambda a: normalize_blob(*a), args)), docs, reference, total_bytes, baseline)
+        for workers in counts:
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                # started before the clock, as they are once per run in the pipeline
+                list(pool.map(abs, range(workers)))
+                timed(f"process pool x{workers}", lambda: list(pool.map(normalize_blob, *zip(*args))), docs, reference, total_bytes, baseline)
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,180 @@
+import re
+from config import BILL_TEXT_REDUCTION, REDUCED_SECTION_CHARS
+
+# deterministic reduction of formatted bill text before it goes into the story prompt
+#
+# the GPO formatted text is laid out for print: a bracketed header, the bill number, the
+# introduction and referral lines, "A BILL", the long title, the enacting clause, a table of
+# contents, hard wrapped and indented lines, underscore rules, and statute cross-references on
+# every other line. none of that helps the model write a story, and all of it is paid for as
+# input tokens. the reducer recognizes those structures and keeps section headings plus the
+# substantive text, at one of these levels (BILL_TEXT_REDUCTION in config.py):
+#   0  off, the text is sent as it is
+#   1  layout: drops the front matter (keeping the long title as the purpose), the table of
+#      contents, rules and line number / page artifacts, and joins wrapped lines into paragraphs
+#   2  also drops U.S.C. cross-reference parentheticals and conforming, technical and clerical
+#      amendment sections
+#   3  also cuts every section to its heading and first REDUCED_SECTION_CHARS characters
+#
+# the intro date and sponsor are read from the full text before it is reduced (see generate_story)
+
+ENACTING_RE = re.compile(
+    r"^\s*(?:Be it enacted by the Senate and House of Representatives|Resolved(?: by the (?:Senate|House)[^,]*)?,)",
+    re.IGNORECASE,
+)
+# the line before the long title
+DOCUMENT_TYPE_RE = re.compile(r"^\s*(?:A BILL|JOINT RESOLUTION|CONCURRENT RESOLUTION|RESOLUTION)\s*$")
+# paragraphs the enacting clause is made of end here
+ENACTING_END_RE = re.compile(r"in Congress assembled[,.]?\s*$")
+# a resolution's preamble comes before its resolving clause and is kept
+PREAMBLE_RE = re.compile(r"^\s*Whereas\b")
+
+# lines that are print artifacts: GPO's bracketed header, rules, bare line numbers, page footers
+ARTIFACT_RE = re.compile(
+    r"^\s*(?:"
+    r"\[(?:Congressional Bills|From the U\.S\. Government|[^\]]*\((?:IH|IS|RH|RS|EH|ES|ENR|PCS|RFS|RFH)\))[^\]]*\]"
+    r"|_{5,}|-{5,}"
+    r"|\d{1,3}"
+    r"|\W*(?:HR|S|H\. ?R\.|S\.) ?\d+ (?:IH|IS|RH|RS|EH|ES|ENR)"
+    r"|<?all>?"
+    r")\s*$"
+)
+
+# a new paragraph starts at a blank line or one of these: an indented enumerator or quoted block
+# (wrapped lines start at the margin), a heading, a table of contents entry, or a clause of the preamble
+PARAGRAPH_START_RE = re.compile(
+    r"^(?:\s+(?:\((?:[a-z]{1,2}|\d{1,3}|[A-Z]{1,2}|[ivxlc]{1,6}|[IVXLC]{1,6})\)|``)"
+    r"|\s*(?:(?:SECTION|SEC\.|TITLE|Subtitle|CHAPTER|PART|DIVISION)\s|Sec\. \d|Whereas\b|Resolved\b|Be it enacted\b))"
+)
+
+# a section heading (not one inside a quoted amendment, those start with ``)
+SECTION_RE = re.compile(r"^(?:SECTION|SEC\.) \d+[A-Z]?\. ")
+TABLE_OF_CONTENTS_RE = re.compile(r"TABLE OF CONTENTS", re.IGNORECASE)
+HEADING_TOC_RE = re.compile(r"[;,]? (?:AND )?TABLE OF CONTENTS", re.IGNORECASE)
+# division headings, which end a table of contents when they come after its last entry
+DIVISION_RE = re.compile(r"^(?:TITLE|Subtitle|DIVISION|PART|CHAPTER) [\w-]+--")
+BOILERPLATE_SECTION_RE = re.compile(r"\b(?:CONFORMING|TECHNICAL|CLERICAL)\b.*\bAMENDMENTS?\b", re.IGNORECASE)
+
+# "(42 U.S.C. 1395x(s)(2))", "(20 U.S.C. 1001 et seq.)", "(Public Law 117-58; 135 Stat. 429)"
+CROSS_REFERENCE_RE = re.compile(
+    r" ?\((?:\d+ U\.S\.C\. |Public Law \d|\d+ Stat\. )[^()]*(?:\([^()]*\)[^()]*)*\)"
+)
+
+WHITESPACE_RE = re.compile(r"\s+")
+SENTENCE_END_RE = re.compile(r"[.;:]\s")
+
+# a reduction that leaves less than this share of a long text is assumed to have misread it
+MIN_KEPT_RATIO = 0.02
+MIN_INPUT_CHARS = 2000
+
+
+def paragraphs(lines):
+    """Joins hard wrapped lines into whitespace-collapsed paragraphs."""
+    current = []
+    for line in lines:
+        if not line.strip() or ARTIFACT_RE.match(line):
+            if current:
+                yield " ".join(current)
+                current = []
+            continue
+        if current and PARAGRAPH_START_RE.match(line):
+            yield " ".join(current)
+            current = []
+        current.append(WHITESPACE_RE.sub(" ", line).strip())
+    if current:
+        yield " ".join(current)
+
+
+def split_front_matter(paras):
+    """
+    Returns (long title or None, the paragraphs after the enacting clause, or from a resolution's
+    preamble on). Bills without a recognizable enacting clause are returned whole.
+    """
+    for i, para in enumerate(paras):
+        if ENACTING_RE.match(para) or PREAMBLE_RE.match(para):
+            break
+    else:
+        return None, paras
+
+    title = None
+    for j in range(i):
+        if DOCUMENT_TYPE_RE.match(paras[j]) and j + 1 < i:
+            title = paras[j + 1]
+            break
+
+    # "Be it enacted ... in Congress assembled," is a paragraph of its own, "Resolved, That ..." runs on
+    rest = paras[i:]
+    if ENACTING_END_RE.search(rest[0]):
+        rest = rest[1:]
+    return title, rest
+
+
+def sections(paras):
+    """Groups paragraphs into [heading or None, paragraphs] sections."""
+    grouped = [[None, []]]
+    for para in paras:
+        if SECTION_RE.match(para):
+            grouped.append([para, []])
+        else:
+            grouped[-1][1].append(para)
+    return [section for section in grouped if section[0] or section[1]]
+
+
+def drop_table_of_contents(heading, body):
+    """
+    Returns the (heading, body) of a section whose heading mentions a table of contents, without
+    it. "SECTION 1. SHORT TITLE; TABLE OF CONTENTS." keeps its short title; a heading that is
+    only the table of contents goes too.
+    """
+    number = SECTION_RE.match(heading).group()
+    title = HEADING_TOC_RE.sub("", " " + heading[len(number):]).strip(" .;,")
+    heading = f"{number}{title}." if title else None
+    for i, para in enumerate(body):
+        if TABLE_OF_CONTENTS_RE.search(para):
+            break
+    else:
+        i = 0 if heading is None else len(body)
+    kept, contents = body[:i], body[i:]
+    # the entries run up to the section's end, except for the headings of the first title after them
+    j = len(contents)
+    while j > 0 and DIVISION_RE.match(contents[j - 1]):
+        j -= 1
+    return heading, kept + contents[j:]
+
+
+# the first limit characters of a section body, cut after a sentence or clause where possible
+def shorten(body, limit):
+    if len(body) <= limit:
+        return body
+    cut = max((m.end() for m in SENTENCE_END_RE.finditer(body, 0, limit)), default=limit)
+    return body[:cut].rstrip() + " [...]"
+
+
+def reduce_bill_text(text, level=BILL_TEXT_REDUCTION):
+    """Returns the prompt version of normalized bill text at the given reduction level."""
+    if level <= 0 or not text:
+        return text
+
+    title, paras = split_front_matter(list(paragraphs(text.splitlines())))
+
+    kept = []
+    if title:
+        kept.append(f"Purpose: {title}")
+    for heading, body in sections(paras):
+        if heading and TABLE_OF_CONTENTS_RE.search(heading):
+            heading, body = drop_table_of_contents(heading, body)
+        if level >= 2 and heading and BOILERPLATE_SECTION_RE.search(heading):
+            continue
+        if level >= 2:
+            body = [CROSS_REFERENCE_RE.sub("", para) for para in body]
+        if level >= 3:
+            body = [shorten(" ".join(body), REDUCED_SECTION_CHARS)] if body else []
+        if heading:
+            kept.append(heading)
+        kept.extend(body)
+
+    reduced = "\n".join(kept).replace("``", '"').replace("''", '"')
+    if len(text) >= MIN_INPUT_CHARS and len(reduced) < MIN_KEPT_RATIO * len(text):
+        # not laid out the way GPO text is, so only the whitespace is collapsed
+        return "\n".join(paragraphs(text.splitlines()))
+    return reduced
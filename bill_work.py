@@ -0,0 +1,72 @@
+from typing import NamedTuple
+
+# the congress currently being scraped (to be changed when a new congress starts)
+CURRENT_CONGRESS = 119
+
+
+# a parsed bill reference, e.g. (119, "senate", "1001")
+class BillRef(NamedTuple):
+    congress: int
+    chamber: str
+    number: str
+
+    @property
+    def is_senate(self):
+        return self.chamber == "senate"
+
+    # bill type used in congress.gov api urls
+    @property
+    def bill_type(self):
+        return "s" if self.is_senate else "hr"
+
+    # label used in stories, e.g. "S." or "H.R."
+    @property
+    def label(self):
+        return "S." if self.is_senate else "H.R."
+
+
+# parses a congress.gov bill url (with or without a trailing /text) into a BillRef
+def parse_bill_url(url, is_senate, congress=CURRENT_CONGRESS):
+    parts = url.rstrip("/").split("/")
+    bill_number = parts[-1]
+    if bill_number == "text":  # handle trailing /text URLs
+        bill_number = parts[-2]
+    return BillRef(congress, "senate" if is_senate else "house", bill_number)
+
+
+class BillWork:
+    """
+    Everything known about one bill while it moves through the pipeline.
+
+    Each stage reads and fills in its own fields on the bill's BillWork instead of sharing
+    module-level state, so several bills can be processed at the same time.
+    """
+    __slots__ = (
+        "url_id", "url", "bill",
+        "content", "summary", "summary_date",
+        "sponsor", "sponsor_blob", "filename",
+        "headline", "press_release", "tag_ids", "usage",
+    )
+
+    def __init__(self, url_id, url, bill):
+        self.url_id = url_id
+        self.url = url
+        self.bill = bill
+        self.content = None
+        self.summary = None
+        self.summary_date = None
+        # (fullname, last name) when already known (e.g. from bulk data), otherwise looked up by generate_story
+        self.sponsor = None
+        self.sponsor_blob = None
+        self.filename = None
+        self.headline = None
+        self.press_release = None
+        self.tag_ids = {}
+        self.usage = None
+
+    def __repr__(self):
+        return f"BillWork({self.bill.chamber} {self.bill.number}, url_id={self.url_id})"
+
+    @classmethod
+    def from_url(cls, url_id, url, is_senate):
+        return cls(url_id, url, parse_bill_url(url, is_senate))
@@ -1 +1,129 @@
 SELECT_LIMIT = 2000
+
+# local archive of fetched bill sources (see source_archive.py)
+ARCHIVE_DIR = "archive"
+ARCHIVE_MAX_AGE_DAYS = 180
+ARCHIVE_MAX_BYTES = 2 * 1024 ** 3
+
+# model used for story generation
+OPENAI_MODEL = "gpt-4o-mini"
+
+# local outbox of generated stories and cached model output (see story_outbox.py)
+OUTBOX_PATH = "outbox/outbox.db"
+
+# stream completions so malformed output is cancelled as soon as it is detected
+STREAM_GENERATION = True
+MAX_HEADLINE_CHARS = 300
+
+# number of finished stories written to the TNS DB per transaction
+STORY_BATCH_SIZE = 10
+
+# formatted bill text is downloaded and normalized in chunks of this many bytes
+HTML_CHUNK_SIZE = 64 * 1024
+# transliterate the bill text to ASCII before it goes into the prompt
+TRANSLITERATE_BILL_TEXT = False
+
+# run log rotation (by time when LOG_ROTATE_WHEN is set, e.g. "midnight", otherwise by size)
+LOG_MAX_BYTES = 50 * 1024 ** 2
+LOG_BACKUPS = 5
+LOG_ROTATE_WHEN = None
+
+# bad characters found by cleanup_text are appended here once per run
+BADCHARS_LOG = "/tnsdata/logs/badchars1"
+
+# most bills taken from each chamber's queue in a combined (-b) run, None for no cap
+CHAMBER_QUOTAS = {"house": None, "senate": None}
+
+# only fetch pending bills the congress-wide summaries feed lists (see summary_discovery.py)
+USE_SUMMARY_DISCOVERY = True
+DISCOVERY_STATE_PATH = "state/summary_discovery.json"
+
+# the provider only caches prompt prefixes of at least this many tokens (see prompt_templates.py)
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+# per-call token usage and cost (see usage_accounting.py), prices in dollars per million tokens
+USAGE_PATH = "outbox/usage.db"
+MODEL_PRICES = {
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+}
+
+# storage backend for the queue, story and tag tables: "mysql" (the TNS server) or "sqlite" (embedded, see storage.py)
+STORAGE_BACKEND = "mysql"
+MYSQL_CONFIG_PATH = "configs/db_config.yml"
+SQLITE_DB_PATH = "state/tns.db"
+
+# retry policy for outbound calls (see http_utils.py): retries per call, backoff base/cap in seconds,
+# retries allowed per run, and failures in a row before an endpoint's circuit opens (and for how long)
+HTTP_RETRIES = 3
+HTTP_BACKOFF_BASE = 0.5
+HTTP_BACKOFF_CAP = 20.0
+RETRY_BUDGET = 200
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 120
+
+# request deadlines: (connect, read) seconds for every http_get, seconds per OpenAI request,
+# and the most a streamed completion may take in total before it is cancelled
+HTTP_TIMEOUT = (5, 30)
+OPENAI_TIMEOUT = 120
+OPENAI_DEADLINE = 180
+
+# adaptive concurrency per endpoint (see http_utils.py): (starting, lowest, highest) requests in flight, what the
+# limit is multiplied by on a 429, 5xx, timeout or latency spike, and how many times the usual latency is a spike
+CONCURRENCY_LIMITS = {
+    "default": (4, 1, 16),
+    "api.openai.com": (4, 1, 8),
+}
+CONCURRENCY_DECREASE = 0.5
+LATENCY_SPIKE_FACTOR = 4.0
+# the usual latency is the median of the last LATENCY_WINDOW calls (kept per prompt size for openai),
+# and spikes are only looked for once LATENCY_MIN_SAMPLES calls have been seen
+LATENCY_WINDOW = 20
+LATENCY_MIN_SAMPLES = 5
+
+# run journals used by --resume (see run_journal.py), deleted after JOURNAL_KEEP_DAYS
+JOURNAL_DIR = "state/journal"
+JOURNAL_KEEP_DAYS = 14
+
+# reuse the story of a near-duplicate bill (companion or re-introduced, see similar_bills.py) instead of generating one,
+# when the estimated similarity of the CRS summaries is at least SIMILARITY_THRESHOLD
+REUSE_SIMILAR_STORIES = True
+SIMILARITY_THRESHOLD = 0.9
+SIMILARITY_PATH = "outbox/similar.db"
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+
+# --profile: seconds between stack samples, rows in the report, and stack depth kept per allocation with --profile-memory
+PROFILE_INTERVAL = 0.01
+PROFILE_TOP = 20
+PROFILE_MEMORY_FRAMES = 1
+
+# sql dump loading (see sql_dump.py): bytes read at a time, largest merged INSERT, bytes executed per
+# commit, and seconds between progress lines
+DUMP_READ_CHUNK = 1024 ** 2
+DUMP_BATCH_BYTES = 1024 ** 2
+DUMP_COMMIT_BYTES = 32 * 1024 ** 2
+DUMP_PROGRESS_SECONDS = 5
+
+# bill pipeline (see pipeline.py): worker threads per stage, and how many bills may wait in front of each stage
+# (fetch and generate threads are upper bounds, the requests in flight follow the limits in CONCURRENCY_LIMITS)
+PIPELINE_WORKERS = {"fetch": 8, "gate": 2, "generate": 8}
+PIPELINE_QUEUE_SIZE = 4
+
+# --budget: seconds kept back for the final flush and the summary email, the assumed duration of a
+# stage before it has been timed, and the weight of the newest timing in each stage's moving average
+BUDGET_RESERVE = 60
+BUDGET_DEFAULT_STAGE_SECONDS = 30
+BUDGET_SMOOTHING = 0.3
+
+# process pool for normalizing large formatted text html (see cpu_pool.py): 0 keeps it in process, None is one
+# worker per core; documents under CPU_OFFLOAD_MIN_BYTES never leave the process, larger ones do when their
+# measured work is more than CPU_OFFLOAD_FACTOR times the measured cost of a pool call
+CPU_POOL_WORKERS = 0
+CPU_OFFLOAD_MIN_BYTES = 256 * 1024
+CPU_OFFLOAD_FACTOR = 2
+
+# how much of the formatted bill text's layout and boilerplate is dropped before it goes into the prompt
+# (see bill_text_reducer.py): 0 off, 1 layout and front matter, 2 also cross-references and conforming
+# amendments, 3 also every section cut to its heading and first REDUCED_SECTION_CHARS characters
+BILL_TEXT_REDUCTION = 2
+REDUCED_SECTION_CHARS = 800
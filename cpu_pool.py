@@ -0,0 +1,163 @@
+import os
+import time
+import importlib
+import logging
+import threading
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from config import CPU_POOL_WORKERS, CPU_OFFLOAD_MIN_BYTES, CPU_OFFLOAD_FACTOR
+
+# optional process pool for the cpu-bound parts of fetching a bill (turning multi-MB formatted
+# text html into plain text: gunzip, decode, tag stripping, unescaping, url stripping and
+# transliteration), which the GIL would otherwise serialize across the pipeline's fetch threads
+#
+# documents are handed over by reference (an archive digest the worker reads itself), never as
+# pickled html. whether a document is worth the round trip is decided per call: the cost of the
+# work per input byte and the pool's fixed cost per call (pickling the result, scheduling,
+# waiting for a free worker) are both measured as the run goes, and a document is offloaded when
+# its expected work is more than CPU_OFFLOAD_FACTOR times that fixed cost.
+#
+# CPU_POOL_WORKERS = 0 keeps everything in process (the default), None uses one worker per core
+
+# weight of the newest timing in the moving averages
+SMOOTHING = 0.2
+
+# every this many documents kept in process, one goes to the pool anyway to keep the estimates current
+# (the first calls also pay for starting the worker processes, which shouldn't rule the pool out for good)
+PROBE_EVERY = 16
+
+# modules of the offloaded functions, imported as each worker starts instead of on its first call
+WORKER_IMPORTS = ("stream_normalize", "source_archive")
+
+
+def _start_worker():
+    for module in WORKER_IMPORTS:
+        importlib.import_module(module)
+
+
+# runs fn in a worker and returns its result with the seconds the work itself took
+def _timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+class CpuOffloader:
+    def __init__(self, workers=CPU_POOL_WORKERS, min_bytes=CPU_OFFLOAD_MIN_BYTES, factor=CPU_OFFLOAD_FACTOR):
+        # a pool on a single core only adds the cost of the round trips
+        self.workers = 0 if workers is None and (os.cpu_count() or 1) < 2 else workers
+        self.min_bytes = min_bytes
+        self.factor = factor
+        # seconds of work per input byte, and seconds an offloaded call costs beyond its work
+        self.work_rate = None
+        self.overhead = None
+        self.stats = Counter()
+        self._since_probe = 0
+        self._warming = 0
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.workers != 0
+
+    def _average(self, name, value):
+        previous = getattr(self, name)
+        setattr(self, name, value if previous is None else previous + SMOOTHING * (value - previous))
+
+    # whether a document of size bytes is expected to finish sooner in the pool than in this process
+    def worth_offloading(self, size):
+        if not self.enabled or not size or size < self.min_bytes:
+            return False
+        with self._lock:
+            if self.work_rate is None or self.overhead is None:
+                # nothing measured yet, so the first big documents go to the pool to find out
+                return True
+            if size * self.work_rate > self.factor * self.overhead:
+                return True
+            self._since_probe += 1
+            if self._since_probe >= PROBE_EVERY:
+                self._since_probe = 0
+                return True
+            return False
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # spawned rather than forked, since the pipeline and log threads are running by now
+                workers = self.workers or os.cpu_count()
+                self._pool = ProcessPoolExecutor(
+                    max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=_start_worker
+                )
+                # the workers are started up front, and the first call each one serves (which still pays
+                # for one-off setup in the worker) isn't counted towards the cost of a call
+                list(self._pool.map(abs, range(workers)))
+                self._warming = workers
+                logging.info(f"CPU pool started with {workers} worker process(es)")
+            return self._pool
+
+    def run(self, size, fn, *args):
+        """
+        Returns fn(*args), computed in a worker process when a document of size (input) bytes is
+        worth offloading and in this thread otherwise. fn and args must be picklable; fn is
+        expected to read any large input itself.
+        """
+        if self.worth_offloading(size):
+            started = time.perf_counter()
+            try:
+                result, work = self._get_pool().submit(_timed, fn, *args).result()
+            except BrokenProcessPool as e:
+                logging.warning(f"CPU pool broke ({e}), doing the work in process from now on")
+                self.workers = 0
+            else:
+                with self._lock:
+                    self._average("work_rate", work / size)
+                    if self._warming > 0:
+                        self._warming -= 1
+                    else:
+                        self._average("overhead", max(0.0, time.perf_counter() - started - work))
+                    self.stats["offloaded"] += 1
+                    self.stats["offloaded_bytes"] += size
+                return result
+
+        result, work = _timed(fn, *args)
+        if size:
+            with self._lock:
+                self._average("work_rate", work / size)
+                self.stats["inline"] += 1
+                self.stats["inline_bytes"] += size
+        return result
+
+    def report(self):
+        with self._lock:
+            stats, rate, overhead = dict(self.stats), self.work_rate, self.overhead
+        mb = 1024 ** 2
+        line = (
+            f"CPU offload: {stats.get('offloaded', 0)} document(s) ({stats.get('offloaded_bytes', 0) / mb:.1f} MB) in the pool, "
+            f"{stats.get('inline', 0)} ({stats.get('inline_bytes', 0) / mb:.1f} MB) in process"
+        )
+        if rate is not None:
+            line += f", {rate * mb:.3f}s of work per MB"
+        if overhead is not None:
+            line += f", {overhead * 1000:.0f} ms per pool call"
+        return line
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+        if self.stats:
+            logging.info(self.report())
+
+
+_offloader = None
+
+# shared offloader used by the fetch layer
+def get_offloader():
+    global _offloader
+    if _offloader is None:
+        _offloader = CpuOffloader()
+    return _offloader
@@ -1,129 +1,63 @@
 import sys
 import csv
-import yaml
 import logging
-import mysql.connector
-from datetime import datetime
-from mysql.connector import IntegrityError, DataError
-from openai_api import callApiWithText, OpenAI
-from url_processing import get_most_recent_bill_number, getTextandSummary, extract_sponsor_phrase
 from shared_utils import getKey
-import openai_api
-from config import SELECT_LIMIT
-
-# getts the db connection
-def get_db_connection(yml_path="configs/db_config.yml"):
-    with open(yml_path, "r") as yml_file:
-        config = yaml.load(yml_file, Loader=yaml.FullLoader)
-    return mysql.connector.connect(
-        host=config["host"],
-        user=config["user"],
-        password=config["password"],
-        database=config["database"]
-    )
+from storage import get_storage
+from story_outbox import enqueue_story, mark_delivered, pending_stories
+from config import SELECT_LIMIT, STORY_BATCH_SIZE, OPENAI_TIMEOUT
+
+# gets a connection to the configured storage backend (see storage.py)
+def get_db_connection():
+    return get_storage().connect()
 
 # loads up to SELECT_LIMIT house or senate urls that are still pending
 def load_pending_urls_from_db(is_senate):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        chamber = 'senate' if is_senate else 'house'
-        query = f"""
-            SELECT id, url FROM sum_queue
-            WHERE status = 'pending' AND chamber = %s
-            LIMIT {SELECT_LIMIT}
-        """
-        cursor.execute(query, (chamber,))
-        return cursor.fetchall()
-    finally:
-        conn.close()
+    return get_storage().load_pending_urls('senate' if is_senate else 'house', SELECT_LIMIT)
 
 # marks a bill thats been inserted into the DB so that it isnt looked at again
 def mark_url_processed(url_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("UPDATE sum_queue SET status = 'processed' WHERE id = %s", (url_id,))
-        conn.commit()
-    finally:
-        conn.close()
+    get_storage().set_url_status(url_id, 'processed')
 
 # used to mark url invalid if it breaks rules set my program
 def mark_url_invalid(url_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("UPDATE sum_queue SET status = 'invalid' WHERE id = %s", (url_id,))
-        conn.commit()
-    finally:
-        conn.close()
+    get_storage().set_url_status(url_id, 'invalid')
 
 # method adds story id from inserted story into url queue
 def link_story_to_url(url_id, s_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("UPDATE sum_queue SET story_id = %s WHERE id = %s", (s_id, url_id))
-        conn.commit()
-    finally:
-        conn.close()
+    get_storage().link_story_to_url(url_id, s_id)
 
 # adds note to url in url queue
 def add_note_to_url(url_id, message):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("UPDATE sum_queue SET notes = %s WHERE id = %s", (message, url_id))
-        conn.commit()
-    finally:
-        conn.close()
+    get_storage().add_note_to_url(url_id, message)
+
+# adds a single bill url to the queue (if it isnt there yet) and returns its (id, status)
+def queue_url(chamber, url):
+    return get_storage().queue_url(chamber, url)
+
+# checks whether a story with this filename is already in the story table
+def story_exists(filename):
+    return get_storage().story_exists(filename)
 
 # gets the max bill number for DB (to be used to add all new urls from DB MAX to new most recent bill num)
 def get_max_bill_number_from_db(chamber):
     """Returns the highest bill number in the database for the given chamber."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("""
-            SELECT MAX(CAST(SUBSTRING_INDEX(url, '/', -1) AS UNSIGNED))
-            FROM sum_queue
-            WHERE chamber = %s
-        """, (chamber,))
-        result = cursor.fetchone()[0]
-        logging.debug(f"{chamber}: MAX CURRENT BILL NUM => {result}")
-
-        return result if result else 0
-    finally:
-        conn.close()
+    result = get_storage().max_bill_number(chamber)
+    logging.debug(f"{chamber}: MAX CURRENT BILL NUM => {result}")
+    return result
 
 # inserts all bills from previous MAX to new largest bill num into the TNS DB
 def insert_new_bills(chamber, last_known, latest_number):
     """Inserts new bill URLs into the queue based on the difference between latest and known max."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        base_url = f"https://www.congress.gov/bill/119th-congress/{chamber}-bill/"
-        for num in range(last_known + 1, latest_number + 1):
-            url = base_url + str(num)
-            try:
-                logging.debug(f"TRYING TO INSERT new {chamber} bill: {num}")
-                cursor.execute("""
-                    INSERT INTO sum_queue (url, chamber, status)
-                    VALUES (%s, %s, 'pending')
-                """, (url, chamber))
-
-                logging.debug(f"Insert success: {url}")
-            except Exception as e:
-                logging.debug(f"Failed to insert {url}: {e}")
-        conn.commit()
-        logging.debug(f"Inserted {latest_number - last_known} new {chamber} bill URLs.")
-    finally:
-        conn.close()
+    base_url = f"https://www.congress.gov/bill/119th-congress/{chamber}-bill/"
+    get_storage().insert_urls(chamber, [base_url + str(num) for num in range(last_known + 1, latest_number + 1)])
+    logging.debug(f"Inserted {latest_number - last_known} new {chamber} bill URLs.")
 
 # This func combines the previous two functions
 def populateDB():
     """Main function to find the latest House and Senate bill numbers and queue missing ones."""
 
+    from url_processing import get_most_recent_bill_number
+
     house_latest = get_most_recent_bill_number(False)
     senate_latest = get_most_recent_bill_number(True)
     
@@ -137,93 +71,98 @@ def populateDB():
         if senate_latest > current_max_senate:
             insert_new_bills("senate", current_max_senate, senate_latest)
 
-# inserts story into the TNS DB
-def insert_story(filename, headline, body, a_id, sponsor_blob):
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Check for duplicate filename
-        check_sql = "SELECT COUNT(*) FROM story WHERE filename = %s"
-        cursor.execute(check_sql, (filename,))
-        if cursor.fetchone()[0] > 0:
-            logging.info(f"Duplicate filename, skipping: {filename}")
-            return False
-
-        # Insert into story
-        insert_sql = """
-        INSERT INTO story
-        (filename, uname, source, by_line, headline, story_txt, editor, invoice_tag,
-         date_sent, sent_to, wire_to, nexis_sent, factiva_sent,
-         status, content_date, last_action, orig_txt)
-        VALUES (%s, %s, %s, %s, %s, %s, '', '', NOW(), '', '', NULL, NULL, %s, %s, SYSDATE(), %s)
-        """
-        today_str = datetime.now().strftime('%Y-%m-%d')
-        cursor.execute(insert_sql, (
-            filename,
-            "T70-BM-BillSum",
-            a_id,
-            "Bailey Malota",
-            headline,
-            body,
-            'D',
-            today_str,
-            sponsor_blob
-        ))
-
-        # get story ID s_id
-        s_id = cursor.lastrowid
-
-        # insert state tags into story_tag
-        tag_insert_sql = "INSERT INTO story_tag (id, tag_id) VALUES (%s, %s)"
-        for state_abbr, tag_id in openai_api.found_ids.items():
-            cursor.execute(tag_insert_sql, (s_id, tag_id))
-            logging.debug(f"Inserted tag for state {state_abbr} (tag_id={tag_id})")
-
-        conn.commit()
-        logging.info(f"Inserted story and {len(openai_api.found_ids)} tag(s): {filename}")
-        return s_id
-    except Exception as err:
-        logging.error(f"DB insert failed: {err}")
-        return None
-    finally:
-        if conn:
-            conn.close()
+# inserts a group of finished stories and their state tags in a single transaction (see Storage.insert_stories)
+def insert_stories(stories):
+    return get_storage().insert_stories(stories)
+
+# inserts a single story into the TNS DB (returns the story id, False for a duplicate, None on error)
+def insert_story(filename, headline, body, a_id, sponsor_blob, tag_ids):
+    story = {"filename": filename, "headline": headline, "body": body, "a_id": a_id, "sponsor_blob": sponsor_blob, "tag_ids": tag_ids}
+    return insert_stories([story])[0]
+
+# marks inserted bills processed and links them to their stories in one statement
+def link_stories_to_urls(links):
+    """links is a list of (url_id, s_id) pairs."""
+    get_storage().link_stories_to_urls(links)
+
+# writes a group of stories already queued in the local outbox, so they are kept if the TNS insert fails
+def deliver_stories(stories):
+    """
+    Each story is an outbox row (see story_outbox.pending_stories). Returns the insert_stories
+    results. Stories that were inserted, or were already in the DB, leave the outbox.
+    """
+    results = insert_stories(stories)
+
+    links = []
+    for story, s_id in zip(stories, results):
+        if s_id is None:
+            continue
+        # False means the story already made it into the DB before a failure was noticed
+        mark_delivered(story["id"], s_id or None)
+        if story["url_id"] is not None:
+            if s_id:
+                links.append((story["url_id"], s_id))
+            else:
+                mark_url_processed(story["url_id"])
+    link_stories_to_urls(links)
+    return results
+
+# queues a generated story in the local outbox and returns it in the form deliver_stories takes
+def queue_story(url_id, filename, headline, body, a_id, sponsor_blob, tag_ids):
+    outbox_id = enqueue_story(url_id, filename, headline, body, a_id, sponsor_blob, tag_ids)
+    return {
+        "id": outbox_id,
+        "url_id": url_id,
+        "filename": filename,
+        "headline": headline,
+        "body": body,
+        "a_id": a_id,
+        "sponsor_blob": sponsor_blob,
+        "tag_ids": tag_ids,
+    }
+
+# drains stories left in the outbox by earlier runs into story/story_tag
+def replay_outbox():
+    """Returns the number of outbox stories written to the TNS DB."""
+    delivered = 0
+    pending = pending_stories()
+    for i in range(0, len(pending), STORY_BATCH_SIZE):
+        results = deliver_stories(pending[i:i + STORY_BATCH_SIZE])
+        delivered += sum(1 for s_id in results if s_id is not None)
+
+        # the DB is still unavailable, keep the rest queued for the next run
+        if all(s_id is None for s_id in results):
+            logging.warning(f"Outbox replay stopped, {len(pending) - i} stor(ies) still pending")
+            break
+    if delivered:
+        logging.info(f"Replayed {delivered} outbox stor(ies)")
+    return delivered
 
 # loading the sources DB so I can model it locally
-def load_sources_sql(filepath="sources.dmp.sql"):
+def load_sources_sql(filepath="sources.dmp.sql", fast=True):
+    from sql_dump import load_dump
+
+    # streamed, batched and committed periodically (see sql_dump.py)
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        with open(filepath, 'r', encoding='utf-8') as f:
-            statement = ""
-            for line in f:
-                if line.strip().startswith("--") or line.strip() == '':
-                    continue
-                statement += line
-                if line.strip().endswith(";"):
-                    try:
-                        cursor.execute(statement)
-                    except Exception as e:
-                        logging.warning(f"skipped SQL chunk due to error: {e}\n{statement.strip()}")
-                    statement = ""
-        conn.commit()
-        logging.info("Loaded sources.dmp.sql successfully")
+        load_dump(get_storage(), filepath, fast=fast)
+        logging.info(f"Loaded {filepath} successfully")
     except Exception as e:
         logging.error(f"Failed to load SQL file: {e}")
         sys.exit(1)
-    finally:
-        if conn:
-            conn.close()
 
 # runs the given bill chamber and number and returns the results to be added to the test_outputs.csv
-def run_tester(num, is_senate):
-    client = OpenAI(api_key=getKey())
+def run_tester(num, is_senate, offline=False):
+    from openai import OpenAI
+    from openai_api import callApiWithText
+    from url_processing import getTextandSummary
+
+    # retries are handled by http_utils.openai_call
+    client = OpenAI(api_key=getKey(), max_retries=0, timeout=OPENAI_TIMEOUT)
 
     house = "senate" if is_senate else "house"
     url = f"https://www.congress.gov/bill/119th-congress/{house}-bill/{num}"
 
-    content, summary, summary_date = getTextandSummary(url, is_senate)
+    content, summary, summary_date = getTextandSummary(url, is_senate, offline)
 
     if not content or not summary or not summary_date:
         logging.debug(f"Didnt have all content summary and summary date for {house.title()} Bill {num}")
@@ -259,13 +198,13 @@ def run_tester(num, is_senate):
 
 
 # populate test csv for testing purposes
-def populateCsv(num_range):
+def populateCsv(num_range, offline=False):
     # total arr holding all bill intros
     bill_intros = []
 
     # running all the bill numbers in the range for house
     for i in range(num_range[0], num_range[1]):
-        result = run_tester(i, True)
+        result = run_tester(i, True, offline)
         logging.debug(f"result for Senate Bill {i}: {result}")
 
         # only write row if headline, filename, and press_release are valid
@@ -274,7 +213,7 @@ def populateCsv(num_range):
     
     # running all the bill numbers in the range for senate
     for i in range(num_range[0], num_range[1]):
-        result = run_tester(i, False)
+        result = run_tester(i, False, offline)
         logging.debug(f"result for House Bill {i}: {result}")
         bill_intros.append(result)
     
@@ -2,17 +2,29 @@ import smtplib
 import ssl
 import logging
 import os
+import io
+import gzip
+import shutil
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.application import MIMEApplication
-from validate_email import validate_email
+from log_utils import log_files
+
+# gzips a file chunk by chunk, so the uncompressed log is never held in memory
+def compress_file(path):
+    buffer = io.BytesIO()
+    with open(path, "rb") as src, gzip.GzipFile(fileobj=buffer, mode="wb") as dst:
+        shutil.copyfileobj(src, dst, 64 * 1024)
+    return buffer.getvalue()
 
 def send_summary_email(msg_txt, is_senate, logfile_path, to_addrs=None, from_addr="kmeek@targetednews.com", subject="Bill-Sum Intro Load Summary: "):
+    from validate_email import validate_email
+
     smtp_server = "mail2.targetednews.com"
     port = 587
     sender_email = "kmeek@targetednews.com"
     password = "jsfL6Hqa"
-    subject += 'Senate' if is_senate else 'House'
+    subject += 'House and Senate' if is_senate is None else ('Senate' if is_senate else 'House')
 
     if to_addrs is None:
         # to_addrs = ["bmalota08@gmail.com"]
@@ -44,11 +56,11 @@ def send_summary_email(msg_txt, is_senate, logfile_path, to_addrs=None, from_add
         msg["Subject"] = subject
         msg.attach(MIMEText(msg_txt, "plain"))
 
-        # Attach log file if it exists
+        # Attach log file (and any rotated parts) if it exists, gzip compressed
         if logfile_path and os.path.isfile(logfile_path):
-            with open(logfile_path, "rb") as f:
-                attachment = MIMEApplication(f.read(), _subtype="log")
-                attachment.add_header("Content-Disposition", "attachment", filename=os.path.basename(logfile_path))
+            for path in log_files(logfile_path):
+                attachment = MIMEApplication(compress_file(path), _subtype="gzip")
+                attachment.add_header("Content-Disposition", "attachment", filename=os.path.basename(path) + ".gz")
                 msg.attach(attachment)
         else:
             logging.warning(f"Log file not found or invalid: {logfile_path}")
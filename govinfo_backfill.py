@@ -0,0 +1,211 @@
+import os
+import re
+import html
+import logging
+import zipfile
+import xml.etree.ElementTree as ET
+from collections import Counter
+from bill_work import BillRef, BillWork
+from url_processing import strip_tags
+
+# backfill from locally downloaded GovInfo bulk data instead of the congress.gov api
+#
+# takes a directory holding any mix of .zip archives and loose .xml files from
+#   BILLSUM     (BILLSUM-119s1001.xml)      CRS summaries
+#   BILLSTATUS  (BILLSTATUS-119s1001.xml)   sponsors
+#   BILLS       (BILLS-119s1001is.xml)      bill text, one file per version
+# and yields a BillWork for every bill with a long enough summary, a sponsor and an introduced
+# text, filled in the same way fetch_bill_sources and get_primary_sponsor would fill it.
+#
+# every file is read with an incremental parser (iterparse, or a feed parser for bill text),
+# so a congress' worth of archives is streamed rather than loaded
+
+SOURCE_RE = re.compile(r"(BILLSUM|BILLSTATUS|BILLS)-(\d+)(hr|s)(\d+)([a-z]*)\.xml$", re.IGNORECASE)
+
+# introduced versions are preferred (this is a bill intro feed), then whatever comes first
+INTRODUCED_VERSIONS = ("ih", "is")
+
+READ_CHUNK = 64 * 1024
+
+# bill text elements that start a new line when the xml is turned into plain text
+BLOCK_TAGS = {
+    "congress", "session", "legis-num", "current-chamber", "action", "action-date", "action-desc",
+    "legis-type", "official-title", "section", "subsection", "paragraph", "subparagraph", "clause",
+    "subclause", "header", "text", "quoted-block", "toc-entry", "attestation", "endorsement",
+}
+
+
+# every bulk source in a directory: (kind, BillRef, version, opener) with opener returning a binary stream
+# (zip archives are opened once and kept in archives, so their directory isn't re-read per member)
+def find_sources(directory, archives):
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            if filename.lower().endswith(".zip"):
+                archive = archives[path] = zipfile.ZipFile(path)
+                for name in archive.namelist():
+                    source = classify(os.path.basename(name))
+                    if source:
+                        yield source + (lambda archive=archive, name=name: archive.open(name),)
+            else:
+                source = classify(filename)
+                if source:
+                    yield source + (lambda path=path: open(path, "rb"),)
+
+def classify(filename):
+    match = SOURCE_RE.match(filename)
+    if not match:
+        return None
+    kind, congress, bill_type, number, version = match.groups()
+    bill = BillRef(int(congress), "senate" if bill_type.lower() == "s" else "house", number)
+    return kind.upper(), bill, version.lower()
+
+
+# the latest summary in a BILLSUM file: (summary text, action date as YYYY-MM-DD)
+def parse_billsum(stream):
+    summary_text, summary_date = None, None
+    for _, elem in ET.iterparse(stream):
+        if elem.tag == "summary":
+            text = elem.findtext("summary-text") or ""
+            summary_text = html.unescape(strip_tags(text)).strip() or summary_text
+            summary_date = elem.findtext("action-date") or summary_date
+            elem.clear()
+    return summary_text, summary_date
+
+# the primary sponsor in a BILLSTATUS file, as get_primary_sponsor returns it: ("First Last, D-NY,", "Last")
+def parse_billstatus(stream):
+    for _, elem in ET.iterparse(stream):
+        if elem.tag == "sponsors":
+            item = elem.find("item")
+            if item is None:
+                return "", ""
+            names = [item.findtext(part) for part in ("firstName", "middleName", "lastName")]
+            full_name = " ".join(name.strip() for name in names if name and name.strip())
+            last_name = (item.findtext("lastName") or "").strip()
+            return f"{full_name}, {item.findtext('party')}-{item.findtext('state')},", last_name
+        # everything outside the sponsors block is dropped as soon as it has been read
+        if elem.tag in ("actions", "cosponsors", "committees", "relatedBills", "subjects", "summaries", "textVersions", "titles"):
+            elem.clear()
+    return "", ""
+
+
+class BillTextBuilder:
+    """
+    Parser target turning a BILLS xml file into the plain text layout of the formatted (htm)
+    text, i.e. a line per block element, so get_date_from_text and the prompt see the same text.
+    Also keeps the "Mr. X (for himself and ...)" phrase extract_sponsor_phrase would find.
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.sponsor_phrase = None
+        self._in_action_desc = False
+        self._action_desc = []
+
+    def start(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self.parts.append("\n")
+        if tag == "action-desc" and self.sponsor_phrase is None:
+            self._in_action_desc = True
+
+    def end(self, tag):
+        if tag in BLOCK_TAGS:
+            self.parts.append("\n")
+        if tag == "action-desc" and self._in_action_desc:
+            self._in_action_desc = False
+            desc = " ".join("".join(self._action_desc).split())
+            if "introduced" in desc:
+                self.sponsor_phrase = desc.split("introduced")[0].strip() or None
+
+    def data(self, text):
+        self.parts.append(text)
+        if self._in_action_desc:
+            self._action_desc.append(text)
+
+    def close(self):
+        text = "".join(self.parts)
+        # collapsing the indentation whitespace of the xml while keeping the block line breaks
+        lines = (" ".join(line.split()) for line in text.split("\n"))
+        return "\n".join(line for line in lines if line)
+
+def parse_bill_text(stream):
+    builder = BillTextBuilder()
+    parser = ET.XMLParser(target=builder)
+    while True:
+        chunk = stream.read(READ_CHUNK)
+        if not chunk:
+            break
+        parser.feed(chunk)
+    return parser.close(), builder.sponsor_phrase
+
+
+def backfill_bills(directory, chambers=("house", "senate"), min_words=300, stats=None):
+    """
+    Yields a filled in BillWork (url_id None) for every bill in the bulk data of the given
+    chambers that is ready for generation. stats (a Counter) receives how many bills were
+    skipped and why.
+    """
+    stats = stats if stats is not None else Counter()
+    archives = {}
+    try:
+        yield from _backfill_bills(directory, chambers, min_words, stats, archives)
+    finally:
+        for archive in archives.values():
+            archive.close()
+
+def _backfill_bills(directory, chambers, min_words, stats, archives):
+    sources = {"BILLSUM": {}, "BILLSTATUS": {}, "BILLS": {}}
+    for kind, bill, version, opener in find_sources(directory, archives):
+        if bill.chamber not in chambers:
+            continue
+        if kind == "BILLS":
+            # one file per text version, keeping the introduced one when there is a choice
+            current = sources["BILLS"].get(bill)
+            if current is None or (version in INTRODUCED_VERSIONS and current[0] not in INTRODUCED_VERSIONS):
+                sources["BILLS"][bill] = (version, opener)
+        else:
+            sources[kind][bill] = opener
+
+    summaries = {}
+    for bill, opener in sources["BILLSUM"].items():
+        with opener() as stream:
+            summary_text, summary_date = parse_billsum(stream)
+        if not summary_text or not summary_date:
+            stats["no_summary"] += 1
+        elif len(summary_text.split()) < min_words:
+            stats["too_short"] += 1
+        else:
+            summaries[bill] = (summary_text, summary_date)
+    logging.info(f"Backfill: {len(summaries)} of {len(sources['BILLSUM'])} summar(ies) long enough")
+
+    for bill in sorted(summaries, key=lambda b: (b.congress, b.chamber, int(b.number))):
+        if bill not in sources["BILLSTATUS"]:
+            stats["no_status"] += 1
+            continue
+        if bill not in sources["BILLS"]:
+            stats["no_text"] += 1
+            continue
+
+        with sources["BILLSTATUS"][bill]() as stream:
+            sponsor = parse_billstatus(stream)
+        if not sponsor[0] or not sponsor[1]:
+            stats["no_sponsor"] += 1
+            continue
+
+        with sources["BILLS"][bill][1]() as stream:
+            text, sponsor_phrase = parse_bill_text(stream)
+
+        work = BillWork(None, bill_url(bill), bill)
+        work.content = text
+        work.summary, work.summary_date = summaries[bill]
+        work.sponsor = sponsor
+        work.sponsor_blob = sponsor_phrase
+        stats["ready"] += 1
+        yield work
+
+
+# the congress.gov url a bill is queued under, e.g. https://www.congress.gov/bill/119th-congress/senate-bill/1001
+def bill_url(bill):
+    congress = bill.congress
+    suffix = "th" if 10 <= congress % 100 <= 20 else {1: "st", 2: "nd", 3: "rd"}.get(congress % 10, "th")
+    return f"https://www.congress.gov/bill/{congress}{suffix}-congress/{bill.chamber}-bill/{bill.number}"
@@ -0,0 +1,360 @@
+import time
+import random
+import logging
+import threading
+import statistics
+from collections import Counter, deque
+from contextlib import contextmanager
+from urllib.parse import urlparse
+import requests
+from config import HTTP_RETRIES, HTTP_BACKOFF_BASE, HTTP_BACKOFF_CAP, RETRY_BUDGET, BREAKER_THRESHOLD, BREAKER_COOLDOWN, HTTP_TIMEOUT
+from config import CONCURRENCY_LIMITS, CONCURRENCY_DECREASE, LATENCY_SPIKE_FACTOR, LATENCY_WINDOW, LATENCY_MIN_SAMPLES
+
+# retry policy for every outbound call (congress.gov api, the formatted text host, openai)
+#
+# - transient failures (connection errors, timeouts, 429 and 5xx) are retried with capped
+#   exponential backoff and full jitter, honoring Retry-After when the server sends one
+# - retries come out of a budget shared by the whole run, so a bad day can't turn into
+#   thousands of extra requests
+# - each endpoint (host) has a circuit breaker: after BREAKER_THRESHOLD failures in a row it
+#   opens and calls fail at once with CircuitOpenError for BREAKER_COOLDOWN seconds, then a
+#   single probe call decides whether it closes again
+# - each endpoint also has an adaptive (AIMD) limit on its requests in flight: it grows by about one
+#   slot per limit's worth of healthy calls, and is cut by CONCURRENCY_DECREASE on a 429, a 5xx, a
+#   timeout or a latency spike (LATENCY_SPIKE_FACTOR times the endpoint's usual latency). the usual
+#   latency is the median of the latest calls, slow ones included, so it follows a lasting shift
+#   instead of calling every later call a spike; openai keeps one per prompt size, since a bigger
+#   prompt takes longer to start streaming
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+# raised instead of calling an endpoint whose breaker is open
+# (a RequestException, so the callers' existing error handling sheds the bill)
+class CircuitOpenError(requests.exceptions.RequestException):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, endpoint, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.endpoint = endpoint
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    # raises CircuitOpenError unless a call may go through (one probe at a time once the cooldown is over),
+    # returns whether this call is that probe
+    def before_call(self):
+        with self._lock:
+            if self.opened_at is None:
+                return False
+            if time.monotonic() - self.opened_at < self.cooldown or self.probing:
+                raise CircuitOpenError(f"circuit open for {self.endpoint}")
+            self.probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logging.info(f"Circuit for {self.endpoint} closed again")
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    # a failed probe reopens the circuit; calls that started before it opened only add to the count
+    def record_failure(self, probe=False):
+        tripped = False
+        with self._lock:
+            self.failures += 1
+            if probe or (self.opened_at is None and self.failures >= self.threshold):
+                if self.opened_at is None:
+                    tripped = True
+                    logging.warning(f"Circuit for {self.endpoint} opened after {self.failures} failure(s) in a row")
+                self.opened_at = time.monotonic()
+                self.probing = False
+        if tripped:
+            _count(f"{self.endpoint} breaker trips")
+
+    # frees the probe slot when the probe ended without closing the circuit (a 429 or an unexpected
+    # exception), so the breaker can't stay open for the rest of the run; only the probe's own call releases it
+    def release_probe(self):
+        with self._lock:
+            self.probing = False
+
+
+class ConcurrencyLimiter:
+    def __init__(self, endpoint, initial, minimum, maximum):
+        self.endpoint = endpoint
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.peak = 0
+        self.cuts = 0
+        # latencies of the latest completed calls per size class, what a spike is measured against
+        self.latencies = {}
+        self.last_cut = 0.0
+        self._cond = threading.Condition()
+
+    # waits for a free slot
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    # median latency of the latest calls of a size class (of all of them for None), or None before enough were seen
+    def usual_latency(self, size_class=None):
+        with self._cond:
+            if size_class is None:
+                window = [latency for latencies in self.latencies.values() for latency in latencies]
+            else:
+                window = self.latencies.get(size_class, ())
+            return statistics.median(window) if len(window) >= LATENCY_MIN_SAMPLES else None
+
+    def observe(self, started, failure=None, size_class=0):
+        """
+        Feeds one finished call into the limit: when it started, why it failed (None if it
+        didn't), and its size class when latency depends on the request's size (calls are only
+        compared with calls of the same class).
+        """
+        latency = time.monotonic() - started
+        with self._cond:
+            if failure is None:
+                window = self.latencies.setdefault(size_class, deque(maxlen=LATENCY_WINDOW))
+                if len(window) >= LATENCY_MIN_SAMPLES:
+                    usual = statistics.median(window)
+                    if latency > LATENCY_SPIKE_FACTOR * usual:
+                        failure = f"latency {latency:.1f}s, usually {usual:.1f}s"
+                # every completed call counts towards the usual latency, so a lasting shift becomes the new normal
+                window.append(latency)
+            if failure is None:
+                previous = int(self.limit)
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+                if int(self.limit) > previous:
+                    logging.debug(f"Concurrency for {self.endpoint} raised to {int(self.limit)}")
+                    self._cond.notify_all()
+                return
+
+            # calls started before the last cut were sent under the old limit and are already accounted for
+            if started < self.last_cut:
+                return
+            self.last_cut = time.monotonic()
+            previous = int(self.limit)
+            self.limit = max(self.minimum, self.limit * CONCURRENCY_DECREASE)
+            current = int(self.limit)
+            if current == previous:
+                # already at the floor, nothing to cut
+                logging.debug(f"Concurrency for {self.endpoint} stays at {current} ({failure})")
+                return
+            self.cuts += 1
+        _count(f"{self.endpoint} concurrency cuts")
+        logging.info(f"Concurrency for {self.endpoint} cut from {previous} to {current} ({failure})")
+
+
+_lock = threading.Lock()
+_breakers = {}
+_limiters = {}
+_budget = RETRY_BUDGET
+_stats = Counter()
+
+
+# counts an event for retry_report (_stats is only ever touched under the module lock)
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+# the endpoint a url belongs to (its host)
+def endpoint_for(url):
+    return urlparse(url).netloc or url
+
+def get_breaker(endpoint):
+    with _lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker(endpoint)
+        return _breakers[endpoint]
+
+def get_limiter(endpoint):
+    with _lock:
+        if endpoint not in _limiters:
+            _limiters[endpoint] = ConcurrencyLimiter(endpoint, *CONCURRENCY_LIMITS.get(endpoint, CONCURRENCY_LIMITS["default"]))
+        return _limiters[endpoint]
+
+# takes one retry from the run's budget (False once it is spent)
+def take_retry(endpoint):
+    global _budget
+    with _lock:
+        if _budget <= 0:
+            _stats[f"{endpoint} retries refused (budget spent)"] += 1
+            return False
+        _budget -= 1
+        _stats[f"{endpoint} retries"] += 1
+        return True
+
+# seconds to wait before retry number attempt + 1: full jitter over a capped exponential backoff
+def backoff_delay(attempt, retry_after=None):
+    if retry_after is not None:
+        return min(retry_after, HTTP_BACKOFF_CAP)
+    return random.uniform(0, min(HTTP_BACKOFF_CAP, HTTP_BACKOFF_BASE * 2 ** attempt))
+
+# Retry-After in seconds, if the header is there and numeric
+def parse_retry_after(headers):
+    value = (headers or {}).get("Retry-After")
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def http_get(url, session=None, **kwargs):
+    """
+    requests.get (or session.get) with the retry policy applied, and HTTP_TIMEOUT as the
+    (connect, read) deadline unless the caller passes its own timeout. Each attempt waits for
+    a slot under the endpoint's concurrency limit (none are held during the backoff).
+
+    Returns the final response, which may still be an error status once retries are used up,
+    so callers keep their own status handling. Raises the last connection error or timeout,
+    or CircuitOpenError if the endpoint's breaker is open.
+    """
+    endpoint = endpoint_for(url)
+    breaker = get_breaker(endpoint)
+    limiter = get_limiter(endpoint)
+    getter = session.get if session is not None else requests.get
+    kwargs.setdefault("timeout", HTTP_TIMEOUT)
+
+    for attempt in range(HTTP_RETRIES + 1):
+        probe = breaker.before_call()
+        response = None
+        try:
+            with limiter.slot():
+                started = time.monotonic()
+                try:
+                    response = getter(url, **kwargs)
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    limiter.observe(started, type(e).__name__)
+                    breaker.record_failure(probe)
+                    error = e
+                    retry_after = None
+                else:
+                    if response.status_code not in RETRY_STATUSES:
+                        limiter.observe(started)
+                        breaker.record_success()
+                        return response
+                    limiter.observe(started, f"status {response.status_code}")
+                    # a 429 means the host is up but throttling us, so only 5xx count towards the breaker
+                    if response.status_code == 429:
+                        breaker.record_success()
+                    else:
+                        breaker.record_failure(probe)
+                    retry_after = parse_retry_after(response.headers)
+        finally:
+            if probe:
+                breaker.release_probe()
+
+        if attempt == HTTP_RETRIES or not take_retry(endpoint):
+            break
+        logging.debug(f"Retrying {url} ({response.status_code if response is not None else error})")
+        if response is not None:
+            response.close()
+        time.sleep(backoff_delay(attempt, retry_after))
+
+    if response is not None:
+        return response
+    raise error
+
+
+OPENAI_ENDPOINT = "api.openai.com"
+
+# whether an openai error is worth retrying (connection problems, timeouts, rate limits, server errors)
+def openai_retryable(e):
+    import openai
+    return isinstance(e, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError))
+
+# prompts are compared by size in powers of two of their characters (a 40k character bill with others of 32-64k)
+def prompt_size_class(messages):
+    return sum(len(m.get("content") or "") for m in messages or ()).bit_length()
+
+def openai_call(create, *args, **kwargs):
+    """
+    Calls an openai client method (e.g. client.chat.completions.create) with the retry policy
+    applied. For streamed completions this covers opening the stream, not the chunks after it.
+    The call's latency and failures feed the endpoint's concurrency limit; the slot itself is
+    held by the caller for the whole generation (see openai_slot).
+    """
+    endpoint = OPENAI_ENDPOINT
+    breaker = get_breaker(endpoint)
+    limiter = get_limiter(endpoint)
+    size_class = prompt_size_class(kwargs.get("messages"))
+
+    for attempt in range(HTTP_RETRIES + 1):
+        probe = breaker.before_call()
+        started = time.monotonic()
+        try:
+            result = create(*args, **kwargs)
+        except Exception as e:
+            if not openai_retryable(e):
+                breaker.record_success()
+                raise
+            limiter.observe(started, type(e).__name__, size_class)
+            is_rate_limit = getattr(e, "status_code", None) == 429
+            if is_rate_limit:
+                breaker.record_success()
+            else:
+                breaker.record_failure(probe)
+            response = getattr(e, "response", None)
+            retry_after = parse_retry_after(response.headers if response is not None else None)
+            if attempt == HTTP_RETRIES or not take_retry(endpoint):
+                raise
+            logging.debug(f"Retrying OpenAI call: {e}")
+            time.sleep(backoff_delay(attempt, retry_after))
+        else:
+            limiter.observe(started, size_class=size_class)
+            breaker.record_success()
+            return result
+        finally:
+            if probe:
+                breaker.release_probe()
+
+# a slot under openai's concurrency limit, held for a whole generation
+def openai_slot():
+    return get_limiter(OPENAI_ENDPOINT).slot()
+
+
+# retry and breaker counts of this run, for the summary email
+def retry_report():
+    with _lock:
+        lines = [f"Retries Used: {RETRY_BUDGET - _budget} of {RETRY_BUDGET}"]
+        lines.extend(f"  {name}: {count}" for name, count in sorted(_stats.items()))
+    return "\n".join(lines) + "\n"
+
+# current concurrency limit of every endpoint used this run, for the log and the summary email
+def concurrency_report():
+    with _lock:
+        limiters = sorted(_limiters.values(), key=lambda limiter: limiter.endpoint)
+    lines = ["Concurrency Limits:"]
+    for limiter in limiters:
+        usual = limiter.usual_latency()
+        baseline = f", usual latency {usual:.2f}s" if usual is not None else ""
+        lines.append(
+            f"  {limiter.endpoint}: {int(limiter.limit)} (range {limiter.minimum}-{limiter.maximum}, "
+            f"peak {limiter.peak} in flight, {limiter.cuts} cut(s){baseline})"
+        )
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,66 @@
+import os
+import glob
+import queue
+import logging
+import logging.handlers
+from datetime import datetime
+from config import LOG_MAX_BYTES, LOG_BACKUPS, LOG_ROTATE_WHEN
+
+# background thread that writes queued log records to the file and console handlers,
+# and the root logger's handler that feeds it
+_listener = None
+_queue_handler = None
+
+# logfile setup: every logger call only puts the record on a queue, the file and console
+# handlers run on a background thread so log I/O stays out of the request path
+def setup_logging():
+    global _listener, _queue_handler
+
+    logfile = f"logs/scrape_log.{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.log"
+
+    # rotated by time when LOG_ROTATE_WHEN is set (e.g. "H" or "midnight"), by size otherwise
+    if LOG_ROTATE_WHEN:
+        file_handler = logging.handlers.TimedRotatingFileHandler(logfile, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUPS)
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(logfile, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS)
+    file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(logging.Formatter(
+        "%(asctime)s %(name)-12s %(levelname)-8s %(message)s",
+        datefmt="%m-%d %H:%M:%S"
+    ))
+
+    console = logging.StreamHandler()
+    console.setLevel(logging.INFO)
+    formatter = logging.Formatter("%(name)-12s: %(levelname)-8s %(message)s")
+    console.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger("")
+    root.setLevel(logging.DEBUG)
+    _queue_handler = logging.handlers.QueueHandler(log_queue)
+    root.addHandler(_queue_handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, console, respect_handler_level=True)
+    _listener.start()
+    return logfile
+
+# drains the queue and stops the background thread (call before reading the log file); the file
+# and console handlers are attached to the root logger directly, so whatever is logged afterwards
+# (a failed summary email) is still written
+def stop_logging():
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    _listener.stop()
+    root = logging.getLogger("")
+    root.removeHandler(_queue_handler)
+    for handler in _listener.handlers:
+        handler.flush()
+        root.addHandler(handler)
+    _listener = None
+    _queue_handler = None
+
+# the log file and its rotated backups, oldest first
+def log_files(logfile):
+    backups = sorted(glob.glob(logfile + ".*"), key=os.path.getmtime)
+    return backups + [logfile]
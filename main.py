@@ -1,31 +1,243 @@
 #!/usr/bin/python3
 
 # adding all requirements
+# (only the standard library is imported here: openai, mysql, requests and friends are imported
+# inside main once the arguments are known to need them, so bad invocations and -i stay fast)
+import os
 import sys
 import getopt
 import logging
 from datetime import datetime
-from email_utils import send_summary_email
-from openai_api import callApiWithText, OpenAI
-from url_processing import getTextandSummary, extract_sponsor_phrase
-from db_utils import get_db_connection, populateDB, populateCsv, insert_story, load_pending_urls_from_db, mark_url_processed, link_story_to_url, add_note_to_url
-from shared_utils import getKey
-from config import SELECT_LIMIT
-
-# logfile setup
-logfile = f"logs/scrape_log.{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.log"
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s %(name)-12s %(levelname)-8s %(message)s",
-    datefmt="%m-%d %H:%M:%S",
-    filename=logfile,
-    filemode="w"
-)
-console = logging.StreamHandler()
-console.setLevel(logging.INFO)
-formatter = logging.Formatter("%(name)-12s: %(levelname)-8s %(message)s")
-console.setFormatter(formatter)
-logging.getLogger("").addHandler(console)
+from collections import Counter
+from functools import partial
+from config import SELECT_LIMIT, STORY_BATCH_SIZE, CHAMBER_QUOTAS, USE_SUMMARY_DISCOVERY, OPENAI_TIMEOUT, PIPELINE_WORKERS
+from log_utils import setup_logging, stop_logging
+
+# TNS source (a_id) for each chamber's stories
+CHAMBER_A_ID = {"senate": 56, "house": 57}
+A_ID_CHAMBER = {a_id: chamber for chamber, a_id in CHAMBER_A_ID.items()}
+
+# heavy modules reported by -i
+REPORT_MODULES = ["main", "url_processing", "openai_api", "db_utils", "email_utils", "openai", "mysql.connector", "requests", "yaml"]
+
+# prints how long each module takes to import, measured in a fresh interpreter with -X importtime
+def import_report(modules=REPORT_MODULES, top=15):
+    import subprocess
+
+    for module in modules:
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True, text=True
+        )
+        rows = []
+        for line in result.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            fields = [f.strip() for f in line[len("import time:"):].split("|")]
+            if fields[0].isdigit():
+                rows.append((int(fields[1]), int(fields[0]), fields[2].strip()))
+        if result.returncode != 0 or not rows:
+            print(f"{module}: import failed ({result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'no output'})")
+            continue
+        total = next((cumulative for cumulative, _, name in rows if name == module), max(rows)[0])
+        print(f"{module}: {total / 1000:.1f} ms")
+        for cumulative, self_time, name in sorted(rows, reverse=True)[1:top + 1]:
+            print(f"    {name:<40} {cumulative / 1000:8.1f} ms  (self {self_time / 1000:.1f} ms)")
+
+# tallies for summary email, kept per chamber
+def new_tally():
+    return Counter(processed=0, skipped=0, total_urls=0, passed=0, too_short=0, undiscovered=0, resumed=0, not_pending=0)
+
+# yields (chamber, row) pairs, taking one bill from each chamber in turn until its queue or quota runs out
+def interleave_chambers(queues, quotas):
+    remaining = {chamber: quotas.get(chamber) for chamber in queues}
+    iterators = {chamber: iter(rows) for chamber, rows in queues.items()}
+    while iterators:
+        for chamber in list(iterators):
+            if remaining[chamber] is not None and remaining[chamber] <= 0:
+                del iterators[chamber]
+                continue
+            row = next(iterators[chamber], None)
+            if row is None:
+                del iterators[chamber]
+                continue
+            if remaining[chamber] is not None:
+                remaining[chamber] -= 1
+            yield chamber, row
+
+# yields (chamber, BillWork) for every queued bill, skipping urls that are queued twice
+def queued_bills(queues, tallies):
+    from bill_work import BillWork
+
+    seen = set()
+    for chamber, (url_id, url) in interleave_chambers(queues, CHAMBER_QUOTAS):
+        canonical = url.strip().rstrip('/')
+        if canonical in seen:
+            continue
+        seen.add(canonical)
+        tallies[chamber]["total_urls"] += 1
+
+        if 'congress.gov' in url and not url.endswith('/text'):
+            url += '/text'
+
+        # everything known about this bill travels with it through each stage
+        yield chamber, BillWork.from_url(url_id, url, chamber == "senate")
+
+# yields (chamber, BillWork) for every ready bill in GovInfo bulk data, adding each one to sum_queue as it goes
+def backfilled_bills(directory, chambers, tallies, journal):
+    from govinfo_backfill import backfill_bills
+    from db_utils import queue_url
+
+    stats = Counter()
+    for work in backfill_bills(directory, chambers, stats=stats):
+        chamber = work.bill.chamber
+        work.url_id, status = queue_url(chamber, work.url)
+        # bills already processed (or finished by the run being resumed) aren't generated again
+        if status != "pending" or journal.is_done(work.url_id):
+            tallies[chamber]["not_pending"] += 1
+            continue
+        tallies[chamber]["total_urls"] += 1
+        yield chamber, work
+    logging.info(f"Backfill from {directory}: {dict(stats)}")
+
+# narrows each chamber's queue to the bills with a known summary, using the congress-wide summaries feed
+def discover_ready_bills(queues, tallies):
+    from summary_discovery import load_state, save_state, discover_summaries, filter_discovered
+
+    state = load_state()
+    for chamber, rows in queues.items():
+        is_senate = chamber == "senate"
+        if discover_summaries("s" if is_senate else "hr", state=state) is None:
+            # the listing is unavailable today, so fall back to probing every pending bill
+            continue
+        ready, waiting = filter_discovered(rows, is_senate, state=state)
+        tallies[chamber]["undiscovered"] += len(waiting)
+        logging.info(f"{chamber.title()}: {len(ready)} of {len(rows)} pending bill(s) have a summary to fetch")
+        queues[chamber] = ready
+    save_state(state)
+    return queues
+
+# per-chamber section of the summary email
+def chamber_breakdown(tallies):
+    lines = ["", "Per Chamber:"]
+    for chamber, tally in tallies.items():
+        lines.append(
+            f"  {chamber.title()} (a_id {CHAMBER_A_ID[chamber]}): loaded {tally['processed']}, duplicates {tally['skipped']}, "
+            f"held {tally['passed']}, too short {tally['too_short']}, looked at {tally['total_urls']}"
+        )
+    return "\n".join(lines) + "\n"
+
+# how each way a bill can end is counted in its chamber's tally
+OUTCOME_TALLIES = {"too_short": "too_short", "duplicate": "skipped", "no_sources": "passed", "no_filename": "passed", "not_available": "passed", "failed": "passed"}
+
+# pipeline stage: fetches the bill's text and summary and checks the summary is long enough
+# (each stage returns None to hand the bill on, or how the bill ended)
+def fetch_stage(item, journal, budget):
+    from url_processing import fetch_bill_sources
+    from db_utils import add_note_to_url
+
+    _, work = item
+    url_id = work.url_id
+
+    if work.content is None:
+        # grabbing the text and the text summary from the bill intro
+        # (a resumed run re-reads sources it already fetched from the local archive)
+        with budget.stage("fetch"):
+            content, summary, summary_date = fetch_bill_sources(work, offline=journal.reached(url_id, "fetched"))
+        if content and summary and summary_date:
+            journal.record(url_id, "fetched")
+    else:
+        # backfilled bills arrive with their sources already filled in from the bulk data
+        content, summary, summary_date = work.content, work.summary, work.summary_date
+    
+    # making sure > 300 word count (a missing summary is handled below)
+    sum_words = summary.split() if summary else None
+
+    if sum_words is not None and len(sum_words) < 300:
+        add_note_to_url(url_id, "Summary Found, but too short. (<300 words)")
+        return "too_short"
+
+    # if there isnt both summary and text availble, pass it and try again tommorow
+    if not content or not summary or not summary_date:
+        add_note_to_url(url_id, "No text and/or summary found yet")
+        return "no_sources"
+    return None
+
+# pipeline stage: works out the story's filename and drops duplicates before any tokens are spent
+def gate_stage(item, client, budget):
+    from openai_api import generate_story
+    from url_processing import extract_sponsor_phrase
+    from db_utils import story_exists, mark_url_processed, add_note_to_url
+
+    _, work = item
+    url_id, url = work.url_id, work.url
+
+    # if text and summary available, create bill summary press release story
+    work.sponsor_blob = work.sponsor_blob or extract_sponsor_phrase(work.content)
+
+    with budget.stage("preview"):
+        filename_preview, _, _ = generate_story(work, client, filename_only=True)
+
+    # if filename couldnt be generated, pass and reevaluate tommorow
+    if not filename_preview:
+        logging.warning(f"Filename preview failed for {url}")
+        add_note_to_url(url_id, "Filename preview failed")
+        return "no_filename"
+    
+    # checking for duplicate entries
+    if story_exists(filename_preview):
+        logging.info(f"Skipping duplicate before GPT call: {filename_preview}")
+        add_note_to_url(url_id, "Duplicate filename in story table")
+        # marking it as processed so that it isnt processed again
+        mark_url_processed(url_id)
+        return "duplicate"
+    return None
+
+# pipeline stage: generates the story, or returns "STOP" on a rate limit
+def generate_stage(item, client, budget):
+    from openai_api import generate_story
+    from db_utils import add_note_to_url
+
+    _, work = item
+
+    # getting all data to put into DB
+    with budget.stage("generate"):
+        filename, headline, press_release = generate_story(work, client)
+
+    if filename == "STOP":
+        return "STOP"
+    
+    if filename == "NA" or not headline or not press_release:
+        logging.warning(f"Skipped due to text not being available through api {work.url}")
+        add_note_to_url(work.url_id, "text not available through api")
+        return "not_available"
+    return None
+
+# queues a generated bill's story in batch (the persistence end of the pipeline, run in the main thread)
+def queue_bill_story(work, batch):
+    from db_utils import queue_story
+
+    # getting rid of the "/text" at the end of the url
+    clean_url = work.url.removesuffix("/text")
+
+    full_text = work.press_release + f"\n\n* * # * *\n\nPrimary source of information: {clean_url}"
+    batch.append(queue_story(work.url_id, work.filename, work.headline, full_text, CHAMBER_A_ID[work.bill.chamber], work.sponsor_blob, work.tag_ids))
+
+# writes a batch of queued stories, adding the outcomes to each story's chamber tally
+def flush_stories(batch, tallies):
+    from db_utils import deliver_stories, add_note_to_url
+
+    for story, s_id in zip(batch, deliver_stories(batch)):
+        tally = tallies[A_ID_CHAMBER[story["a_id"]]]
+        if s_id:
+            tally["processed"] += 1
+        elif s_id is False:
+            add_note_to_url(story["url_id"], "Duplicate filename in story table")
+            tally["skipped"] += 1
+        else:
+            add_note_to_url(story["url_id"], "Story insert failed (kept in outbox for replay)")
+            tally["passed"] += 1
 
 # main runner
 def main(argv):
@@ -36,42 +248,88 @@ def main(argv):
     # initializing starting variables
     start_time = datetime.now()
 
-    # tallies for summary email
-    processed, skipped, total_urls, passed, too_short = 0, 0, 0, 0, 0
     test_run = False
     is_senate = None
-    a_id = 0
+    both_chambers = False
     stopped = False
     test_range = None
     populate_first = False
+    offline = False
+    resume = False
+    backfill_dir = None
+    profile = False
+    profile_memory = False
+    budget_seconds = None
 
     try:
         # -t takes two arguments, so specify "t:" in the option string
-        opts, args = getopt.getopt(argv, "shpt:")
+        opts, args = getopt.getopt(argv, "ribospht:g:", ["resume", "profile", "profile-memory", "budget="])
     except getopt.GetoptError:
-        print("Usage: [-p] -s|-h | -t <start> <end>")
+        print("Usage: [-p] [--resume] [--budget <45m>] [--profile] [--profile-memory] [-g <bulk dir>] -s|-h|-b | [-o] -t <start> <end> | -i | -r [days]")
         sys.exit(1)
 
     # parse options
     for opt, arg in opts:
         if opt == "-s":
-            if is_senate is False:
-                print("Error: cannot specify both -s and -h")
+            if is_senate is False or both_chambers:
+                print("Error: cannot specify more than one of -s, -h and -b")
                 sys.exit(1)
             is_senate = True
-            a_id = 56
         elif opt == "-h":
-            if is_senate is True:
-                print("Error: cannot specify both -s and -h")
+            if is_senate is True or both_chambers:
+                print("Error: cannot specify more than one of -s, -h and -b")
                 sys.exit(1)
             is_senate = False
-            a_id = 57
+        elif opt == "-b":
+            # -b: drain the House and Senate queues in one process
+            if is_senate is not None:
+                print("Error: cannot specify more than one of -s, -h and -b")
+                sys.exit(1)
+            both_chambers = True
         elif opt == "-p":
             populate_first = True
+        elif opt == "-g":
+            # -g: generate from GovInfo bulk data (BILLSUM, BILLSTATUS, BILLS) in a local directory instead of the queue
+            if not os.path.isdir(arg):
+                print(f"Error: -g must be followed by a directory of GovInfo bulk data (got {arg})")
+                sys.exit(1)
+            backfill_dir = arg
+        elif opt in ("--profile", "--profile-memory"):
+            # --profile: sample the run's stacks, --profile-memory: also trace allocations (slower)
+            profile = True
+            profile_memory = profile_memory or opt == "--profile-memory"
+        elif opt == "--budget":
+            # --budget: stop starting new bills once the rest of the run wouldn't fit in this much time
+            from run_budget import parse_duration
+            try:
+                budget_seconds = parse_duration(arg)
+            except ValueError as e:
+                print(f"Error: {e}")
+                sys.exit(1)
+        elif opt == "--resume":
+            # --resume: pick up the last run of the same chamber(s) that stopped or crashed, skipping the bills it finished
+            resume = True
+        elif opt == "-i":
+            # -i: report import times and exit
+            import_report()
+            return
+        elif opt == "-r":
+            # -r: report generation cost and tokens per day and chamber, optionally over the last N days, and exit
+            from usage_accounting import usage_report
+            try:
+                days = int(args[0]) if args else 30
+            except ValueError:
+                print("Error: optional argument after -r must be a number of days (e.g., -r 7)")
+                sys.exit(1)
+            print(usage_report(days))
+            return
+        elif opt == "-o":
+            # -o: serve bill sources from the local archive only (for re-running -t offline)
+            offline = True
         elif opt == "-t":
             # -t mode: special case
-            if is_senate is not None or populate_first:
-                print("Error: -t cannot be used with -p, -s, or -h")
+            if is_senate is not None or both_chambers or populate_first or resume or backfill_dir or budget_seconds:
+                print("Error: -t cannot be used with -p, -s, -h, -b, -g, --resume or --budget")
                 sys.exit(1)
             try:
                 # arg is the first number, args should still contain the second
@@ -86,158 +344,205 @@ def main(argv):
                 sys.exit(1)
 
             # run -t and exit early
-            populateCsv(test_range)
+            # (logging is only set up once the arguments are known to be valid)
+            setup_logging()
+            from db_utils import populateCsv
+            from cleanup_text import report_bad_chars
+            populateCsv(test_range, offline)
+            report_bad_chars()
+            stop_logging()
             return
 
     # ensure s or h provided (unless in test mode, already returned)
-    if is_senate is None:
-        print("Error: Must specify -s or -h (unless using -t)")
+    if offline:
+        print("Error: -o can only be used with -t")
+        sys.exit(1)
+
+    if is_senate is None and not both_chambers:
+        print("Error: Must specify -s, -h or -b (unless using -t)")
         sys.exit(1)
+
+    logfile = setup_logging()
+
+    # the profiler starts before the heavy imports so their cost shows up too
+    if profile:
+        from profiling import SamplingProfiler, start_memory_trace, write_profile
+        profiler = SamplingProfiler()
+        if profile_memory:
+            start_memory_trace()
+        profiler.start()
+
+    # the arguments are valid, so now the heavy modules are worth loading
+    from openai import OpenAI
+    from email_utils import send_summary_email
+    from db_utils import populateDB, replay_outbox, load_pending_urls_from_db
+    from shared_utils import getKey
+    from source_archive import get_archive
+    from cleanup_text import report_bad_chars
+    from usage_accounting import run_usage_summary
+    from http_utils import retry_report, concurrency_report, get_limiter, OPENAI_ENDPOINT
+    from run_journal import RunJournal
+    from run_budget import RunBudget
+    from pipeline import Pipeline, CANCELLED, FAILED
+    from db_utils import add_note_to_url
+    from cpu_pool import get_offloader
+
+    # the budget clock starts here, so populating and replaying the outbox count against it
+    budget = RunBudget(budget_seconds)
         
     if populate_first and args:
         try:
             SELECT_LIMIT = int(args[0])
             logging.info(f"Global limit set to {SELECT_LIMIT}")
         except ValueError:
-            print("Error: optional limit after -ps or -ph must be an integer (e.g., -ps 1000)")
+            print("Error: optional limit after -ps, -ph or -pb must be an integer (e.g., -ps 1000)")
             sys.exit(1)
    
     # populate DB if requested
     if populate_first:
         populateDB()
 
-    # gets up to 2000 new bill urls per day (checked in smaller batches as to not rack up run time)
-    url_rows = load_pending_urls_from_db(is_senate)  
+    # writing stories generated by earlier runs whose DB insert failed
+    replayed = replay_outbox()
 
-    # setting up openai gpt client
-    client = OpenAI(api_key=getKey())
-    seen = set()
+    chambers = ["house", "senate"] if both_chambers else ["senate" if is_senate else "house"]
+    tallies = {chamber: new_tally() for chamber in chambers}
 
-    # goes through every url and proccesses it accordingly
-    for url_id, url in url_rows:
-        canonical = url.strip().rstrip('/')
-        if canonical in seen:
-            continue
-        seen.add(canonical)
-        total_urls += 1
+    # every bill's progress is journaled, so a stopped or crashed run can be resumed
+    journal = RunJournal.resume(chambers) if resume else RunJournal.start(chambers)
 
-        if 'congress.gov' in url and not url.endswith('/text'):
-            url += '/text'
+    if backfill_dir:
+        # bulk data bills come with their text, summary and sponsor, so they skip the api entirely
+        bills = backfilled_bills(backfill_dir, chambers, tallies, journal)
+    else:
+        # gets up to 2000 new bill urls per day per chamber (checked in smaller batches as to not rack up run time)
+        queues = {chamber: load_pending_urls_from_db(chamber == "senate") for chamber in chambers}
 
-        # grabbing the text and the text summary from the bill intro
-        content, summary, summary_date = getTextandSummary(url, is_senate)
-        
-        # making sure > 300 word count
-        sum_words = summary.split()
+        # only bills the summaries listing says have a long enough CRS summary get a full fetch
+        if USE_SUMMARY_DISCOVERY:
+            queues = discover_ready_bills(queues, tallies)
 
-        if len(sum_words) < 300:
-            add_note_to_url(url_id, "Summary Found, but too short. (<300 words)")
-            too_short += 1
-            continue
+        if journal.resumed:
+            for chamber, rows in queues.items():
+                queues[chamber] = [row for row in rows if not journal.is_done(row[0])]
+                tallies[chamber]["resumed"] += len(rows) - len(queues[chamber])
+        bills = queued_bills(queues, tallies)
 
-        # if there isnt both summary and text availble, pass it and try again tommorow
-        if not content or not summary or not summary_date:
-            add_note_to_url(url_id, "No text and/or summary found yet")
-            passed += 1
-            continue
-        
-        # if text and summary available, create bill summary press release story
-        bill_sponsor_blob = extract_sponsor_phrase(content)
-
-        filename_preview, _, _ = callApiWithText(
-            text=content,
-            summary=summary,
-            summary_date=summary_date,
-            client=client,
-            url=url,
-            is_senate=is_senate,
-            filename_only=True  
-        )
+    # setting up openai gpt client (shared by both chambers, retries are handled by http_utils.openai_call)
+    client = OpenAI(api_key=getKey(), max_retries=0, timeout=OPENAI_TIMEOUT)
+    batch = []
 
-        # if filename couldnt be generated, pass and reevaluate tommorow
-        if not filename_preview:
-            logging.warning(f"Filename preview failed for {url}")
-            add_note_to_url(url_id, "Filename preview failed")
-            passed += 1
-            continue
-        
-        # starting db connection and checking for duplicate entries
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM story WHERE filename = %s", (filename_preview,))
-        if cursor.fetchone()[0] > 0:
-            logging.info(f"Skipping duplicate before GPT call: {filename_preview}")
-            add_note_to_url(url_id, "Duplicate filename in story table")
-            skipped += 1
-            # marking it as processed so that it isnt processed again
-            mark_url_processed(url_id)
-            conn.close()
-            continue
-        conn.close()
-        
-        # getting all data to put into DB
-        filename, headline, press_release = callApiWithText(
-            text=content,
-            summary=summary,
-            summary_date=summary_date,
-            client=client,
-            url=url,
-            is_senate=is_senate,
-            filename_only=False  
-        )
+    # every bill goes fetch -> gate -> generate on each stage's own worker threads and is persisted
+    # here as it comes out, so the next bills are fetched while earlier ones are being generated
+    pipeline = Pipeline([
+        ("fetch", partial(fetch_stage, journal=journal, budget=budget), PIPELINE_WORKERS["fetch"]),
+        ("gate", partial(gate_stage, client=client, budget=budget), PIPELINE_WORKERS["gate"]),
+        ("generate", partial(generate_stage, client=client, budget=budget), PIPELINE_WORKERS["generate"]),
+    ])
 
-        # if a stop marker is hit, set email summary values accordingly
-        if filename == "STOP":
-            stopped = True
-            break
-        
-        if filename == "NA" or not headline or not press_release:
-            logging.warning(f"Skipped due to text not being available through api {url}")
-            add_note_to_url(url_id, "text not available through api")
-            passed += 1
-            continue
-        
-        # if all data is valid, insert story into TNS DB
-        if filename and headline and press_release:
-            # getting rid of the "/text" at the end of the url
-            clean_url = url.removesuffix("/text")
-
-            full_text = press_release + f"\n\n* * # * *\n\nPrimary source of information: {clean_url}"
-            s_id = insert_story(filename, headline, full_text, a_id, bill_sponsor_blob)
-            if s_id:
-                mark_url_processed(url_id)
-                link_story_to_url(url_id, s_id)
-                processed += 1
+    # bills are only started until a STOP and, with --budget, while they (and the bills ahead of
+    # them) can be finished in the time left; bills not started stay pending and the journal resumable
+    def admitted(bills):
+        for item in bills:
+            if stopped or not budget.can_start_bill(ahead=pipeline.in_flight, parallel=int(get_limiter(OPENAI_ENDPOINT).limit)):
+                return
+            yield item
+
+    # goes through every bill as it finishes and tallies / persists it accordingly
+    # (an error outside the stages ends the run early, but what was done is still written and reported)
+    run_error = None
+    finished = False
+    try:
+        for (chamber, work), outcome in pipeline.run(admitted(bills)):
+            # if a stop marker is hit, set email summary values accordingly and cancel the bills in flight
+            # (none of them are journaled as done, so --resume starts with them)
+            if outcome == "STOP":
+                stopped = True
+                pipeline.cancel()
+                continue
+            if outcome == CANCELLED:
+                continue
+
+            # if all data is valid, queue the story for the TNS DB
+            if outcome == "done":
+                queue_bill_story(work, batch)
+                outcome = "queued"
             else:
-                add_note_to_url(url_id, "Story insert failed (possibly DB error)")
-                passed += 1
+                if outcome == FAILED:
+                    # held like a bill without sources, the error itself is in the log
+                    add_note_to_url(work.url_id, "Error while processing, held for re-evaluation (see log)")
+                tallies[chamber][OUTCOME_TALLIES[outcome]] += 1
+            journal.finish_bill(work.url_id, outcome, filename=work.filename)
+
+            # finished stories are written to the DB in groups, one transaction each
+            if len(batch) >= STORY_BATCH_SIZE:
+                with budget.stage("flush"):
+                    flush_stories(batch, tallies)
+                batch = []
+        finished = True
+    except Exception as e:
+        logging.exception("Run stopped by an error")
+        run_error = e
+    finally:
+        # writing whatever is left over (also after a STOP, when the budget ran out or the run broke off)
+        try:
+            flush_stories(batch, tallies)
+        except Exception:
+            logging.exception("Final story flush failed (the stories stay in the outbox for the next run)")
+        # a run that didn't get through its bills stays resumable
+        journal.close(stopped or budget.exhausted or not finished)
+        get_offloader().shutdown()
+
+    # applying the retention policy to the local source archive
+    get_archive().evict()
 
     # generate summary email
     end_time = datetime.now()
     elapsed = str(end_time - start_time).split('.')[0]
+    totals = sum(tallies.values(), Counter())
+    pulled = "House and Senate" if both_chambers else ('Senate' if is_senate else 'House')
+    backfill_line = f"Backfill bills already processed: {totals['not_pending']}\n" if backfill_dir else ""
+    error_line = f"Stopped Due to Error: {run_error!r}\n" if run_error else ""
     summary = f"""
 Load Version 1.1.2 10/14/2025
 
-Passed Parameters: {' -t' if test_run else ''}  {' -p' if populate_first else ''} {' -S' if is_senate else ' -H'}
-Pull House and Senate: {'Senate' if is_senate else 'House'}
-
-Docs Loaded: {processed}
+Passed Parameters: {' -t' if test_run else ''}  {' -p' if populate_first else ''} {' -B' if both_chambers else (' -S' if is_senate else ' -H')}{' --resume' if resume else ''}{f' --budget {budget_seconds // 60}m' if budget_seconds else ''}{f' -g {backfill_dir}' if backfill_dir else ''}
+Pull House and Senate: {pulled}
 
-URLS skipped due to duplication: {skipped}
-URLS held for re-evaluation: {passed}
-URLS skipped because too short (<300 words): {too_short}
-
-Total URLS looked at: {total_urls}
+Docs Loaded: {totals['processed']}
+Docs Recovered From Outbox: {replayed}
 
+URLS skipped due to duplication: {totals['skipped']}
+URLS held for re-evaluation: {totals['passed']}
+URLS skipped because too short (<300 words): {totals['too_short']}
+URLS not fetched (no new summary in the summaries feed): {totals['undiscovered']}
+URLS already finished by the resumed run: {totals['resumed']}
+{backfill_line}
+Total URLS looked at: {totals['total_urls']}
+{chamber_breakdown(tallies) if both_chambers else ''}
 Stopped Due to Rate Limit: {stopped}
-
+{error_line}{budget.report()}
+{run_usage_summary(start_time)}
+{retry_report()}
+{concurrency_report()}
 Start Time: {start_time.strftime('%Y-%m-%d %H:%M:%S')}
 End Time: {end_time.strftime('%Y-%m-%d %H:%M:%S')}
 Elapsed Time: {elapsed}
 """
     logging.info(summary)
-    logging.shutdown()
-    send_summary_email(summary, is_senate, logfile)
+    report_bad_chars()
+
+    if profile:
+        profiler.stop()
+        logging.info("Profile:\n" + write_profile(logfile, profiler, profile_memory))
+
+    # flushing the background log writer so the attached log is complete
+    stop_logging()
+    send_summary_email(summary, None if both_chambers else is_senate, logfile)
+
+    # the run is reported first, then cron still sees that it failed
+    if run_error:
+        sys.exit(1)
 
 # runs the file
 if __name__ == "__main__":
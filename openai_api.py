@@ -1,14 +1,20 @@
 import re
+import time
+import logging
 from datetime import datetime
-from openai import OpenAI
-from urllib.parse import urlparse
 import platform
 from cleanup_text import cleanup_text
 from url_processing import get_primary_sponsor
+from bill_work import BillWork
+from prompt_templates import build_messages, prompt_text
+from story_outbox import get_generation, save_generation, delete_generation
+from usage_accounting import record_usage, estimated_usage
+from http_utils import http_get, openai_call, openai_slot, get_limiter, endpoint_for, take_retry, backoff_delay
+from similar_bills import get_similarity_index, adapt_story
+from bill_text_reducer import reduce_bill_text
+from config import OPENAI_MODEL, STREAM_GENERATION, MAX_HEADLINE_CHARS, OPENAI_DEADLINE, REUSE_SIMILAR_STORIES, BILL_TEXT_REDUCTION
 import requests
-
-global found_ids
-found_ids = {}
+from concurrent.futures import ThreadPoolExecutor
 
 # used for tagging purposes
 state_ids = {
@@ -118,8 +124,8 @@ def get_date_from_text(text, is_file):
             return None
     return None
 
+# returns the state tag ids for every party-state block in the story
 def extract_found_ids(press_release):
-    global found_ids
     found_ids = {}
 
     # Match either [R-UT], [D-NY-14], or R-UT, D-TX (non-bracketed)
@@ -135,10 +141,164 @@ def extract_found_ids(press_release):
     # print(len(found_ids))
     return found_ids
 
+# placeholders that mean the model never filled in the bill name (the story is thrown away if the body has one)
+PLACEHOLDERS = ("[Bill Name]", "[BILL NAME]", "bill title", "BILL TITLE")
+
+# token counts from a response's usage block (cached_tokens is the part of the prompt served from the provider's prefix cache)
+def usage_counts(usage):
+    if usage is None:
+        return None
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "cached_tokens": (getattr(details, "cached_tokens", None) or 0) if details else 0,
+    }
+
+def log_usage(filename, usage):
+    if usage:
+        hit_rate = usage["cached_tokens"] / usage["prompt_tokens"] if usage["prompt_tokens"] else 0
+        logging.info(
+            f"Usage for {filename}: {usage['prompt_tokens']} prompt ({usage['cached_tokens']} cached, {hit_rate:.0%}), "
+            f"{usage['completion_tokens']} completion"
+        )
+
+def log_reduction(filename, text, reduced):
+    if BILL_TEXT_REDUCTION and text:
+        logging.info(
+            f"Bill text for {filename}: {len(text)} -> {len(reduced)} chars "
+            f"({1 - len(reduced) / len(text):.0%} reduced, level {BILL_TEXT_REDUCTION})"
+        )
+
+# stores the usage of a finished (or cancelled) generation call with its latency
+def account_usage(work, started, outcome):
+    latency = time.monotonic() - started
+    if work.usage:
+        work.usage["latency"] = latency
+    log_usage(work.filename, work.usage)
+    try:
+        record_usage(work, OPENAI_MODEL, outcome, latency)
+    except Exception as e:
+        logging.error(f"Could not record usage for {work.filename}: {e}")
+
+def stream_completion(client, messages, on_headline=None):
+    """
+    Streams a chat completion and validates it while tokens arrive.
+
+    The request is cancelled as soon as the output is known to be unusable: the headline line
+    runs past MAX_HEADLINE_CHARS without a newline, the body contains a placeholder, or the
+    whole completion takes longer than OPENAI_DEADLINE seconds.
+    on_headline is called with the raw headline line as soon as it is complete.
+
+    Returns (result, reason, usage): the stripped output and None, or None and why it was
+    cancelled. usage holds the token counts (estimated from the prompt and the text streamed
+    so far when the stream was cancelled before the final usage chunk arrived).
+    """
+    start = time.monotonic()
+    stream = openai_call(
+        client.chat.completions.create,
+        model=OPENAI_MODEL,
+        messages=messages,
+        max_tokens=2500,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+
+    text = ""
+    body_start = None
+    usage = None
+    overlap = max(len(p) for p in PLACEHOLDERS) - 1
+
+    # what was sent and streamed before a cancel is still billed
+    def cancelled(reason):
+        return None, reason, usage or estimated_usage(messages, text)
+
+    try:
+        for chunk in stream:
+            # the last chunk carries the usage block and no choices
+            if getattr(chunk, "usage", None) is not None:
+                usage = usage_counts(chunk.usage)
+            if time.monotonic() - start > OPENAI_DEADLINE:
+                return cancelled(f"deadline of {OPENAI_DEADLINE}s passed")
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if not text:
+                logging.debug(f"First token after {time.monotonic() - start:.2f}s")
+
+            # only rescan the new text plus enough of the old text to catch a placeholder split across chunks
+            scan_from = max(0, len(text) - overlap)
+            text += delta
+
+            if body_start is None:
+                headline = text.lstrip()
+                newline = headline.find("\n")
+                if newline == -1:
+                    if len(headline) > MAX_HEADLINE_CHARS:
+                        return cancelled("headline not terminated by a newline")
+                    continue
+                body_start = len(text) - len(headline) + newline + 1
+                logging.debug(f"Headline validated after {time.monotonic() - start:.2f}s")
+                if on_headline:
+                    on_headline(headline[:newline])
+
+            window = text[max(body_start, scan_from):]
+            for placeholder in PLACEHOLDERS:
+                if placeholder in window:
+                    return cancelled(f"placeholder {placeholder} in body")
+    finally:
+        # closing the stream mid-response cancels the rest of the generation
+        stream.close()
+
+    logging.debug(f"Completion streamed in {time.monotonic() - start:.2f}s ({len(text)} chars)")
+    return text.strip(), None, usage
+
+# adapts the story of a near-duplicate (companion or re-introduced) bill for this one, or returns None
+def reuse_similar_story(work, fullname, last_name, summary_date):
+    try:
+        match = get_similarity_index().find(work.bill, work.summary)
+    except Exception as e:
+        logging.error(f"Similarity lookup failed for {work.filename}: {e}")
+        return None
+    if match is None:
+        return None
+    other, score, stored = match
+    adapted = adapt_story(stored, work.bill.is_senate, fullname, last_name, summary_date)
+    if adapted is None:
+        logging.info(f"{work.filename} is a near-duplicate of {other} ({score:.2f}), but its story doesn't follow the template")
+        return None
+    logging.info(f"Reusing the story of {other} for {work.filename} (similarity {score:.2f})")
+    return adapted
+
+# remembers a freshly generated story so near-duplicates of this bill can reuse it
+def index_story(work, result):
+    try:
+        get_similarity_index().add(work.bill, work.summary, result)
+    except Exception as e:
+        logging.error(f"Could not add {work.filename} to the similarity index: {e}")
+
+# a stored generation that fails the story checks is dropped, so the next run generates it again instead of failing the same way
+def reject_generation(prompt, source):
+    if source == "stored":
+        delete_generation(OPENAI_MODEL, prompt)
+
 def callApiWithText(text, summary, summary_date, client, url, is_senate, filename_only=False):
+    work = BillWork.from_url(None, url, is_senate)
+    work.content, work.summary, work.summary_date = text, summary, summary_date
+    return generate_story(work, client, filename_only)
+
+# generates the filename, headline and press release for a bill, storing them (and its state tags) on the BillWork
+def generate_story(work, client, filename_only=False):
+    is_senate = work.bill.is_senate
+    bill_number = work.bill.number
+    summary = work.summary
+
     # gathering info to then create the output for filename, headline, and body
     today = datetime.today()
-    text = re.sub(r'https://www\.congress\.gov[^\s]*', '', text)
+    # fetch_bill_sources already drops these while streaming, so this normally finds nothing (and copies nothing)
+    text = re.sub(r'https://www\.congress\.gov[^\s]*', '', work.content)
     month = today.strftime('%B') 
     short_month = today.strftime('%b')
     formatted_month = month if len(month) <= 5 else short_month + "."
@@ -149,10 +309,9 @@ def callApiWithText(text, summary, summary_date, client, url, is_senate, filenam
     
     day_format = '%-d' if platform.system() != 'Windows' else '%#d'
     today_date = f"{formatted_month} {today.strftime(day_format)}"
-    bill_number = urlparse(url).path.rstrip("/").split("/")[-2] if url.endswith("/text") else urlparse(url).path.rstrip("/").split("/")[-1]
-    formatted_bill_number = f"({'S.' if is_senate else 'H.R.'} {bill_number})"
+    formatted_bill_number = f"({work.bill.label} {bill_number})"
     # turning numerical dates into spelled-out date
-    summary_date = format_date_into_words(summary_date)
+    summary_date = format_date_into_words(work.summary_date)
 
     file_date = get_date_from_text(text, True)
 
@@ -161,11 +320,12 @@ def callApiWithText(text, summary, summary_date, client, url, is_senate, filenam
         return "NA", None, None
     
     filename = f"$H billSums-{file_date}-s{bill_number}" if is_senate else f"$H billSumh-{file_date}-hr{bill_number}"
+    work.filename = filename
 
     if filename_only:
         return filename, None, None
     
-    fullname, last_name = get_primary_sponsor(is_senate, 119, bill_number)
+    fullname, last_name = work.sponsor or get_primary_sponsor(is_senate, work.bill.congress, bill_number)
 
     if fullname == "STOP":
         # add_invalid_url(url)
@@ -175,58 +335,80 @@ def callApiWithText(text, summary, summary_date, client, url, is_senate, filenam
         # add_invalid_url(url)
         return "NA", None, None
     
-    # print(text)
-    
-    prompt = f"""
-    Write around a {len(summary.split())}-word news story about this {'Senate' if is_senate else 'House'} bill, following these rules:
-
-    Headline:
-    - Follow this Exact Format: {'Sen.' if is_senate else 'Rep.'} {last_name}: [bill title here] Analyzed by CRS
-    (Do not include the bill number in the headline.)
-
-    [NEWLINE SEPARATOR]
-
-    First Paragraph:
-    - DO NOT add any location or dateline at the beginning (e.g., "Washington, D.C. —" or similar).
-    - The first sentence must follow this Exact format: [bill title here], introduced by {'Sen.' if is_senate else 'Rep.'} {fullname} on {summary_date}, has been analyzed by the Congressional Research Service. 
-    - Be sure to include **commas before and after the party/state**, e.g., Sen. Jane Doe, D-NY,
-    - Immediately follow this sentence with a concise summary of the bill’s purpose in plain, informative language. Prioritize clarity and flow.
-
-    Body:
-    - Use structured paragraphs.
-    - No quotes.
-    - Add context (motivation, impact, background).
-    - Do not mention or list any cosponsors or other legislators by name.
-    - Focus on the bill’s purpose using the summary mainly, supliment information with the bill text
-
-    Bill Details:
-    Summary of the bill:
-    {summary}
-    Full Bill Text:
-    {text}
-    Primary Sponsor's Name and State Code: 
-    {fullname}
-    """
+    # the prompt gets the bill without its print layout and boilerplate (the date above is read from the full text)
+    prompt_bill_text = reduce_bill_text(text, BILL_TEXT_REDUCTION)
+    log_reduction(filename, text, prompt_bill_text)
+
+    # static rules first, per-bill details after them, so every bill of a chamber shares a cacheable prefix
+    messages = build_messages(is_senate, len(summary.split()), last_name, fullname, summary_date, summary, prompt_bill_text)
+    prompt = prompt_text(messages)
 
     try:
-        # Generate main press release
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=2500
-        )
-        result = response.choices[0].message.content.strip()
+        # identical prompts are served from the stored result instead of paying for a new generation
+        result = get_generation(OPENAI_MODEL, prompt)
+        source = "stored" if result is not None else None
+        if result is not None:
+            logging.info(f"Using stored generation for {filename}")
+
+        # so is a near-duplicate bill's story, with its headline and sponsor sentence rewritten
+        if result is None and REUSE_SIMILAR_STORIES:
+            result = reuse_similar_story(work, fullname, last_name, summary_date)
+            source = "reused" if result is not None else None
+
+        # the headline is cleaned as soon as it has streamed in, while the body is still generating
+        early_headline = {}
+
+        def on_headline(headline_raw):
+            early_headline[headline_raw.strip()] = clean_text(headline_raw)
+
+        if result is None and STREAM_GENERATION:
+            # Generate main press release
+            # (each generation holds a slot under openai's adaptive concurrency limit until it is done)
+            with openai_slot():
+                started = time.monotonic()
+                try:
+                    result, reason, work.usage = stream_completion(client, messages, on_headline)
+                except Exception:
+                    account_usage(work, started, "error")
+                    raise
+            account_usage(work, started, "ok" if result is not None else "cancelled")
+            if result is None:
+                print(f"Generation cancelled for {filename}: {reason}")
+                if reason.startswith("placeholder"):
+                    return None, None, None
+                return "NA", None, None
+            source = "generated"
+        elif result is None:
+            # Generate main press release
+            with openai_slot():
+                started = time.monotonic()
+                try:
+                    response = openai_call(
+                        client.chat.completions.create,
+                        model=OPENAI_MODEL,
+                        messages=messages,
+                        max_tokens=2500
+                    )
+                except Exception:
+                    account_usage(work, started, "error")
+                    raise
+            work.usage = usage_counts(response.usage)
+            account_usage(work, started, "ok")
+            result = response.choices[0].message.content.strip()
+            source = "generated"
+
         parts = result.split('\n', 1)
 
         if len(parts) != 2:
             # add_invalid_url(url)
             print(f"Headline Wasnt Parsed Right")
+            reject_generation(prompt, source)
             return "NA", None, None 
 
         headline_raw = parts[0]
         body_raw = parts[1]
 
-        headline = clean_text(headline_raw)
+        headline = early_headline.get(headline_raw.strip()) or clean_text(headline_raw)
         press_body = clean_text(body_raw)
 
         press_release = press_body.strip()
@@ -240,13 +422,22 @@ def callApiWithText(text, summary, summary_date, client, url, is_senate, filenam
         press_release = f"WASHINGTON, {today_date} -- {press_release}"
 
         press_release = clean_text(press_release)
-        extract_found_ids(press_release)
 
         if "[Bill Name]" in press_release or "[BILL NAME]" in press_release or "bill title" in press_release or "BILL TITLE" in press_release:
+            reject_generation(prompt, source)
             return None, None, None
+
+        # only a story that passed the checks above is kept for identical prompts and near-duplicate bills
+        if source == "generated":
+            save_generation(OPENAI_MODEL, prompt, result)
+            index_story(work, result)
         
         # making headline correct TNS syntax 
         headline = headline.replace("'", "").replace("'s", "")
+
+        work.headline = headline
+        work.press_release = press_release
+        work.tag_ids = extract_found_ids(press_release)
         
         return filename, headline, press_release
 
@@ -254,6 +445,52 @@ def callApiWithText(text, summary, summary_date, client, url, is_senate, filenam
         print(f"OpenAI API error: {e}")
         return "NA", None, None
 
+# gets every cosponsor entry for a bill, following the api's pagination (returns the list, or -1/429 on failure)
+def fetch_cosponsor_list(session, url, parameters):
+    cosponsors = []
+    next_url, next_params = url, parameters
+    while next_url:
+        try:
+            response = http_get(next_url, session=session, params=next_params)
+            response.raise_for_status()  # Required to trigger HTTPError
+        except requests.exceptions.HTTPError:
+            status = response.status_code
+            if status == 502:
+                print(f"502 Bad Gateway for URL: {next_url}")
+                return -1
+            elif status == 429:
+                print(f"429 Too Many Requests for URL: {next_url}")
+                return 429
+            else:
+                print(f"HTTP error {status} for URL: {next_url}")
+                return -1
+        except requests.exceptions.RequestException as e:
+            print(f"Error fetching cosponsors from {next_url}: {e}")
+            return -1
+
+        data = response.json()
+        cosponsors.extend(data.get("cosponsors", []))
+
+        # the next link already carries offset/limit, so only the api key is passed along
+        next_url = data.get("pagination", {}).get("next")
+        next_params = {"api_key": parameters["api_key"]}
+    return cosponsors
+
+# gets the direct order name, the party abreviation, and the state code of one cosponsor (None if it fails)
+# (transient failures are already retried by http_get)
+def fetch_cosponsor_member(session, url, parameters):
+    try:
+        curr_cosponsor = http_get(url, session=session, params=parameters)
+        curr_cosponsor.raise_for_status()
+        member_data = curr_cosponsor.json().get("member", {})
+        party = member_data.get("partyHistory", [{}])[0].get("partyAbbreviation", '')
+        state = member_data.get("terms", [{}])[-1].get("stateCode", '')  # get the latest term stateCode
+        name = member_data.get("directOrderName", '')
+        return f"{name}, {party}-{state}"
+    except Exception as e:
+        print(f"Error fetching cosponsor data from {url}: {e}")
+        return None
+
 # gets the cosponsor summary (now without the use of the GPT api)
 def generate_cosponsor_summary(url, text, is_senate, bill_num):
 
@@ -276,88 +513,51 @@ def generate_cosponsor_summary(url, text, is_senate, bill_num):
         "limit": 250
     }
 
-    # getting the json response
-    try: 
-        response = requests.get(url, parameters)
+    limiter = get_limiter(endpoint_for(url))
+    with requests.Session() as session:
+        # enough pooled connections for the most lookups the limit can allow at once
+        session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=limiter.maximum))
 
-        response.raise_for_status()  # Required to trigger HTTPError
+        # getting every page of the json response
+        cosponsors = fetch_cosponsor_list(session, url, parameters)
+        if cosponsors in (-1, 429):
+            return cosponsors
 
-        cosponsors = response.json()['cosponsors']
         urls = [c['url'] for c in cosponsors]
-
-        # print(cosponsors)
         num_cosponsors = len(cosponsors)
 
-    except requests.exceptions.HTTPError as e:
-        status = response.status_code
-        if status == 502:
-            print(f"502 Bad Gateway for URL: {url}")
-            return -1
-        elif status == 429:
-            print(f"429 Too Many Requests for URL: {url}")
-            return 429
-        else:
-            print(f"HTTP error {status} for URL: {url}")
-            return -1
+        if num_cosponsors == 0:
+            return f"The bill ({label}{bill_num}) was introduced on {intro_date}."
+
+        # looking every member up at once (map keeps the original cosponsor order); the threads only
+        # bound it, how many lookups are actually in flight is congress.gov's adaptive limit in http_utils
+        with ThreadPoolExecutor(max_workers=limiter.maximum) as pool:
+            members = list(pool.map(lambda member_url: fetch_cosponsor_member(session, member_url, parameters), urls))
+
+            # members that still failed get one more round (only those, each one paid for from the
+            # run's retry budget) after a backoff, before the whole summary is given up on
+            failed = [i for i, member in enumerate(members) if member is None]
+            retried = [i for i in failed if take_retry(endpoint_for(urls[i]))]
+            if retried:
+                print(f"Retrying {len(retried)} failed cosponsor lookup(s) for {url}")
+                time.sleep(backoff_delay(1))
+                for i, member in zip(retried, pool.map(lambda i: fetch_cosponsor_member(session, urls[i], parameters), retried)):
+                    members[i] = member
+
+    # if one still fails after its retries, try agian on next scrape
+    if None in members:
+        print(f"Error fetching cosponsor data for {url}: {members.count(None)} member(s) failed")
+        return -1
 
     # Adding Reps or Sens
-    honorific = ""
-
     if num_cosponsors == 1:
         honorific = "Sen." if is_senate else "Rep."
-    else:
-        honorific = "Sens." if is_senate else "Reps."
-
-    # creating and formatting the total paragram
-    cosponsors_str = f"The bill ({label}{bill_num}) introduced on {intro_date} has {num_cosponsors} co-sponsors: {honorific} "
-    count = 0
-
-    if num_cosponsors == 0:
-        cosponsors_str = f"The bill ({label}{bill_num}) was introduced on {intro_date}."
-        return cosponsors_str
-    
-    if num_cosponsors == 1:
-
-        cosponsors_str = f"The bill ({label}{bill_num}) introduced on {intro_date} has {num_cosponsors} co-sponsor: {honorific} "
+        return f"The bill ({label}{bill_num}) introduced on {intro_date} has {num_cosponsors} co-sponsor: {honorific} {members[0]}."
 
-        try: 
-            curr_cosponsor = requests.get(urls[0], parameters)
-            member_data = curr_cosponsor.json().get("member", {})
-            party = member_data.get("partyHistory", [{}])[0].get("partyAbbreviation", '')
-            state = member_data.get("terms", [{}])[-1].get("stateCode", '')  # get the latest term stateCode
-            name = member_data.get("directOrderName", '')
+    honorific = "Sens." if is_senate else "Reps."
 
-        # if it fails, try agian on next scrape
-        except Exception as e:
-            print(f"Error fetching cosponsor data from {url}: {e}")
-            return -1
-        
-        cosponsors_str += f"{name}, {party}-{state}."
-
-        return cosponsors_str
-    
-    for url in urls:
-        count += 1
-
-        # gettings the direct order name, the party abreviation, and the state code
-        try: 
-            curr_cosponsor = requests.get(url, parameters)
-            member_data = curr_cosponsor.json().get("member", {})
-            party = member_data.get("partyHistory", [{}])[0].get("partyAbbreviation", '')
-            state = member_data.get("terms", [{}])[-1].get("stateCode", '')  # get the latest term stateCode
-            name = member_data.get("directOrderName", '')
-
-        # if it fails, try agian on next scrape
-        except Exception as e:
-            print(f"Error fetching cosponsor data from {url}: {e}")
-            return -1
-
-        # pprint.pp(curr_cosponsor.json())
-        if count < num_cosponsors:
-            cosponsors_str += f"{name}, {party}-{state}; "
-        else:
-            cosponsors_str += f"{name}, {party}-{state}."
-    return cosponsors_str
+    # creating and formatting the total paragram
+    return f"The bill ({label}{bill_num}) introduced on {intro_date} has {num_cosponsors} co-sponsors: {honorific} " + "; ".join(members) + "."
 
 
 def convert_date_format(date_str):
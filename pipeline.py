@@ -0,0 +1,117 @@
+import queue
+import logging
+import threading
+from config import PIPELINE_QUEUE_SIZE
+
+# staged producer/consumer pipeline used by main.py's bill loop
+#
+# each stage is a function run by its own pool of worker threads, with a bounded queue in front
+# of it. a stage returns None to hand the item on to the next stage, or an outcome string to
+# finish it there. a full queue blocks the stage feeding it, so a slow stage (generation) holds
+# back the faster ones instead of letting fetched bills pile up in memory.
+#
+# items are fed and finished items are handed back in the caller's thread, in completion order,
+# so the caller can keep its tallies, journal and story batch without locks. with fetch and
+# generation overlapping, a run takes about as long as its slowest stage instead of the sum.
+# a stage that raises only ends that item (with the outcome FAILED); the rest keep going.
+
+# finished items are polled this often (seconds) while the first queue is full
+POLL_SECONDS = 0.1
+
+# put on a stage's queue once per worker when the pipeline shuts down
+_SHUTDOWN = object()
+
+# the outcome of items that were still in flight when the pipeline was cancelled
+CANCELLED = "cancelled"
+
+# the outcome of an item a stage raised on (the error is logged with its traceback)
+FAILED = "failed"
+
+
+class Pipeline:
+    def __init__(self, stages, queue_size=PIPELINE_QUEUE_SIZE):
+        """
+        stages is a list of (name, function, workers). Each function takes an item and returns
+        None (hand on) or an outcome; the last stage's None becomes the outcome "done".
+        """
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self.results = queue.Queue()
+        self.cancelled = threading.Event()
+        self.in_flight = 0
+        self._threads = []
+
+    def _work(self, index):
+        name, function, _ = self.stages[index]
+        inbox = self.queues[index]
+        while True:
+            item = inbox.get()
+            if item is _SHUTDOWN:
+                return
+            if self.cancelled.is_set():
+                outcome = CANCELLED
+            else:
+                try:
+                    outcome = function(item)
+                except Exception:
+                    logging.exception(f"Pipeline stage {name} failed on {item!r}")
+                    outcome = FAILED
+            if outcome is None and index + 1 < len(self.stages):
+                self.queues[index + 1].put(item)
+            else:
+                self.results.put((item, "done" if outcome is None else outcome))
+
+    def start(self):
+        for index, (name, _, workers) in enumerate(self.stages):
+            for n in range(workers):
+                thread = threading.Thread(target=self._work, args=(index,), name=f"{name}-{n + 1}")
+                thread.start()
+                self._threads.append((index, thread))
+        logging.info("Pipeline: " + ", ".join(f"{name} x{workers}" for name, _, workers in self.stages))
+
+    # lets the items in flight through without running any more stage functions on them
+    def cancel(self):
+        self.cancelled.set()
+
+    # stops the workers stage by stage, so items still moving downstream are let through first
+    def shutdown(self):
+        for index, (_, _, workers) in enumerate(self.stages):
+            for _ in range(workers):
+                self.queues[index].put(_SHUTDOWN)
+            for thread_index, thread in self._threads:
+                if thread_index == index:
+                    thread.join()
+
+    def run(self, items):
+        """
+        Feeds items into the first stage as it has room (so items is only read as fast as the
+        pipeline drains) and yields (item, outcome) for every finished item. Items in flight
+        when the caller stops reading are cancelled.
+        """
+        self.start()
+        items = iter(items)
+        pending = None
+        feeding = True
+        self.in_flight = 0
+        try:
+            while feeding or pending is not None or self.in_flight:
+                if feeding and pending is None:
+                    pending = next(items, None)
+                    feeding = pending is not None
+                if pending is not None:
+                    try:
+                        self.queues[0].put(pending, timeout=POLL_SECONDS if self.in_flight else None)
+                        self.in_flight += 1
+                        pending = None
+                    except queue.Full:
+                        pass
+                # only wait for a finished item when there is nothing to feed
+                try:
+                    item, outcome = self.results.get(block=pending is not None or not feeding, timeout=POLL_SECONDS)
+                except queue.Empty:
+                    continue
+                self.in_flight -= 1
+                yield item, outcome
+        finally:
+            self.cancel()
+            self.shutdown()
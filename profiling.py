@@ -0,0 +1,147 @@
+import os
+import sys
+import time
+import threading
+import tracemalloc
+from collections import Counter
+from config import PROFILE_INTERVAL, PROFILE_TOP, PROFILE_MEMORY_FRAMES
+
+# --profile / --profile-memory support for main.py
+#
+# cpu: a background thread samples every running (non-daemon) thread's stack every PROFILE_INTERVAL
+# seconds. sampling wall clock stacks this way costs well under a percent of a run, and shows where
+# bills spend their time whether that is parsing or waiting on congress.gov / openai.
+# memory: tracemalloc, which is noticeably slower, so it is only on with --profile-memory.
+#
+# output, next to the run log:
+#   <log>.profile.folded   collapsed stacks ("thread;module.func;module.func count"), for flamegraph.pl or speedscope
+#   <log>.profile.txt      top-N report grouped by module
+
+# source paths in the memory report are shown relative to the repo
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class SamplingProfiler:
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.started = None
+        self.elapsed = 0.0
+        self._labels = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.monotonic() - self.started
+
+    # "module.function" for a frame, cached per code object
+    def _label(self, frame):
+        code = frame.f_code
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{frame.f_globals.get('__name__', '?')}.{code.co_name}"
+        return label
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            # daemon threads (the log listener, this sampler) are idle by design and left out
+            threads = {t.ident: t.name for t in threading.enumerate() if not t.daemon}
+            for ident, frame in sys._current_frames().items():
+                name = threads.get(ident)
+                if name is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame))
+                    frame = frame.f_back
+                stack.append(name)
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write_folded(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def report(self, top=PROFILE_TOP):
+        total = sum(self.stacks.values()) or 1
+        self_by_module, total_by_module, self_by_function = Counter(), Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            if not frames:
+                continue
+            self_by_function[frames[-1]] += count
+            self_by_module[module_group(frames[-1].rsplit(".", 1)[0])] += count
+            for group in {module_group(frame.rsplit(".", 1)[0]) for frame in frames}:
+                total_by_module[group] += count
+
+        lines = [
+            f"CPU (wall clock): {self.samples} sample(s) every {self.interval * 1000:.0f} ms over {self.elapsed:.1f}s, "
+            f"{total} thread stack(s)",
+            "  By module (self / inclusive):",
+        ]
+        for group, count in total_by_module.most_common(top):
+            lines.append(f"    {group:<28} {self_by_module[group] / total:6.1%}  {count / total:6.1%}")
+        lines.append("  Top functions (self):")
+        for label, count in self_by_function.most_common(top):
+            lines.append(f"    {label:<60} {count / total:6.1%}")
+        return "\n".join(lines) + "\n"
+
+
+# "url_processing", "openai_api", ... for our (flat) modules, the top level package for everything else
+def module_group(module):
+    if module == "__main__":
+        return "main"
+    return module.split(".")[0]
+
+
+def start_memory_trace():
+    tracemalloc.start(PROFILE_MEMORY_FRAMES)
+
+# allocations still held at the end of the run, grouped like the cpu report, plus the peak
+def memory_report(top=PROFILE_TOP):
+    snapshot = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # maps each traced file back to its module
+    modules = {}
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None)
+        if path:
+            modules[os.path.abspath(path)] = name
+
+    by_module = Counter()
+    for stat in snapshot.statistics("filename"):
+        filename = os.path.abspath(stat.traceback[0].filename)
+        name = modules.get(filename, os.path.splitext(os.path.basename(filename))[0])
+        by_module[module_group(name)] += stat.size
+
+    lines = [f"Memory: {current / 1024 ** 2:.1f} MB traced at the end, {peak / 1024 ** 2:.1f} MB peak", "  By module:"]
+    for group, size in by_module.most_common(top):
+        lines.append(f"    {group:<28} {size / 1024 ** 2:8.2f} MB")
+    lines.append("  Top lines:")
+    for stat in snapshot.statistics("lineno")[:top]:
+        frame = stat.traceback[0]
+        lines.append(f"    {os.path.relpath(frame.filename, REPO_DIR) if frame.filename.startswith(REPO_DIR) else frame.filename}:{frame.lineno:<6} {stat.size / 1024 ** 2:8.2f} MB ({stat.count} blocks)")
+    return "\n".join(lines) + "\n"
+
+
+# writes the folded stacks and the report next to the run log and returns the report
+def write_profile(logfile, profiler, memory):
+    base = logfile[:-len(".log")] if logfile.endswith(".log") else logfile
+    profiler.write_folded(base + ".profile.folded")
+    report = profiler.report()
+    if memory:
+        report += memory_report()
+    with open(base + ".profile.txt", "w", encoding="utf-8") as f:
+        f.write(report)
+    return report
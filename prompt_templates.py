@@ -0,0 +1,161 @@
+# story prompt, split into a static instruction prefix and the per-bill details
+#
+# the prefix is byte-for-byte identical for every bill of a chamber and is sent first (as the
+# system message), so the provider can reuse its cached prefix across requests. the provider only
+# caches prefixes of PROMPT_CACHE_MIN_TOKENS or more, which is why the prefix carries the full style
+# guide and a fixed worked example. anything that changes per bill (word count, sponsor, dates,
+# summary, text) goes in the user message after it, where the headline and first sentence formats
+# are spelled out with this bill's values, as they were before the prompt was split.
+
+STORY_RULES = """
+    You write news stories for a wire service about {chamber} bills that have been analyzed by the
+    Congressional Research Service (CRS). Each story is written from the CRS summary of one bill,
+    supplemented with the bill text. The next message gives the story instructions for that bill,
+    with its word count, headline and first sentence, followed by its Bill Details.
+
+    Write a news story about the bill, following these rules.
+
+    Headline:
+    - Follow this Exact Format: {title} [sponsor last name]: [bill title here] Analyzed by CRS
+    (Do not include the bill number in the headline.)
+
+    [NEWLINE SEPARATOR]
+
+    First Paragraph:
+    - DO NOT add any location or dateline at the beginning (e.g., "Washington, D.C. —" or similar).
+    - The first sentence must follow this Exact format: [bill title here], introduced by {title} [sponsor name, party-state] on [summary date], has been analyzed by the Congressional Research Service.
+    - Be sure to include **commas before and after the party/state**, e.g., {title} Jane Doe, D-NY,
+    - Immediately follow this sentence with a concise summary of the bill’s purpose in plain, informative language. Prioritize clarity and flow.
+
+    Body:
+    - Use structured paragraphs.
+    - No quotes.
+    - Add context (motivation, impact, background).
+    - Do not mention or list any cosponsors or other legislators by name.
+    - Focus on the bill’s purpose using the summary mainly, supliment information with the bill text
+
+    Style Guide:
+
+    Output format
+    - The output is plain text: the headline on the first line, a blank line, then the body.
+    - Do not use Markdown, bold or italic markers, bullet points, numbered lists or section headings
+      in the story. Every paragraph is ordinary prose separated from the next by a blank line.
+    - Do not add a byline, a sign-off, an editor's note, hashtags or a closing summary of the rules.
+    - Use the bill title as the summary and bill text give it (its short title when it has one),
+      with the same capitalization, in both the headline and the first sentence.
+
+    Tone and voice
+    - Write in the neutral, factual voice of a wire service. The story explains what the bill would
+      do; it does not argue for or against it.
+    - Do not speculate about the bill's chances of passage, its political motives or how members
+      might vote, and do not describe it as controversial, historic, landmark or bipartisan.
+    - Use the conditional for the bill's provisions ("the bill would require", "the measure would
+      establish"), since an introduced bill has not become law. Current law is described in the
+      present tense.
+    - Prefer plain words to legislative jargon. When a legal term is needed, explain it briefly
+      the first time it appears.
+
+    Accuracy
+    - Every statement about the bill must be supported by the summary or the bill text. Do not
+      invent dollar amounts, dates, deadlines, agencies, programs, statistics or findings.
+    - When the summary and the bill text disagree, follow the summary.
+    - Background and context may describe the problem the bill addresses in general terms, but must
+      not attribute claims, motives or quotations to the sponsor or to anyone else.
+    - If the bill amends an existing law, name the law as the bill or summary names it and say what
+      the change would do, rather than listing section numbers.
+
+    Names, numbers and dates
+    - After the first sentence, refer to the sponsor at most once more, by title and last name
+      (for example, "Sen. Doe" or "Rep. Doe"), and never by party or state again.
+    - Spell out an agency's full name on first reference, followed by its common abbreviation in
+      parentheses when it is used again, for example the Department of Health and Human Services
+      (HHS). Use the abbreviation afterwards.
+    - Write dates as month, day and year ("March 4, 2025") and fiscal years as "fiscal year 2026".
+    - Write dollar amounts with a dollar sign and words for large units ("$250 million", "$1.2
+      billion"). Spell out numbers from one to nine and use figures for 10 and above, except for
+      percentages, ages and dollar amounts, which always use figures.
+
+    Structure
+    - The first paragraph is the required first sentence followed by one or two sentences on what
+      the bill would do overall.
+    - The following paragraphs take the bill's major provisions in order of importance, one main
+      provision per paragraph, explaining who would be affected and how.
+    - Close with a paragraph on reporting requirements, deadlines, authorized funding or the date
+      the provisions would take effect, when the bill has them. Do not end with commentary.
+    - Keep paragraphs to two to four sentences. Stay close to the requested word count; a short
+      summary calls for a short story rather than padding.
+
+    Worked example (a made-up bill, shown only for form; never reuse its facts, names or wording):
+
+    Example Bill Details:
+    Target Word Count: 120
+    Sponsor Last Name: Doe
+    Primary Sponsor's Name and State Code: Jane Doe, D-NY
+    Summary Date: March 4, 2025
+    Summary of the bill:
+    Rural Water Systems Resilience Act. This bill directs the Environmental Protection Agency (EPA)
+    to establish a grant program for small rural water systems to assess and reduce their
+    vulnerability to drought, flooding and power outages. Systems serving fewer than 10,000 people
+    are eligible. The bill authorizes $50 million for each of fiscal years 2026 through 2030 and
+    requires the EPA to report to Congress on the grants awarded within two years.
+
+    Example story:
+    {title} Doe: Rural Water Systems Resilience Act Analyzed by CRS
+
+    The Rural Water Systems Resilience Act, introduced by {title} Jane Doe, D-NY, on March 4, 2025, has been analyzed by the Congressional Research Service. The bill would create a federal grant program to help small rural water systems prepare for drought, flooding and power outages.
+
+    Under the bill, the Environmental Protection Agency (EPA) would award grants to water systems serving fewer than 10,000 people. The grants would pay for assessments of a system's vulnerabilities and for projects that reduce them.
+
+    Small systems often lack the staff and funds to plan for extreme weather, which can leave rural communities without safe drinking water when storms or long dry spells strike.
+
+    The bill would authorize $50 million for each of fiscal years 2026 through 2030, and the EPA would have to report to Congress on the grants it awards within two years.
+    """
+
+STORY_INSTRUCTIONS = """
+    Story instructions for this bill:
+    Write around a {word_count}-word news story about this {chamber} bill.
+    Headline, in this Exact Format: {title} {last_name}: [bill title here] Analyzed by CRS
+    First sentence, in this Exact format: [bill title here], introduced by {title} {fullname} on {summary_date}, has been analyzed by the Congressional Research Service.
+    """
+
+BILL_DETAILS = """
+    Bill Details:
+    Target Word Count: {word_count}
+    Sponsor Last Name: {last_name}
+    Primary Sponsor's Name and State Code: {fullname}
+    Summary Date: {summary_date}
+    Summary of the bill:
+    {summary}
+    Full Bill Text:
+    {text}
+    """
+
+
+# the chamber and sponsor title filled into the rules and instructions
+def chamber_names(is_senate):
+    return {"chamber": "Senate", "title": "Sen."} if is_senate else {"chamber": "House", "title": "Rep."}
+
+
+# the static prefix for each chamber, built once
+STATIC_PREFIX = {is_senate: STORY_RULES.format(**chamber_names(is_senate)) for is_senate in (True, False)}
+
+
+def build_messages(is_senate, word_count, last_name, fullname, summary_date, summary, text):
+    """Returns the chat messages for one bill story: the static rules, then this bill's instructions and details."""
+    values = dict(
+        word_count=word_count,
+        last_name=last_name,
+        fullname=fullname,
+        summary_date=summary_date,
+    )
+    instructions = STORY_INSTRUCTIONS.format(**chamber_names(is_senate), **values)
+    details = BILL_DETAILS.format(summary=summary, text=text, **values)
+    return [
+        {"role": "system", "content": STATIC_PREFIX[is_senate]},
+        {"role": "user", "content": instructions + details},
+    ]
+
+
+# the text used to key stored generations (see story_outbox.prompt_hash)
+def prompt_text(messages):
+    return "\0".join(f"{message['role']}:{message['content']}" for message in messages)
@@ -0,0 +1,87 @@
+import re
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from config import BUDGET_RESERVE, BUDGET_DEFAULT_STAGE_SECONDS, BUDGET_SMOOTHING
+
+# whole-run time budget (main.py --budget 45m)
+#
+# every stage of every bill is timed and folded into a moving average per stage. before a bill is
+# started, the expected time for a full bill (the sum of the stage averages) is checked against what
+# is left of the budget minus BUDGET_RESERVE, which covers the final story flush, the archive
+# eviction and the summary email. once a bill no longer fits, no new bills are started and the run
+# drains and reports as usual, so the journal can --resume the rest.
+
+DURATION_RE = re.compile(r"^(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s)?$")
+
+
+# "45m", "1h30m", "90s" or a plain number of minutes -> seconds
+def parse_duration(text):
+    text = text.strip().lower()
+    if text.isdigit():
+        return int(text) * 60
+    match = DURATION_RE.match(text)
+    if not match or not any(match.groups()):
+        raise ValueError(f"invalid duration {text!r} (use e.g. 45m, 1h30m or 90s)")
+    hours, minutes, seconds = (int(group or 0) for group in match.groups())
+    return hours * 3600 + minutes * 60 + seconds
+
+
+class RunBudget:
+    def __init__(self, seconds=None, reserve=BUDGET_RESERVE):
+        self.seconds = seconds
+        self.reserve = reserve
+        self.started = time.monotonic()
+        self.averages = {}
+        self.counts = {}
+        self.exhausted = False
+        self._lock = threading.Lock()
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def remaining(self):
+        return None if self.seconds is None else self.seconds - self.elapsed()
+
+    # records how long one run of a stage took
+    def observe(self, stage, seconds):
+        with self._lock:
+            previous = self.averages.get(stage)
+            self.averages[stage] = seconds if previous is None else previous + BUDGET_SMOOTHING * (seconds - previous)
+            self.counts[stage] = self.counts.get(stage, 0) + 1
+
+    @contextmanager
+    def stage(self, name):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - started)
+
+    # expected seconds for one more bill that goes through every stage
+    def expected_bill(self, stages=("fetch", "preview", "generate")):
+        return sum(self.averages.get(stage, BUDGET_DEFAULT_STAGE_SECONDS) for stage in stages)
+
+    # whether a new bill can still be finished inside the budget (always true without one), with
+    # ahead bills already in flight in front of it and parallel of them being generated at once
+    def can_start_bill(self, ahead=0, parallel=1):
+        if self.seconds is None:
+            return True
+        if self.exhausted:
+            return False
+        waiting = ahead / parallel * self.averages.get("generate", BUDGET_DEFAULT_STAGE_SECONDS)
+        needed = self.expected_bill() + waiting + self.reserve
+        if self.remaining() < needed:
+            self.exhausted = True
+            logging.warning(
+                f"Time budget: {self.remaining():.0f}s left, a bill needs about {needed:.0f}s with the reserve, "
+                "not starting any more bills"
+            )
+        return not self.exhausted
+
+    # budget section of the summary email
+    def report(self):
+        stages = ", ".join(f"{stage} {average:.1f}s (x{self.counts[stage]})" for stage, average in sorted(self.averages.items()))
+        budget = "none" if self.seconds is None else f"{self.seconds / 60:.0f}m, stopped early: {self.exhausted}"
+        return f"Time Budget: {budget}\nAverage Stage Times: {stages or 'n/a'}\n"
@@ -0,0 +1,136 @@
+import os
+import json
+import glob
+import time
+import logging
+import threading
+from datetime import datetime
+from config import JOURNAL_DIR, JOURNAL_KEEP_DAYS
+
+# append-only journal of a run: which stages each bill got through and how it ended
+#
+# one json object per line in state/journal/run-<start time>.jsonl:
+#   {"event": "start", "chambers": ["house"], "time": ...}
+#   {"url_id": 12, "stage": "fetched", "time": ...}
+#   {"url_id": 12, "stage": "done", "outcome": "queued", "filename": "...", "time": ...}
+#   {"event": "end", "stopped": false, "time": ...}
+#
+# a run that stopped on a rate limit, or never wrote its end line because it crashed, can be
+# picked up by --resume: bills with a "done" line are skipped, bills whose sources were fetched
+# are re-read from the source archive, and the queue is walked in the same (id) order. only a
+# journal of the same chambers is resumed, so the separate -s and -h runs never pick up (and
+# close) each other's journals
+
+
+class RunJournal:
+    def __init__(self, path):
+        self.path = path
+        self.stages = {}
+        self.outcomes = {}
+        self.resumed = False
+        self._file = None
+        # pipeline stages record from their own threads
+        self._lock = threading.Lock()
+
+    # starts a journal for a new run
+    @classmethod
+    def start(cls, chambers):
+        os.makedirs(JOURNAL_DIR, exist_ok=True)
+        prune_journals()
+        journal = cls(os.path.join(JOURNAL_DIR, f"run-{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.jsonl"))
+        journal._write({"event": "start", "chambers": chambers})
+        return journal
+
+    # reopens the latest unfinished journal (stopped or crashed) of these chambers, or starts a new one if there is none
+    @classmethod
+    def resume(cls, chambers):
+        path = latest_unfinished(chambers)
+        if path is None:
+            logging.info("No interrupted run to resume, starting a new one")
+            return cls.start(chambers)
+
+        journal = cls(path)
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # a crash can leave a half written last line
+                    continue
+                if "url_id" in record:
+                    journal.stages.setdefault(record["url_id"], set()).add(record["stage"])
+                    if record["stage"] == "done":
+                        journal.outcomes[record["url_id"]] = record["outcome"]
+        journal.resumed = True
+        journal._write({"event": "resume", "chambers": chambers})
+        logging.info(f"Resuming {os.path.basename(path)}: {len(journal.outcomes)} bill(s) already finished")
+        return journal
+
+    def _write(self, record):
+        with self._lock:
+            self._write_locked(record)
+
+    def _write_locked(self, record):
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+            # finishing a line a crash cut short, so it doesn't swallow the next record
+            if self._file.tell() > 0:
+                with open(self.path, "rb") as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        self._file.write("\n")
+        record["time"] = time.time()
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    # the bill got through a stage, artifacts (filename, version, ...) are stored with it
+    def record(self, url_id, stage, **artifacts):
+        self.stages.setdefault(url_id, set()).add(stage)
+        self._write({"url_id": url_id, "stage": stage, **artifacts})
+
+    # the bill is finished for this run (queued, too short, held, duplicate, ...)
+    def finish_bill(self, url_id, outcome, **artifacts):
+        self.outcomes[url_id] = outcome
+        self.record(url_id, "done", outcome=outcome, **artifacts)
+
+    def is_done(self, url_id):
+        return url_id in self.outcomes
+
+    def reached(self, url_id, stage):
+        return stage in self.stages.get(url_id, ())
+
+    # closes the journal; a run that stopped early stays resumable
+    def close(self, stopped):
+        self._write({"event": "end", "stopped": stopped})
+        self._file.close()
+        self._file = None
+
+
+# the newest journal of a run over the same chambers, if it has no clean end line
+def latest_unfinished(chambers):
+    for path in sorted(glob.glob(os.path.join(JOURNAL_DIR, "run-*.jsonl")), reverse=True):
+        started = last = None
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("event") == "start":
+                    started = record
+                if "event" in record:
+                    last = record
+        # another chamber's run (or a journal without its start line)
+        if started is None or sorted(started.get("chambers", ())) != sorted(chambers):
+            continue
+        if last["event"] != "end" or last["stopped"]:
+            return path
+        return None
+    return None
+
+# deletes journals older than JOURNAL_KEEP_DAYS
+def prune_journals():
+    cutoff = time.time() - JOURNAL_KEEP_DAYS * 86400
+    for path in glob.glob(os.path.join(JOURNAL_DIR, "run-*.jsonl")):
+        if os.path.getmtime(path) < cutoff:
+            os.remove(path)
@@ -0,0 +1,198 @@
+import os
+import re
+import time
+import zlib
+import logging
+import sqlite3
+import threading
+from array import array
+from functools import lru_cache
+from config import SIMILARITY_PATH, SIMILARITY_THRESHOLD, MINHASH_PERMUTATIONS, LSH_BANDS
+
+# near-duplicate index over CRS summaries, so companion and re-introduced bills can reuse a story
+#
+# each summary is normalized, cut into word shingles and reduced to a MinHash signature; the
+# signature is split into LSH_BANDS bands and a bill is a candidate when any band matches exactly.
+# the band buckets live in memory (loaded once per run), so a lookup is a few dict probes no
+# matter how large the corpus gets; signatures and model output are persisted in sqlite.
+#
+# signatures use one permutation hashing: every shingle is hashed once, the low bits of its hash
+# pick one of the MINHASH_PERMUTATIONS slots and the rest competes for that slot's minimum (slots
+# no shingle fell into borrow from the next filled one). that is one hash per shingle instead of
+# one per shingle and slot, and the fraction of equal slots still estimates Jaccard similarity.
+
+SHINGLE_WORDS = 5
+
+# signatures of another scheme (1 was a separate hash per slot) aren't comparable and are left out
+SIGNATURE_SCHEME = 2
+# added to a borrowed value per slot it was borrowed across, so a borrowed slot only matches another borrowed one
+BORROW_OFFSET = 1 << 58
+EMPTY = (1 << 64) - 1
+CRC_SEED = 0x9E3779B9
+ROWS_PER_BAND = MINHASH_PERMUTATIONS // LSH_BANDS
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS similar_bills (
+    bill_key TEXT PRIMARY KEY,
+    signature BLOB NOT NULL,
+    result TEXT NOT NULL,
+    created REAL NOT NULL
+);
+"""
+
+
+# stable 64 bit hashes of the summary's word shingles (str hash() is salted per process)
+def shingles(text):
+    words = WORD_RE.findall(text.lower())
+    if len(words) < SHINGLE_WORDS:
+        windows = [" ".join(words)]
+    else:
+        windows = [" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)]
+    # two crc32s under different starting values make up the 64 bits
+    return {zlib.crc32(w) | zlib.crc32(w, CRC_SEED) << 32 for w in (window.encode("utf-8") for window in windows)}
+
+# the signature of a summary (a generated bill is looked up and then added with the same summary)
+@lru_cache(maxsize=64)
+def minhash(text):
+    slots = [EMPTY] * MINHASH_PERMUTATIONS
+    for h in shingles(text):
+        slot, value = h % MINHASH_PERMUTATIONS, h // MINHASH_PERMUTATIONS
+        if value < slots[slot]:
+            slots[slot] = value
+    filled = [i for i, value in enumerate(slots) if value != EMPTY]
+    if filled:
+        for i in range(MINHASH_PERMUTATIONS):
+            if slots[i] == EMPTY:
+                distance = next(d for d in range(1, MINHASH_PERMUTATIONS) if slots[(i + d) % MINHASH_PERMUTATIONS] != EMPTY)
+                slots[i] = (slots[(i + distance) % MINHASH_PERMUTATIONS] + distance * BORROW_OFFSET) & EMPTY
+    return array("Q", slots)
+
+# fraction of equal signature slots, an estimate of the shingle sets' Jaccard similarity
+def similarity(sig_a, sig_b):
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+def bands(signature):
+    return [(i, tuple(signature[i * ROWS_PER_BAND:(i + 1) * ROWS_PER_BAND])) for i in range(LSH_BANDS)]
+
+def bill_key(bill):
+    return f"{bill.congress}/{bill.chamber}/{bill.number}"
+
+
+class SimilarityIndex:
+    def __init__(self, path=SIMILARITY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._signatures = None
+        self._buckets = {}
+
+    # one connection for the run, shared by the generate threads under _lock
+    def _connect(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.executescript(SCHEMA)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(similar_bills)")}
+            if "scheme" not in columns:
+                self._conn.execute("ALTER TABLE similar_bills ADD COLUMN scheme INTEGER NOT NULL DEFAULT 1")
+                self._conn.commit()
+        return self._conn
+
+    # loads every stored signature into the in-memory buckets on first use
+    def _load(self):
+        if self._signatures is not None:
+            return
+        self._signatures = {}
+        rows = self._connect().execute(
+            "SELECT bill_key, signature FROM similar_bills WHERE scheme = ?", (SIGNATURE_SCHEME,)
+        )
+        for key, blob in rows:
+            signature = array("Q")
+            signature.frombytes(blob)
+            self._add_to_buckets(key, signature)
+        logging.debug(f"Similarity index loaded: {len(self._signatures)} bill(s)")
+
+    def _add_to_buckets(self, key, signature):
+        self._signatures[key] = signature
+        for band in bands(signature):
+            self._buckets.setdefault(band, set()).add(key)
+
+    def find(self, bill, summary):
+        """
+        Returns (bill_key, similarity, stored model output) for the most similar other bill at or
+        above SIMILARITY_THRESHOLD, or None.
+        """
+        signature = minhash(summary)
+        key = bill_key(bill)
+        with self._lock:
+            self._load()
+            candidates = set()
+            for band in bands(signature):
+                candidates |= self._buckets.get(band, set())
+            candidates.discard(key)
+            scored = [(similarity(signature, self._signatures[other]), other) for other in candidates]
+            scored = [(score, other) for score, other in scored if score >= SIMILARITY_THRESHOLD]
+            if not scored:
+                return None
+            score, other = max(scored)
+            row = self._conn.execute("SELECT result FROM similar_bills WHERE bill_key = ?", (other,)).fetchone()
+        return (other, score, row[0]) if row else None
+
+    # adds (or replaces) a bill's summary signature and the model output its story came from
+    def add(self, bill, summary, result):
+        signature = minhash(summary)
+        key = bill_key(bill)
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO similar_bills (bill_key, signature, result, created, scheme) VALUES (?, ?, ?, ?, ?)",
+                    (key, signature.tobytes(), result, time.time(), SIGNATURE_SCHEME)
+                )
+            if self._signatures is not None:
+                old = self._signatures.get(key)
+                if old is not None:
+                    for band in bands(old):
+                        self._buckets.get(band, set()).discard(key)
+                self._add_to_buckets(key, signature)
+
+
+_index = None
+
+# shared index instance used by generate_story
+def get_similarity_index():
+    global _index
+    if _index is None:
+        _index = SimilarityIndex()
+    return _index
+
+
+# the templated parts of a story that name the sponsor and date (see prompt_templates.STORY_INSTRUCTIONS)
+HEADLINE_RE = re.compile(r"^\s*(?:Sen\.|Rep\.)\s+[^:]+:\s*(.+)$")
+SPONSOR_SENTENCE_RE = re.compile(r"introduced by (?:Sen\.|Rep\.) .+? on [A-Z][a-z]+\.? \d{1,2}, \d{4}, has been analyzed")
+
+def adapt_story(result, is_senate, fullname, last_name, summary_date):
+    """
+    Rewrites another bill's model output (headline line, then body) for this bill's sponsor and
+    summary date. Returns None when the output doesn't follow the template closely enough.
+    """
+    parts = result.split("\n", 1)
+    if len(parts) != 2:
+        return None
+    headline_match = HEADLINE_RE.match(parts[0])
+    if not headline_match or not SPONSOR_SENTENCE_RE.search(parts[1]):
+        return None
+
+    title = "Sen." if is_senate else "Rep."
+    headline = f"{title} {last_name}: {headline_match.group(1).strip()}"
+    body = SPONSOR_SENTENCE_RE.sub(
+        lambda _: f"introduced by {title} {fullname} on {summary_date}, has been analyzed", parts[1], count=1
+    )
+    # a companion bill comes from the other chamber
+    other, own = ("House", "Senate") if is_senate else ("Senate", "House")
+    body = body.replace(f"{other} bill", f"{own} bill")
+    return f"{headline}\n{body}"
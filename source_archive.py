@@ -0,0 +1,364 @@
+import os
+import gzip
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from config import ARCHIVE_DIR, ARCHIVE_MAX_AGE_DAYS, ARCHIVE_MAX_BYTES
+
+# local, content-addressed archive of everything getTextandSummary downloads
+#
+# layout:
+#   archive/objects/ab/abcdef....gz   gzip compressed blob, named by the sha256 of the raw bytes
+#   archive/index.db                  (congress, chamber, bill, version) -> blob hashes of each part
+#
+# identical payloads (re-fetched summaries, unchanged text metadata) are only stored once.
+# the index is a SQLite database updated row by row, so the -s and -h runs (separate processes)
+# can share one archive: record and evict each run in a single write transaction, and record
+# checks the blobs it references still exist once it holds the lock, so an evict in the other
+# process can never leave an entry pointing at a deleted blob.
+
+INDEX_NAME = "index.db"
+# the index before it moved to SQLite, imported once and renamed
+LEGACY_INDEX_NAME = "index.json"
+
+# the parts that can be stored for a single bill version
+PARTS = ("summary", "text_meta", "html")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    bill TEXT NOT NULL,
+    stored REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_bill ON entries (bill, stored);
+CREATE TABLE IF NOT EXISTS parts (
+    key TEXT NOT NULL REFERENCES entries (key) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    content_type TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (key, name)
+);
+CREATE INDEX IF NOT EXISTS parts_hash ON parts (hash);
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    size INTEGER NOT NULL
+);
+"""
+
+
+def make_key(congress, chamber, bill_number, version):
+    return f"{congress}/{chamber}/{bill_number}/{version}"
+
+
+class SourceArchive:
+    def __init__(self, root=ARCHIVE_DIR, max_age_days=ARCHIVE_MAX_AGE_DAYS, max_bytes=ARCHIVE_MAX_BYTES):
+        self.root = root
+        self.max_age_days = max_age_days
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(root, INDEX_NAME)
+        self._lock = threading.Lock()
+        self._ready = False
+
+    # opens the index, creating it (and importing an old index.json) on first use, so that
+    # importing this module never touches the disk
+    def _connect(self):
+        if not self._ready:
+            with self._lock:
+                if not self._ready:
+                    os.makedirs(self.root, exist_ok=True)
+                    conn = sqlite3.connect(self.index_path, timeout=30)
+                    try:
+                        conn.execute("PRAGMA journal_mode=WAL")
+                        conn.executescript(SCHEMA)
+                        self._import_legacy_index(conn)
+                    finally:
+                        conn.close()
+                    self._ready = True
+        conn = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def _import_legacy_index(self, conn):
+        legacy_path = os.path.join(self.root, LEGACY_INDEX_NAME)
+        try:
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return
+        except ValueError as e:
+            logging.error(f"Old archive index unreadable, not imported: {e}")
+            return
+        with conn:
+            for key, entry in index.get("entries", {}).items():
+                conn.execute(
+                    "INSERT OR IGNORE INTO entries (key, bill, stored, accessed) VALUES (?, ?, ?, ?)",
+                    (key, key.rsplit("/", 1)[0], entry["stored"], entry.get("accessed", entry["stored"])),
+                )
+                for name, part in entry["parts"].items():
+                    conn.execute(
+                        "INSERT OR IGNORE INTO parts (key, name, hash, content_type, size) VALUES (?, ?, ?, ?, ?)",
+                        (key, name, part["hash"], part["content_type"], part["size"]),
+                    )
+            conn.executemany(
+                "INSERT OR IGNORE INTO blobs (hash, size) VALUES (?, ?)", index.get("blobs", {}).items()
+            )
+        os.replace(legacy_path, legacy_path + ".imported")
+        logging.info(f"Imported {len(index.get('entries', {}))} archive entries from {LEGACY_INDEX_NAME}")
+
+    def _blob_path(self, digest):
+        return os.path.join(self.root, "objects", digest[:2], digest + ".gz")
+
+    # stores raw bytes and returns their sha256 hex digest
+    def put_blob(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with gzip.open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return digest
+
+    # starts a blob that is written to disk chunk by chunk while it downloads
+    def open_blob(self):
+        return BlobWriter(self)
+
+    # yields the raw bytes of a blob in chunks, so large documents never have to be held in memory
+    def iter_blob(self, digest, chunk_size=64 * 1024):
+        with gzip.open(self._blob_path(digest), "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    # returns the raw bytes for a digest, or None if it was evicted or never stored
+    def get_blob(self, digest):
+        try:
+            with gzip.open(self._blob_path(digest), "rb") as f:
+                return f.read()
+        except (FileNotFoundError, OSError) as e:
+            logging.debug(f"Archive blob {digest} unavailable: {e}")
+            return None
+
+    def record(self, congress, chamber, bill_number, version, parts, streamed=None):
+        """
+        Stores the given parts for one bill version.
+
+        parts maps a part name (summary, text_meta, html) to a (bytes, content_type) tuple, and
+        streamed maps a part name to a (digest, size, content_type) tuple for a blob already
+        written with open_blob. Parts already recorded for the version are kept unless they are
+        passed again.
+        """
+        stored = {}
+        for name, (data, content_type) in parts.items():
+            if name not in PARTS or data is None:
+                continue
+            stored[name] = (self.put_blob(data), content_type or "", len(data), data)
+        for name, (digest, size, content_type) in (streamed or {}).items():
+            if name in PARTS:
+                stored[name] = (digest, content_type or "", size, None)
+
+        key = make_key(congress, chamber, bill_number, version)
+        now = time.time()
+        conn = self._connect()
+        try:
+            # the write lock is held from here, so no evict runs between the checks below and the insert
+            conn.execute("BEGIN IMMEDIATE")
+            for name, (digest, content_type, size, data) in list(stored.items()):
+                if not os.path.exists(self._blob_path(digest)):
+                    # deduplicated against a blob another process evicted in the meantime
+                    if data is None:
+                        logging.warning(f"Archive blob for {key} {name} was evicted before it was recorded")
+                        del stored[name]
+                        continue
+                    self.put_blob(data)
+            conn.execute(
+                "INSERT INTO entries (key, bill, stored, accessed) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET accessed = excluded.accessed",
+                (key, make_key(congress, chamber, bill_number, "").rstrip("/"), now, now),
+            )
+            for name, (digest, content_type, size, _) in stored.items():
+                conn.execute(
+                    "INSERT OR REPLACE INTO parts (key, name, hash, content_type, size) VALUES (?, ?, ?, ?, ?)",
+                    (key, name, digest, content_type, size),
+                )
+                conn.execute("INSERT OR REPLACE INTO blobs (hash, size) VALUES (?, ?)", (digest, size))
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return key
+
+    def lookup(self, congress, chamber, bill_number, version=None):
+        """
+        Returns the index entry for a bill version, or the most recently stored version of
+        the bill when version is None. Returns None when nothing is archived.
+        """
+        conn = self._connect()
+        try:
+            if version is not None:
+                row = conn.execute(
+                    "SELECT key, stored FROM entries WHERE key = ?", (make_key(congress, chamber, bill_number, version),)
+                ).fetchone()
+            else:
+                row = conn.execute(
+                    "SELECT key, stored FROM entries WHERE bill = ? ORDER BY stored DESC LIMIT 1",
+                    (make_key(congress, chamber, bill_number, "").rstrip("/"),),
+                ).fetchone()
+            if row is None:
+                return None
+            key, stored = row
+            now = time.time()
+            conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            parts = {
+                name: {"hash": digest, "content_type": content_type, "size": size}
+                for name, digest, content_type, size in conn.execute(
+                    "SELECT name, hash, content_type, size FROM parts WHERE key = ?", (key,)
+                )
+            }
+            return {"stored": stored, "accessed": now, "parts": parts}
+        finally:
+            conn.close()
+
+    # loads one part of an entry, returning (bytes, content_type) or (None, None)
+    def load(self, entry, part):
+        if not entry or part not in entry["parts"]:
+            return None, None
+        info = entry["parts"][part]
+        return self.get_blob(info["hash"]), info["content_type"]
+
+    # every stored part with the given name, largest first (as {"hash", "content_type", "size"} dicts)
+    def list_parts(self, name):
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT DISTINCT hash, content_type, size FROM parts WHERE name = ? ORDER BY size DESC", (name,)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [{"hash": digest, "content_type": content_type, "size": size} for digest, content_type, size in rows]
+
+    def evict(self):
+        """
+        Applies the retention policy: entries older than max_age_days are dropped, then the
+        least recently used entries go until the referenced blobs fit in max_bytes.
+        Blobs no longer referenced by any entry are deleted from disk.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM entries WHERE stored < ?", (time.time() - self.max_age_days * 86400,))
+
+            # the live total is computed once, then the oldest entries are walked, each one freeing the
+            # blobs no newer entry shares, until the rest fits; they are deleted in one statement
+            refs = dict(conn.execute("SELECT hash, COUNT(*) FROM parts GROUP BY hash"))
+            sizes = dict(conn.execute("SELECT hash, size FROM blobs WHERE hash IN (SELECT hash FROM parts)"))
+            total = sum(sizes.values())
+            if total > self.max_bytes:
+                evicted, previous = 0, None
+                walk = conn.execute(
+                    "SELECT e.key, p.hash FROM entries e LEFT JOIN parts p ON p.key = e.key ORDER BY e.accessed, e.key"
+                )
+                for key, digest in walk:
+                    if key != previous:
+                        if total <= self.max_bytes:
+                            break
+                        evicted += 1
+                        previous = key
+                    if digest is not None:
+                        refs[digest] -= 1
+                        if not refs[digest]:
+                            total -= sizes.get(digest, 0)
+                walk.close()
+                conn.execute(
+                    "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed, key LIMIT ?)",
+                    (evicted,)
+                )
+
+            dead = [row[0] for row in conn.execute("SELECT hash FROM blobs WHERE hash NOT IN (SELECT hash FROM parts)")]
+            for digest in dead:
+                try:
+                    os.remove(self._blob_path(digest))
+                except FileNotFoundError:
+                    pass
+            conn.execute("DELETE FROM blobs WHERE hash NOT IN (SELECT hash FROM parts)")
+            kept = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        logging.info(f"Archive eviction removed {len(dead)} blob(s), {kept} entries kept")
+        return len(dead)
+
+
+class BlobWriter:
+    """Writes a blob through gzip while hashing it, then moves it to its content address."""
+
+    def __init__(self, archive):
+        self.archive = archive
+        self._hash = hashlib.sha256()
+        self.size = 0
+        self.digest = None
+        tmp_dir = os.path.join(archive.root, "objects")
+        os.makedirs(tmp_dir, exist_ok=True)
+        self._tmp_path = os.path.join(tmp_dir, f"incoming.{os.getpid()}.{threading.get_ident()}.tmp")
+        self._file = gzip.open(self._tmp_path, "wb")
+
+    def write(self, data):
+        self._hash.update(data)
+        self.size += len(data)
+        self._file.write(data)
+
+    def close(self):
+        self._file.close()
+        self.digest = self._hash.hexdigest()
+        path = self.archive._blob_path(self.digest)
+        if os.path.exists(path):
+            os.remove(self._tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self._tmp_path, path)
+        return self.digest
+
+    # drops a partial download
+    def discard(self):
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+        return False
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+# shared archive instance used by the fetch layer (and its threads)
+def get_archive():
+    global _archive
+    with _archive_lock:
+        if _archive is None:
+            _archive = SourceArchive()
+        return _archive
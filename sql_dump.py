@@ -0,0 +1,205 @@
+import os
+import re
+import time
+import logging
+from collections import Counter
+from config import DUMP_READ_CHUNK, DUMP_BATCH_BYTES, DUMP_COMMIT_BYTES, DUMP_PROGRESS_SECONDS
+
+# streaming loader for SQL dumps such as sources.dmp.sql (see db_utils.load_sources_sql)
+#
+# the dump is read in DUMP_READ_CHUNK pieces and split into statements by a small tokenizer that
+# knows about quoted strings, quoted identifiers and comments, so a ';' inside a value no longer
+# ends a statement. consecutive single table INSERTs are merged into multi-row INSERTs of up to
+# DUMP_BATCH_BYTES, the transaction is committed every DUMP_COMMIT_BYTES, and progress is logged
+# every DUMP_PROGRESS_SECONDS. memory use is bounded by the batch size, not the dump size.
+
+# what ends the current token, per tokenizer state
+# (None is plain SQL, quotes are strings / identifiers, "--" and "/*" are comments,
+# "/*!" is a MySQL conditional comment, which is code to MySQL and kept)
+TOKEN_PATTERNS = {
+    None: re.compile(r";|'|\"|`|--(?=\s)|#|/\*"),
+    "'": re.compile(r"\\.|'", re.DOTALL),
+    '"': re.compile(r'\\.|"', re.DOTALL),
+    "`": re.compile(r"`"),
+    "--": re.compile(r"\n"),
+    "/*": re.compile(r"\*/"),
+    "/*!": re.compile(r"\*/"),
+}
+
+# the longest token, which is how much has to be buffered before a match at the end can be trusted
+TOKEN_LOOKAHEAD = 3
+
+INSERT_RE = re.compile(r"(INSERT\s+(?:IGNORE\s+)?INTO\s+[`\"\w.]+\s*(?:\([^)]*\)\s*)?VALUES)\s*", re.IGNORECASE)
+ON_DUPLICATE_RE = re.compile(r"\bON\s+DUPLICATE\s+KEY\b", re.IGNORECASE)
+
+
+def iter_statements(stream, chunk_size=DUMP_READ_CHUNK):
+    """
+    Yields each statement of a SQL text stream, without the trailing ';' and with comments
+    (other than MySQL /*! ... */ ones) removed. A statement at the end without a ';' is
+    yielded too.
+    """
+    parts = []
+    buf = ""
+    pos = start = 0
+    state = None
+    eof = False
+
+    while True:
+        match = TOKEN_PATTERNS[state].search(buf, pos)
+        if match is None or (not eof and match.end() > len(buf) - TOKEN_LOOKAHEAD):
+            if eof:
+                break
+            # everything before keep has been scanned, the rest may be the start of a token
+            keep = max(pos, len(buf) - TOKEN_LOOKAHEAD) if match is None else match.start()
+            if state not in ("--", "/*"):
+                parts.append(buf[start:keep])
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buf = buf[keep:] + chunk
+            pos = start = 0
+            continue
+
+        token = match.group()
+        pos = match.end()
+        if state is None:
+            if token == ";":
+                parts.append(buf[start:match.start()])
+                statement = "".join(parts).strip()
+                parts = []
+                start = pos
+                if statement:
+                    yield statement
+            elif token in ("--", "#"):
+                parts.append(buf[start:match.start()])
+                state = "--"
+            elif token == "/*":
+                if buf.startswith("!", pos):
+                    state = "/*!"
+                else:
+                    parts.append(buf[start:match.start()])
+                    state = "/*"
+            else:
+                state = token
+        elif state in ("--", "/*"):
+            state = None
+            start = pos
+        elif state == "/*!" or token == state:
+            state = None
+        # anything else is an escape inside a quoted string, which is skipped over
+
+    if state not in ("--", "/*"):
+        parts.append(buf[start:])
+    statement = "".join(parts).strip()
+    if statement:
+        yield statement
+
+
+def batch_statements(statements, max_bytes=DUMP_BATCH_BYTES):
+    """
+    Merges runs of INSERTs into the same table (and columns) into multi-row INSERTs of up to
+    max_bytes. Yields (sql, originals), originals being the statements the sql was built from,
+    so a failing batch can be retried statement by statement.
+    """
+    prefix, values, originals, size = None, [], [], 0
+
+    for statement in statements:
+        match = INSERT_RE.match(statement)
+        if match and ON_DUPLICATE_RE.search(statement):
+            match = None
+        statement_prefix = match.group(1) if match else None
+
+        if values and (statement_prefix != prefix or size + len(statement) > max_bytes):
+            yield f"{prefix} {','.join(values)}", originals
+            prefix, values, originals, size = None, [], [], 0
+
+        if statement_prefix is None:
+            yield statement, [statement]
+            continue
+        prefix = statement_prefix
+        values.append(statement[match.end():])
+        originals.append(statement)
+        size += len(statement)
+
+    if values:
+        yield f"{prefix} {','.join(values)}", originals
+
+
+# the first part of a statement, for log lines
+def preview(statement, length=200):
+    statement = " ".join(statement[:length * 2].split())
+    return statement if len(statement) <= length else statement[:length] + "..."
+
+
+def load_dump(storage, path, fast=True):
+    """
+    Runs every statement of the SQL dump at path against the storage backend's database.
+    With fast, the backend's bulk_load_begin settings (no foreign key / unique checks, ...) are
+    applied for the load and bulk_load_end ones after it. Statements that fail are logged and
+    skipped, as before. Returns a Counter of statements run, batches executed, statements
+    skipped and commits.
+    """
+    stats = Counter()
+    total_bytes = os.path.getsize(path)
+    started = last_progress = time.monotonic()
+
+    conn = storage.connect()
+    cursor = conn.cursor()
+    try:
+        if fast:
+            for setting in storage.bulk_load_begin:
+                cursor.execute(setting)
+
+        with open(path, "r", encoding="utf-8") as f:
+            uncommitted = 0
+            for sql, originals in batch_statements(iter_statements(f)):
+                try:
+                    cursor.execute(sql)
+                    stats["statements"] += len(originals)
+                except Exception as e:
+                    if len(originals) == 1:
+                        logging.warning(f"skipped SQL statement due to error: {e}\n{preview(sql)}")
+                        stats["skipped"] += 1
+                    else:
+                        # one bad row fails the whole merged INSERT, so its statements are retried alone
+                        for statement in originals:
+                            try:
+                                cursor.execute(statement)
+                                stats["statements"] += 1
+                            except Exception as e:
+                                logging.warning(f"skipped SQL statement due to error: {e}\n{preview(statement)}")
+                                stats["skipped"] += 1
+                stats["batches"] += 1
+
+                uncommitted += len(sql)
+                if uncommitted >= DUMP_COMMIT_BYTES:
+                    conn.commit()
+                    stats["commits"] += 1
+                    uncommitted = 0
+
+                now = time.monotonic()
+                if now - last_progress >= DUMP_PROGRESS_SECONDS:
+                    last_progress = now
+                    done = f.buffer.tell()
+                    logging.info(
+                        f"Loading {path}: {done / 1024 ** 2:.0f} of {total_bytes / 1024 ** 2:.0f} MB "
+                        f"({done / max(total_bytes, 1):.0%}), {stats['statements']} statement(s), "
+                        f"{stats['statements'] / (now - started):.0f}/s"
+                    )
+
+        conn.commit()
+        stats["commits"] += 1
+    finally:
+        if fast:
+            try:
+                for setting in storage.bulk_load_end:
+                    cursor.execute(setting)
+            except Exception as e:
+                logging.warning(f"Could not restore settings after loading {path}: {e}")
+        conn.close()
+
+    logging.info(
+        f"Loaded {path} in {time.monotonic() - started:.1f}s: {stats['statements']} statement(s) "
+        f"in {stats['batches']} batch(es), {stats['skipped']} skipped, {stats['commits']} commit(s)"
+    )
+    return stats
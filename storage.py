@@ -0,0 +1,344 @@
+import os
+import logging
+from datetime import datetime
+from config import STORAGE_BACKEND, MYSQL_CONFIG_PATH, SQLITE_DB_PATH
+
+# queue (sum_queue), story and story_tag operations used by the pipeline
+#
+# the SQL is written once against DB-API connections; each backend only supplies the connection
+# and the few dialect differences (placeholder style, current-time functions, last url segment).
+#   mysql   the shared TNS server (configs/db_config.yml)
+#   sqlite  an embedded database file with the same tables, created on first use, for -t runs,
+#           local benchmarks and single-node deployments
+# the backend is chosen with STORAGE_BACKEND in config.py
+
+# column list and per-row placeholders shared by the single and batched story inserts
+STORY_COLUMNS = """(filename, uname, source, by_line, headline, story_txt, editor, invoice_tag,
+         date_sent, sent_to, wire_to, nexis_sent, factiva_sent,
+         status, content_date, last_action, orig_txt)"""
+STORY_ROW = "(%s, %s, %s, %s, %s, %s, '', '', {now}, '', '', NULL, NULL, %s, %s, {sysdate}, %s)"
+
+
+def story_row_params(story, today_str):
+    return (
+        story["filename"],
+        "T70-BM-BillSum",
+        story["a_id"],
+        "Bailey Malota",
+        story["headline"],
+        story["body"],
+        'D',
+        today_str,
+        story["sponsor_blob"]
+    )
+
+
+class Storage:
+    # dialect pieces, overridden per backend
+    now = "NOW()"
+    sysdate = "SYSDATE()"
+    bill_number = "CAST(SUBSTRING_INDEX(url, '/', -1) AS UNSIGNED)"
+    # session settings around a bulk dump load (see sql_dump.load_dump) and what restores them
+    bulk_load_begin = ()
+    bulk_load_end = ()
+
+    def connect(self):
+        raise NotImplementedError
+
+    # queries are written with %s placeholders, backends using another style rewrite them here
+    def sql(self, query):
+        return query
+
+    # runs one statement on a fresh connection and commits it
+    def _execute(self, query, params=()):
+        conn = self.connect()
+        try:
+            conn.cursor().execute(self.sql(query), params)
+            conn.commit()
+        finally:
+            conn.close()
+
+    # up to limit house or senate urls that are still pending, oldest first (so runs walk the queue in a fixed order)
+    def load_pending_urls(self, chamber, limit):
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.sql(f"""
+                SELECT id, url FROM sum_queue
+                WHERE status = 'pending' AND chamber = %s
+                ORDER BY id
+                LIMIT {int(limit)}
+            """), (chamber,))
+            return cursor.fetchall()
+        finally:
+            conn.close()
+
+    def set_url_status(self, url_id, status):
+        self._execute("UPDATE sum_queue SET status = %s WHERE id = %s", (status, url_id))
+
+    def link_story_to_url(self, url_id, s_id):
+        self._execute("UPDATE sum_queue SET story_id = %s WHERE id = %s", (s_id, url_id))
+
+    def add_note_to_url(self, url_id, message):
+        self._execute("UPDATE sum_queue SET notes = %s WHERE id = %s", (message, url_id))
+
+    # the highest bill number queued for a chamber (0 for an empty queue)
+    def max_bill_number(self, chamber):
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.sql(f"SELECT MAX({self.bill_number}) FROM sum_queue WHERE chamber = %s"), (chamber,))
+            result = cursor.fetchone()[0]
+            return int(result) if result else 0
+        finally:
+            conn.close()
+
+    # adds bill urls to the queue as pending (a url that fails to insert is logged and skipped)
+    def insert_urls(self, chamber, urls):
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            for url in urls:
+                try:
+                    cursor.execute(self.sql("INSERT INTO sum_queue (url, chamber, status) VALUES (%s, %s, 'pending')"), (url, chamber))
+                    logging.debug(f"Insert success: {url}")
+                except Exception as e:
+                    logging.debug(f"Failed to insert {url}: {e}")
+            conn.commit()
+        finally:
+            conn.close()
+
+    # queues a single url unless it is already queued, returns its (id, status)
+    def queue_url(self, chamber, url):
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.sql("SELECT id, status FROM sum_queue WHERE url = %s"), (url,))
+            row = cursor.fetchone()
+            if row:
+                return row[0], row[1]
+            cursor.execute(self.sql("INSERT INTO sum_queue (url, chamber, status) VALUES (%s, %s, 'pending')"), (url, chamber))
+            conn.commit()
+            return cursor.lastrowid, "pending"
+        finally:
+            conn.close()
+
+    def story_exists(self, filename):
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.sql("SELECT COUNT(*) FROM story WHERE filename = %s"), (filename,))
+            return cursor.fetchone()[0] > 0
+        finally:
+            conn.close()
+
+    # inserts a group of finished stories and their state tags in a single transaction
+    def insert_stories(self, stories):
+        """
+        Each story is a dict with filename, headline, body, a_id, sponsor_blob and tag_ids.
+
+        Returns a list aligned with stories holding the new story id, False for a duplicate
+        filename, or None if that story could not be inserted. A story that fails is rolled back
+        on its own and the rest of the batch is still committed.
+        """
+        results = [None] * len(stories)
+        if not stories:
+            return results
+
+        row = STORY_ROW.format(now=self.now, sysdate=self.sysdate)
+        conn = None
+        try:
+            conn = self.connect()
+            cursor = conn.cursor()
+
+            # one duplicate check for the whole batch (and for repeats inside the batch)
+            filenames = [story["filename"] for story in stories]
+            cursor.execute(
+                self.sql(f"SELECT filename FROM story WHERE filename IN ({', '.join(['%s'] * len(filenames))})"),
+                filenames
+            )
+            existing = {r[0] for r in cursor.fetchall()}
+            todo = []
+            for i, story in enumerate(stories):
+                if story["filename"] in existing:
+                    logging.info(f"Duplicate filename, skipping: {story['filename']}")
+                    results[i] = False
+                else:
+                    existing.add(story["filename"])
+                    todo.append(i)
+
+            today_str = datetime.now().strftime('%Y-%m-%d')
+            inserted = []
+            if todo:
+                # fast path: one multi-row insert for every new story
+                params = [p for i in todo for p in story_row_params(stories[i], today_str)]
+                try:
+                    cursor.execute("SAVEPOINT story_batch")
+                    cursor.execute(
+                        self.sql(f"INSERT INTO story\n{STORY_COLUMNS}\nVALUES {', '.join([row] * len(todo))}"),
+                        params
+                    )
+                    inserted = todo
+                except Exception as err:
+                    # isolating the bad row(s): retry one story at a time, each behind its own savepoint
+                    logging.warning(f"Batch story insert failed, retrying row by row: {err}")
+                    cursor.execute("ROLLBACK TO SAVEPOINT story_batch")
+                    for i in todo:
+                        try:
+                            cursor.execute("SAVEPOINT story_row")
+                            cursor.execute(
+                                self.sql(f"INSERT INTO story\n{STORY_COLUMNS}\nVALUES {row}"),
+                                story_row_params(stories[i], today_str)
+                            )
+                            inserted.append(i)
+                        except Exception as row_err:
+                            cursor.execute("ROLLBACK TO SAVEPOINT story_row")
+                            logging.error(f"DB insert failed for {stories[i]['filename']}: {row_err}")
+
+            if inserted:
+                # auto increment ids of a multi-row insert aren't guaranteed to be consecutive,
+                # so the ids are read back by filename (unique, checked above)
+                names = [stories[i]["filename"] for i in inserted]
+                cursor.execute(
+                    self.sql(f"SELECT id, filename FROM story WHERE filename IN ({', '.join(['%s'] * len(names))})"),
+                    names
+                )
+                ids = {filename: s_id for s_id, filename in cursor.fetchall()}
+
+                tag_rows = []
+                for i in inserted:
+                    results[i] = ids[stories[i]["filename"]]
+                    tag_rows.extend((results[i], tag_id) for tag_id in stories[i]["tag_ids"].values())
+
+                # insert state tags into story_tag
+                if tag_rows:
+                    cursor.executemany(self.sql("INSERT INTO story_tag (id, tag_id) VALUES (%s, %s)"), tag_rows)
+
+            conn.commit()
+            logging.info(f"Inserted {len(inserted)} of {len(stories)} stor(ies) in one batch")
+            return results
+        except Exception as err:
+            logging.error(f"Batch DB insert failed: {err}")
+            return [False if r is False else None for r in results]
+        finally:
+            if conn:
+                conn.close()
+
+    # marks inserted bills processed and links them to their stories in one statement
+    def link_stories_to_urls(self, links):
+        """links is a list of (url_id, s_id) pairs."""
+        if not links:
+            return
+        conn = self.connect()
+        try:
+            conn.cursor().executemany(
+                self.sql("UPDATE sum_queue SET status = 'processed', story_id = %s WHERE id = %s"),
+                [(s_id, url_id) for url_id, s_id in links]
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+
+class MySQLStorage(Storage):
+    bulk_load_begin = ("SET foreign_key_checks = 0", "SET unique_checks = 0", "SET autocommit = 0")
+    bulk_load_end = ("SET unique_checks = 1", "SET foreign_key_checks = 1")
+
+    def __init__(self, yml_path=MYSQL_CONFIG_PATH):
+        self.yml_path = yml_path
+
+    def connect(self):
+        # imported on first use so that runs which never touch the DB (-t, argument errors) don't pay for them
+        import yaml
+        import mysql.connector
+
+        with open(self.yml_path, "r") as yml_file:
+            config = yaml.load(yml_file, Loader=yaml.FullLoader)
+        return mysql.connector.connect(
+            host=config["host"],
+            user=config["user"],
+            password=config["password"],
+            database=config["database"]
+        )
+
+
+# the subset of the TNS schema the pipeline reads and writes
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sum_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL UNIQUE,
+    chamber TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    story_id INTEGER,
+    notes TEXT
+);
+CREATE INDEX IF NOT EXISTS sum_queue_pending ON sum_queue (chamber, status);
+CREATE TABLE IF NOT EXISTS story (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename TEXT NOT NULL UNIQUE,
+    uname TEXT,
+    source INTEGER,
+    by_line TEXT,
+    headline TEXT,
+    story_txt TEXT,
+    editor TEXT,
+    invoice_tag TEXT,
+    date_sent TEXT,
+    sent_to TEXT,
+    wire_to TEXT,
+    nexis_sent TEXT,
+    factiva_sent TEXT,
+    status TEXT,
+    content_date TEXT,
+    last_action TEXT,
+    orig_txt TEXT
+);
+CREATE TABLE IF NOT EXISTS story_tag (
+    id INTEGER NOT NULL,
+    tag_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS story_tag_id ON story_tag (id);
+"""
+
+
+class SQLiteStorage(Storage):
+    now = "datetime('now', 'localtime')"
+    sysdate = "datetime('now', 'localtime')"
+    # everything after the last '/' of the url
+    bill_number = "CAST(replace(url, rtrim(url, replace(url, '/', '')), '') AS INTEGER)"
+    bulk_load_begin = ("PRAGMA foreign_keys = OFF", "PRAGMA synchronous = OFF")
+    bulk_load_end = ("PRAGMA synchronous = FULL",)
+
+    def __init__(self, path=SQLITE_DB_PATH):
+        self.path = path
+        self._bootstrapped = False
+
+    def sql(self, query):
+        return query.replace("%s", "?")
+
+    def connect(self):
+        import sqlite3
+
+        if not self._bootstrapped:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._bootstrapped:
+            conn.executescript(SQLITE_SCHEMA)
+            self._bootstrapped = True
+        return conn
+
+
+BACKENDS = {"mysql": MySQLStorage, "sqlite": SQLiteStorage}
+
+_storage = None
+
+# the configured storage backend, shared by every caller
+def get_storage():
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND not in BACKENDS:
+            raise ValueError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r} (expected one of {', '.join(BACKENDS)})")
+        _storage = BACKENDS[STORAGE_BACKEND]()
+    return _storage
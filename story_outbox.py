@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+from config import OUTBOX_PATH
+
+# local durable record of everything we paid OpenAI for
+#
+# generations: raw model output keyed by sha256(model, prompt), so an identical prompt is never sent twice
+# outbox:      finished stories waiting to be written into the TNS story/story_tag tables
+#
+# stories are queued here before insert_story is attempted, and only leave the queue once the
+# insert succeeded, so a DB failure never costs a second generation
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS generations (
+    prompt_hash TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    result TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url_id INTEGER,
+    filename TEXT NOT NULL,
+    headline TEXT NOT NULL,
+    body TEXT NOT NULL,
+    a_id INTEGER NOT NULL,
+    sponsor_blob TEXT,
+    tag_ids TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    story_id INTEGER,
+    created REAL NOT NULL,
+    delivered REAL
+);
+"""
+
+# opens the outbox database, creating it on first use
+def get_outbox_connection(path=OUTBOX_PATH):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.executescript(SCHEMA)
+    return conn
+
+def prompt_hash(model, prompt):
+    return hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).hexdigest()
+
+# returns the stored model output for an identical (model, prompt), or None
+def get_generation(model, prompt):
+    conn = get_outbox_connection()
+    try:
+        row = conn.execute(
+            "SELECT result FROM generations WHERE prompt_hash = ?", (prompt_hash(model, prompt),)
+        ).fetchone()
+        return row[0] if row else None
+    finally:
+        conn.close()
+
+# persists raw model output as soon as the api call returns
+def save_generation(model, prompt, result):
+    conn = get_outbox_connection()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO generations (prompt_hash, model, result, created) VALUES (?, ?, ?, ?)",
+                (prompt_hash(model, prompt), model, result, time.time())
+            )
+    finally:
+        conn.close()
+
+# forgets the stored output for a (model, prompt), e.g. one whose story was rejected
+def delete_generation(model, prompt):
+    conn = get_outbox_connection()
+    try:
+        with conn:
+            conn.execute("DELETE FROM generations WHERE prompt_hash = ?", (prompt_hash(model, prompt),))
+    finally:
+        conn.close()
+
+# queues a finished story for insertion and returns its outbox id
+def enqueue_story(url_id, filename, headline, body, a_id, sponsor_blob, tag_ids):
+    conn = get_outbox_connection()
+    try:
+        with conn:
+            cursor = conn.execute(
+                """
+                INSERT INTO outbox (url_id, filename, headline, body, a_id, sponsor_blob, tag_ids, created)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (url_id, filename, headline, body, a_id, sponsor_blob, json.dumps(tag_ids), time.time())
+            )
+        return cursor.lastrowid
+    finally:
+        conn.close()
+
+# marks a queued story as written to the TNS DB
+def mark_delivered(outbox_id, s_id):
+    conn = get_outbox_connection()
+    try:
+        with conn:
+            conn.execute(
+                "UPDATE outbox SET status = 'delivered', story_id = ?, delivered = ? WHERE id = ?",
+                (s_id, time.time(), outbox_id)
+            )
+    finally:
+        conn.close()
+
+# returns all stories still waiting for insertion, oldest first
+def pending_stories():
+    conn = get_outbox_connection()
+    conn.row_factory = sqlite3.Row
+    try:
+        rows = conn.execute("SELECT * FROM outbox WHERE status = 'pending' ORDER BY id").fetchall()
+        stories = []
+        for row in rows:
+            story = dict(row)
+            story["tag_ids"] = json.loads(story["tag_ids"])
+            stories.append(story)
+        return stories
+    finally:
+        conn.close()
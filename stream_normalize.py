@@ -0,0 +1,161 @@
+import re
+import sys
+import html
+import codecs
+import logging
+import requests
+from cleanup_text import transliterate, SURROGATES
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# same patterns as url_processing.strip_tags and the url stripping in generate_story
+TAG_RE = re.compile(r"<[^>]+>")
+URL_RE = re.compile(r"https://www\.congress\.gov[^\s]*")
+
+# characters that end an html entity (see html.unescape)
+ENTITY_END = set("\t\n\f <&;")
+MAX_ENTITY = 33
+
+# a stray "<" with no closing ">" is given up on after this many characters, so it can't pin the whole document
+MAX_TAG_HOLD = 64 * 1024
+MAX_WORD_HOLD = 64 * 1024
+
+
+class StreamingNormalizer:
+    """
+    Incremental version of html.unescape(strip_tags(html_text)), optionally followed by the
+    congress.gov url stripping and the ASCII transliteration done by cleanup_text.
+
+    Text is fed in chunks as it comes off the socket. Each stage only holds back the few
+    characters that could still change meaning once the next chunk arrives (a partial tag,
+    entity, url or section sign), so memory stays at the normalized output plus a small window.
+    """
+
+    def __init__(self, strip_urls=False, ascii_only=False):
+        self.strip_urls = strip_urls
+        self.ascii_only = ascii_only
+        self.parts = []
+        self.size = 0
+        self.largest_window = 0
+        self._tag_hold = ""
+        self._ws_hold = ""
+        self._started = False
+        self._entity_hold = ""
+        self._word_hold = ""
+        self._char_hold = ""
+
+    def feed(self, chunk):
+        if chunk:
+            self._emit(self._strip_tags(chunk, final=False), final=False)
+
+    def finish(self):
+        """Flushes every stage and returns the normalized text."""
+        self._emit(self._strip_tags("", final=True), final=True)
+        text = "".join(self.parts)
+        self.parts = [text]
+        return text
+
+    # tag stage: drops complete tags and holds back an unterminated "<..."
+    def _strip_tags(self, chunk, final):
+        text = TAG_RE.sub("", self._tag_hold + chunk)
+        self._tag_hold = ""
+        if not final:
+            start = text.find("<", text.rfind(">") + 1)
+            if start != -1 and len(text) - start <= MAX_TAG_HOLD:
+                text, self._tag_hold = text[:start], text[start:]
+
+        # strip_tags strips its result before it is unescaped, so edge whitespace is removed here
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._started = True
+        text = self._ws_hold + text
+        if final:
+            self._ws_hold = ""
+            return text.rstrip()
+        end = len(text.rstrip())
+        text, self._ws_hold = text[:end], text[end:]
+        self.largest_window = max(self.largest_window, len(self._tag_hold) + len(self._ws_hold))
+        return text
+
+    def _emit(self, text, final):
+        # entity stage: holds back a trailing "&..." that the next chunk could still complete
+        text = self._entity_hold + text
+        self._entity_hold = ""
+        if not final:
+            start = text.rfind("&")
+            if start != -1 and len(text) - start <= MAX_ENTITY and not ENTITY_END.intersection(text[start + 1:]):
+                text, self._entity_hold = text[:start], text[start:]
+        text = html.unescape(text)
+
+        # url stage: urls never contain whitespace, so only a trailing partial word is held back
+        if self.strip_urls:
+            text = self._word_hold + text
+            self._word_hold = ""
+            if not final:
+                end = len(text)
+                while end > 0 and not text[end - 1].isspace():
+                    end -= 1
+                if len(text) - end <= MAX_WORD_HOLD:
+                    text, self._word_hold = text[:end], text[end:]
+            text = URL_RE.sub("", text)
+
+        # transliteration stage: section signs pair up left to right, so an odd trailing run
+        # ends in one that the next chunk could still turn into a double section sign
+        if self.ascii_only:
+            text = SURROGATES.sub("", self._char_hold + text)
+            self._char_hold = ""
+            if not final and (len(text) - len(text.rstrip("§"))) % 2:
+                text, self._char_hold = text[:-1], text[-1:]
+            text = transliterate(text)
+
+        if text:
+            self.parts.append(text)
+            self.size += len(text)
+
+
+# returns an incremental decoder matching how requests' response.text decodes the given content type
+def incremental_decoder(content_type):
+    encoding = requests.utils.get_encoding_from_headers({"content-type": content_type or ""}) or "utf-8"
+    try:
+        return codecs.getincrementaldecoder(encoding)(errors="replace")
+    except LookupError:
+        return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+
+# normalizes an iterable of raw html byte chunks
+def normalize_chunks(chunks, content_type, strip_urls=False, ascii_only=False):
+    decoder = incremental_decoder(content_type)
+    normalizer = StreamingNormalizer(strip_urls, ascii_only)
+    for chunk in chunks:
+        normalizer.feed(decoder.decode(chunk))
+    normalizer.feed(decoder.decode(b"", final=True))
+    return normalizer.finish()
+
+
+# normalizes a formatted text blob stored in the source archive at archive_root (also run in the cpu
+# pool's worker processes, which read the blob themselves so the html never has to be pickled)
+def normalize_blob(archive_root, digest, content_type, strip_urls=False, ascii_only=False):
+    from source_archive import SourceArchive
+
+    return normalize_chunks(SourceArchive(archive_root).iter_blob(digest), content_type, strip_urls, ascii_only)
+
+
+# peak resident set size of this process in MB (None where it can't be measured)
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS reports bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def log_peak_rss(label):
+    peak = peak_rss_mb()
+    if peak is not None:
+        logging.info(f"Peak RSS after {label}: {peak:.1f} MB")
+    return peak
@@ -0,0 +1,107 @@
+import os
+import json
+import html
+import logging
+import requests
+from http_utils import http_get
+from bill_work import CURRENT_CONGRESS, parse_bill_url
+from url_processing import strip_tags
+from config import DISCOVERY_STATE_PATH
+
+# finds out which queued bills have a CRS summary by paging through the congress-wide
+# summaries listing (filtered by update date since the last checkpoint), instead of asking
+# /bill/{congress}/{type}/{number}/summaries for every pending bill every day
+#
+# state file: {"checkpoints": {"hr": "<updateDate>"}, "summaries": {"hr": {"1234": {"updateDate": ..., "words": 512}}}}
+
+SUMMARIES_API = "https://api.congress.gov/v3/summaries"
+
+
+def load_state(path=DISCOVERY_STATE_PATH):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"checkpoints": {}, "summaries": {}}
+
+
+def save_state(state, path=DISCOVERY_STATE_PATH):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def discover_summaries(bill_type, congress=CURRENT_CONGRESS, state=None):
+    """
+    Pages through every summary of the given bill type updated since the last checkpoint and
+    records each bill's latest summary (update date and word count) in the state.
+    Returns the set of bill numbers whose summary is new or updated, or None if the listing failed.
+    """
+    with open("utils/govkey.txt") as f:
+        api_key = f.read().strip()
+
+    state = state if state is not None else load_state()
+    known = state["summaries"].setdefault(bill_type, {})
+    checkpoint = state["checkpoints"].get(bill_type)
+
+    params = {"api_key": api_key, "limit": 250, "sort": "updateDate asc"}
+    if checkpoint:
+        params["fromDateTime"] = checkpoint
+
+    changed = set()
+    newest = checkpoint
+    next_url = f"{SUMMARIES_API}/{congress}/{bill_type}"
+    pages = 0
+    while next_url:
+        try:
+            response = http_get(next_url, params=params)
+            response.raise_for_status()
+            data = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logging.error(f"Summary discovery failed for {bill_type} at {next_url}: {e}")
+            return None
+        pages += 1
+
+        for item in data.get("summaries", []):
+            number = str(item.get("bill", {}).get("number", ""))
+            updated = item.get("updateDate") or ""
+            if not number:
+                continue
+            if number not in known or updated >= known[number]["updateDate"]:
+                words = len(html.unescape(strip_tags(item.get("text", ""))).split())
+                if known.get(number) != {"updateDate": updated, "words": words}:
+                    changed.add(number)
+                known[number] = {"updateDate": updated, "words": words}
+            if newest is None or updated > newest:
+                newest = updated
+
+        # the next link already carries the filters and offset, only the key has to be passed again
+        next_url = data.get("pagination", {}).get("next")
+        params = {"api_key": api_key}
+
+    if newest:
+        state["checkpoints"][bill_type] = newest
+    logging.info(f"Summary discovery ({bill_type}): {pages} page(s), {len(changed)} new or updated summar(ies)")
+    return changed
+
+
+def filter_discovered(rows, is_senate, min_words=300, state=None):
+    """
+    Splits queued (url_id, url) rows into the ones worth a full fetch (a summary of at least
+    min_words is known) and the rest. Returns (ready, waiting).
+    """
+    state = state if state is not None else load_state()
+    known = state["summaries"].get("s" if is_senate else "hr", {})
+    ready, waiting = [], []
+    for row in rows:
+        number = parse_bill_url(row[1], is_senate).number
+        summary = known.get(number)
+        if summary is not None and summary["words"] >= min_words:
+            ready.append(row)
+        else:
+            waiting.append(row)
+    return ready, waiting
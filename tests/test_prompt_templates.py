@@ -0,0 +1,24 @@
+from config import PROMPT_CACHE_MIN_TOKENS
+from prompt_templates import STATIC_PREFIX, build_messages, prompt_text
+
+
+def test_static_prefix_is_long_enough_to_be_cached():
+    # every whitespace-separated word is at least one token, so this is a lower bound on the prefix's tokens
+    for prefix in STATIC_PREFIX.values():
+        assert len(prefix.split()) >= PROMPT_CACHE_MIN_TOKENS
+
+
+def test_bills_of_a_chamber_share_the_system_message():
+    first = build_messages(True, 250, "Doe", "Jane Doe, D-NY", "March 4, 2025", "Summary one.", "Text one.")
+    second = build_messages(True, 400, "Roe", "Richard Roe, R-TX", "May 5, 2025", "Summary two.", "Text two.")
+    assert first[0] == second[0] == {"role": "system", "content": STATIC_PREFIX[True]}
+    assert prompt_text(first) != prompt_text(second)
+
+
+def test_bill_values_are_spelled_out_in_the_instructions():
+    messages = build_messages(False, 250, "Roe", "Richard Roe, R-TX", "May 5, 2025", "Summary.", "Text.")
+    details = messages[1]["content"]
+    assert "Write around a 250-word news story about this House bill." in details
+    assert "Rep. Roe: [bill title here] Analyzed by CRS" in details
+    assert "introduced by Rep. Richard Roe, R-TX on May 5, 2025, has been analyzed" in details
+    assert "{" not in messages[0]["content"]
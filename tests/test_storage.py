@@ -0,0 +1,121 @@
+import os
+import uuid
+import pytest
+from storage import MySQLStorage, SQLiteStorage
+
+# the same tests run against every storage backend: SQLite always, MySQL only when
+# STORAGE_TEST_MYSQL_CONFIG names a db_config.yml for a scratch database (never the TNS one,
+# the tests write to sum_queue, story and story_tag)
+MYSQL_CONFIG = os.environ.get("STORAGE_TEST_MYSQL_CONFIG")
+
+
+def mysql_storage():
+    if not MYSQL_CONFIG:
+        pytest.skip("STORAGE_TEST_MYSQL_CONFIG not set")
+    pytest.importorskip("mysql.connector")
+    pytest.importorskip("yaml")
+    return MySQLStorage(MYSQL_CONFIG)
+
+
+@pytest.fixture(params=["sqlite", "mysql"])
+def storage(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteStorage(str(tmp_path / "tns.db"))
+    return mysql_storage()
+
+
+# urls and filenames unique to one test, so runs against a shared MySQL database don't collide
+@pytest.fixture
+def token(storage):
+    token = uuid.uuid4().hex[:12]
+    yield token
+    if isinstance(storage, MySQLStorage):
+        conn = storage.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM story_tag WHERE id IN (SELECT id FROM story WHERE filename LIKE %s)", (f"%{token}%",))
+            cursor.execute("DELETE FROM story WHERE filename LIKE %s", (f"%{token}%",))
+            cursor.execute("DELETE FROM sum_queue WHERE url LIKE %s", (f"%{token}%",))
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def query(storage, sql, params=()):
+    conn = storage.connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(storage.sql(sql), params)
+        return cursor.fetchall()
+    finally:
+        conn.close()
+
+
+def story(filename, tag_ids=None):
+    return {
+        "filename": filename,
+        "headline": f"Headline of {filename}",
+        "body": f"Body of {filename}",
+        "a_id": 1,
+        "sponsor_blob": "Sen. Doe, D-NY",
+        "tag_ids": tag_ids or {},
+    }
+
+
+def mine(rows, token):
+    return [row for row in rows if token in row[1]]
+
+
+def test_queue_url_and_status(storage, token):
+    first = f"https://www.congress.gov/bill/119th-congress/senate-bill/{token}/1"
+    second = f"https://www.congress.gov/bill/119th-congress/senate-bill/{token}/2"
+
+    first_id, status = storage.queue_url("senate", first)
+    assert status == "pending"
+    # queueing the same url again returns the row already there
+    assert storage.queue_url("senate", first) == (first_id, "pending")
+    second_id, _ = storage.queue_url("senate", second)
+    storage.queue_url("house", f"https://www.congress.gov/bill/119th-congress/house-bill/{token}/1")
+
+    pending = mine(storage.load_pending_urls("senate", 10_000), token)
+    assert pending == [(first_id, first), (second_id, second)]
+
+    storage.set_url_status(first_id, "processed")
+    assert mine(storage.load_pending_urls("senate", 10_000), token) == [(second_id, second)]
+    assert storage.queue_url("senate", first) == (first_id, "processed")
+
+
+def test_insert_stories_and_duplicates(storage, token):
+    names = [f"$H billSums-250310-s{token}{n}" for n in range(3)]
+    storage.insert_stories([story(names[0])])
+
+    results = storage.insert_stories([
+        story(names[0]),
+        story(names[1], {"NY": 11, "CA": 12}),
+        story(names[2]),
+        # repeated inside the batch
+        story(names[1]),
+    ])
+    assert results[0] is False
+    assert isinstance(results[1], int) and isinstance(results[2], int)
+    assert results[3] is False
+    assert storage.story_exists(names[1])
+
+    stored = dict(query(storage, "SELECT filename, id FROM story WHERE filename LIKE %s", (f"%{token}%",)))
+    assert stored[names[1]] == results[1] and stored[names[2]] == results[2]
+    assert len(stored) == 3
+    tags = query(storage, "SELECT tag_id FROM story_tag WHERE id = %s ORDER BY tag_id", (results[1],))
+    assert [tag_id for (tag_id,) in tags] == [11, 12]
+    assert storage.insert_stories([]) == []
+
+
+def test_link_stories_to_urls(storage, token):
+    url_ids = [storage.queue_url("house", f"https://www.congress.gov/bill/119th-congress/house-bill/{token}/{n}")[0] for n in range(2)]
+    s_ids = storage.insert_stories([story(f"$H billSumh-250310-hr{token}{n}") for n in range(2)])
+
+    storage.link_stories_to_urls(list(zip(url_ids, s_ids)))
+    storage.link_stories_to_urls([])
+
+    rows = query(storage, "SELECT id, status, story_id FROM sum_queue WHERE url LIKE %s ORDER BY id", (f"%{token}%",))
+    assert rows == [(url_ids[0], "processed", s_ids[0]), (url_ids[1], "processed", s_ids[1])]
+    assert mine(storage.load_pending_urls("house", 10_000), token) == []
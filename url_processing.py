@@ -1,8 +1,16 @@
 import re
 import html
+import json
 import logging
 import requests
 import xml.etree.ElementTree as ET
+from urllib.parse import urlparse
+from source_archive import get_archive
+from http_utils import http_get
+from bill_work import BillWork
+from stream_normalize import normalize_chunks, normalize_blob, log_peak_rss
+from cpu_pool import get_offloader
+from config import HTML_CHUNK_SIZE, TRANSLITERATE_BILL_TEXT
 
 # this is used to access summary and text data for the bill intros
 API_BASE = "https://api.congress.gov/v3/bill"
@@ -11,38 +19,26 @@ API_BASE = "https://api.congress.gov/v3/bill"
 def strip_tags(html_text):
     return re.sub(r"<[^>]+>", "", html_text).strip()
 
-# gets the text field and the summary field from a given bill intro
-def getTextandSummary(url, is_senate):
-    # getting the congress.gov api key
-    with open("utils/govkey.txt") as f:
-        api_key = f.read().strip()
+# turns formatted text html (an iterable of byte chunks) into the plain bill text fed to the prompt
+def normalize_bill_html(chunks, content_type):
+    return normalize_chunks(chunks, content_type, strip_urls=True, ascii_only=TRANSLITERATE_BILL_TEXT)
 
-    congress = 119 # to be changed when a new congress starts
-    parts = url.rstrip("/").split("/")
-    bill_number = parts[-1]
-    if bill_number == "text":  # handle trailing /text URLs
-        bill_number = parts[-2]
-    print("Bill number:", bill_number)
+# the same for formatted text html already in the source archive, done in the cpu pool when it is big enough to be worth it
+def normalize_archived_html(digest, size, content_type):
+    return get_offloader().run(
+        size, normalize_blob, get_archive().root, digest, content_type, True, TRANSLITERATE_BILL_TEXT
+    )
 
-    # setting up headers and variables based off of whether it is a house or senate bill
-    bill_type = "s" if is_senate else "hr"
-    headers = {"X-API-Key": api_key}
+# parses a summaries api response (json or xml) into the summary text and the date it was produced
+def parse_summary_response(body, content_type, bill_number):
     summary_text = None
-    bill_text = None
     summary_date = None
 
-    # getting the summary in two different ways (Because the congress.gov DB is inconcistant in its way of adding data)
-    # The data will either be available via json or xml format, which isnt known at the time of scraping
-
-    # setting up url and response variables
-    summary_url = f"{API_BASE}/{congress}/{bill_type}/{bill_number}/summaries"
-    summary_resp = requests.get(summary_url, headers=headers)
-
     # if json available, then take json
-    if summary_resp.ok and summary_resp.headers.get("Content-Type", "").startswith("application/json"):
-        if summary_resp.content.strip():
+    if content_type.startswith("application/json"):
+        if body.strip():
             try:
-                data = summary_resp.json()
+                data = json.loads(body)
                 summaries = data.get("summaries", [])
                 if summaries:
                     summary_date = summaries[-1].get("actionDate") # this gets the date that the summary was produced
@@ -53,10 +49,10 @@ def getTextandSummary(url, is_senate):
                 print(f"Error parsing summary JSON for {bill_number}: {e}")
         else:
             print(f"Empty summary response for {bill_number}")
-    # if xml available, then take json
-    elif summary_resp.ok and summary_resp.headers.get("Content-Type", "").startswith("application/xml"):
+    # if xml available, then take xml
+    elif content_type.startswith("application/xml"):
         try:
-            root = ET.fromstring(summary_resp.content)
+            root = ET.fromstring(body)
             summaries = root.findall(".//summary")
             if summaries:
                 latest = summaries[-1]
@@ -70,21 +66,21 @@ def getTextandSummary(url, is_senate):
     else:
         print(f"Summary fetch failed for {bill_number}")
 
-    # The same thing occurs for the bill intro text, sometimes it is in json or xml format
-
-    # setting up bill intro get request and response variables
-    text_url = f"{API_BASE}/{congress}/{bill_type}/{bill_number}/text"
-    text_resp = requests.get(text_url, headers=headers)
+    return summary_text, summary_date
 
+# parses a text versions api response (json or xml) into the formatted text url and a version label
+def parse_text_response(body, content_type, bill_number):
     formatted_url = None
+    version = None
 
     # if json version of text is availble, use it
-    if text_resp.ok and text_resp.headers.get("Content-Type", "").startswith("application/json"):
-        if text_resp.content.strip():
+    if content_type.startswith("application/json"):
+        if body.strip():
             try:
-                data = text_resp.json()
+                data = json.loads(body)
                 versions = data.get("textVersions", [])
                 if versions:
+                    version = f"{versions[0].get('type')}@{versions[0].get('date')}"
                     for fmt in versions[0].get("formats", []):
                         if fmt.get("type") == "Formatted Text":
                             formatted_url = fmt.get("url")
@@ -94,11 +90,12 @@ def getTextandSummary(url, is_senate):
         else:
             print(f"Empty bill text response for {bill_number}")
     # if xml version of text is availble, use it
-    elif text_resp.ok and text_resp.headers.get("Content-Type", "").startswith("application/xml"):
+    elif content_type.startswith("application/xml"):
         try:
-            root = ET.fromstring(text_resp.content)
+            root = ET.fromstring(body)
             item = root.find(".//textVersions/item")
             if item is not None:
+                version = f"{item.findtext('type')}@{item.findtext('date')}"
                 formats = item.findall(".//formats/item")
                 for fmt in formats:
                     type_elem = fmt.find("type")
@@ -112,13 +109,137 @@ def getTextandSummary(url, is_senate):
     else:
         print(f"Text metadata fetch failed for {bill_number}")
 
+    # the GPO file name (e.g. BILLS-119s1001is.htm) already encodes the text version, so prefer it
+    if formatted_url:
+        version = urlparse(formatted_url).path.rstrip("/").split("/")[-1]
+
+    return formatted_url, version
+
+# rebuilds getTextandSummary's output from the latest archived copy of a bill (no network access)
+def load_archived_bill(congress, chamber, bill_number):
+    archive = get_archive()
+    entry = archive.lookup(congress, chamber, bill_number)
+    if entry is None:
+        print(f"No archived copy of {chamber} bill {bill_number}")
+        return None, None, None
+
+    body, content_type = archive.load(entry, "summary")
+    summary_text, summary_date = parse_summary_response(body or b"", content_type or "", bill_number)
+
+    bill_text = None
+    if "html" in entry["parts"]:
+        html_part = entry["parts"]["html"]
+        bill_text = normalize_archived_html(html_part["hash"], html_part["size"], html_part["content_type"])
+
+    return bill_text, summary_text, summary_date
+
+# gets the text field and the summary field from a given bill intro
+def getTextandSummary(url, is_senate, offline=False):
+    return fetch_bill_sources(BillWork.from_url(None, url, is_senate), offline)
+
+# fills in the bill text, summary and summary date of a BillWork (and returns them)
+def fetch_bill_sources(work, offline=False):
+    congress, chamber, bill_number = work.bill
+    print("Bill number:", bill_number)
+
+    # offline runs (re-running -t, regenerating after prompt changes) only read the local archive
+    if offline:
+        work.content, work.summary, work.summary_date = load_archived_bill(congress, chamber, bill_number)
+        return work.content, work.summary, work.summary_date
+
+    # getting the congress.gov api key
+    with open("utils/govkey.txt") as f:
+        api_key = f.read().strip()
+
+    # setting up headers and variables based off of whether it is a house or senate bill
+    bill_type = work.bill.bill_type
+    headers = {"X-API-Key": api_key}
+    bill_text = None
+
+    # getting the summary in two different ways (Because the congress.gov DB is inconcistant in its way of adding data)
+    # The data will either be available via json or xml format, which isnt known at the time of scraping
+    summary_url = f"{API_BASE}/{congress}/{bill_type}/{bill_number}/summaries"
+    text_url = f"{API_BASE}/{congress}/{bill_type}/{bill_number}/text"
+    try:
+        summary_resp = http_get(summary_url, headers=headers)
+        # The same thing occurs for the bill intro text, sometimes it is in json or xml format
+        text_resp = http_get(text_url, headers=headers)
+    except requests.exceptions.RequestException as e:
+        # congress.gov is down (or its breaker is open): treated as not ready, tried again next run
+        logging.warning(f"Could not fetch sources for {chamber} bill {bill_number}: {e}")
+        return bill_text, None, None
+
+    summary_type = summary_resp.headers.get("Content-Type", "") if summary_resp.ok else ""
+    summary_text, summary_date = parse_summary_response(summary_resp.content, summary_type, bill_number)
+
+    text_type = text_resp.headers.get("Content-Type", "") if text_resp.ok else ""
+    formatted_url, version = parse_text_response(text_resp.content, text_type, bill_number)
+
+    work.summary, work.summary_date = summary_text, summary_date
+
+    # nothing worth keeping until congress.gov lists a text version
+    if version is None:
+        return bill_text, summary_text, summary_date
+
+    archive = get_archive()
+    archived_parts = {}
+    if summary_type:
+        archived_parts["summary"] = (summary_resp.content, summary_type)
+    if text_type:
+        archived_parts["text_meta"] = (text_resp.content, text_type)
+
+    streamed_parts = {}
     if formatted_url:
-        raw_html_resp = requests.get(formatted_url)
+        # the formatted text for a given version never changes, so only download it once
+        entry = archive.lookup(congress, chamber, bill_number, version)
 
-        if raw_html_resp.ok:
-            bill_text = html.unescape(strip_tags(raw_html_resp.text))
+        if entry and "html" in entry["parts"]:
+            logging.debug(f"Formatted text for {chamber} bill {bill_number} served from archive ({version})")
+            html_part = entry["parts"]["html"]
+            bill_text = normalize_archived_html(html_part["hash"], html_part["size"], html_part["content_type"])
         else:
-            print(f"Formatted text HTML fetch failed: {raw_html_resp.status_code}")
+            # the html is normalized and archived chunk by chunk as it comes off the socket,
+            # so an omnibus-sized bill is never held in memory as raw html
+            # (one big enough for the cpu pool is only archived while downloading, and normalized there after)
+            try:
+                raw_html_resp = http_get(formatted_url, stream=True)
+            except requests.exceptions.RequestException as e:
+                print(f"Formatted text HTML fetch failed: {e}")
+            else:
+                try:
+                    if raw_html_resp.ok:
+                        html_type = raw_html_resp.headers.get("Content-Type", "")
+                        offload = get_offloader().worth_offloading(int(raw_html_resp.headers.get("Content-Length") or 0))
+                        # a body cut short (or a read timeout) raises out of iter_content, and the
+                        # partial blob is discarded on the way out of the with
+                        with archive.open_blob() as blob:
+                            def chunks():
+                                for chunk in raw_html_resp.iter_content(HTML_CHUNK_SIZE):
+                                    blob.write(chunk)
+                                    yield chunk
+                            if offload:
+                                # only archived here, the pool normalizes it once the download is complete
+                                for chunk in raw_html_resp.iter_content(HTML_CHUNK_SIZE):
+                                    blob.write(chunk)
+                            else:
+                                bill_text = normalize_bill_html(chunks(), html_type)
+                        streamed_parts["html"] = (blob.digest, blob.size, html_type)
+                        if offload:
+                            bill_text = normalize_archived_html(blob.digest, blob.size, html_type)
+                    else:
+                        print(f"Formatted text HTML fetch failed: {raw_html_resp.status_code}")
+                except requests.exceptions.RequestException as e:
+                    # nothing of the html is kept, so the bill stays pending and is downloaded again next run
+                    logging.warning(f"Formatted text download for {chamber} bill {bill_number} broke off: {e}")
+                    bill_text = None
+                finally:
+                    raw_html_resp.close()
+
+        log_peak_rss(f"{chamber} bill {bill_number} ({len(bill_text or '')} chars)")
+
+    archive.record(congress, chamber, bill_number, version, archived_parts, streamed_parts)
+    work.content = bill_text
+
     # print(bill_text, summary_text)
     # returning the raw bill text and raw summary text
     return bill_text, summary_text, summary_date
@@ -140,13 +261,13 @@ def get_primary_sponsor(is_senate, congress_num, bill_number):
     # using two request to get to a DB that has very consistant spelling of Sen and Rep names
     try: 
         # first request
-        response = requests.get(url, parameters)
+        response = http_get(url, params=parameters)
         response.raise_for_status()
         sponsor = response.json()['bill']['sponsors']
 
         # second request
         name_url = sponsor[0]['url']
-        directOrderID = requests.get(name_url, parameters)
+        directOrderID = http_get(name_url, params=parameters)
         sponsor_name = directOrderID.json()['member']['directOrderName']
         last_name = directOrderID.json()['member']['lastName']
 
@@ -162,6 +283,9 @@ def get_primary_sponsor(is_senate, congress_num, bill_number):
         else:
             logging.info(f"HTTP error {status} for URL: {url}")
             return "", ""
+    except requests.exceptions.RequestException as e:
+        logging.info(f"Request failed for URL: {url}: {e}")
+        return "", ""
     
     sponsor_str = ""
 
@@ -213,7 +337,7 @@ def get_most_recent_bill_number(is_senate, congress=119):
             "limit": 250  # max allowed
         }
 
-        response = requests.get(url, params=params)
+        response = http_get(url, params=params)
         response.raise_for_status()
         bills = response.json().get("bills", [])
 
@@ -0,0 +1,162 @@
+import os
+import time
+import math
+import sqlite3
+from datetime import datetime
+from config import USAGE_PATH, MODEL_PRICES
+
+# token usage, latency and cost of every generation call, one row per call
+#
+# rows are written as soon as a call returns (cancelled streams included), so the summary email
+# and the -r report can tell which bills are expensive and how close a run gets to its limits.
+# a cancelled stream never gets its usage block, so its tokens are estimated from what was sent
+# and streamed; a call that failed outright is recorded without tokens. both are flagged estimated.
+
+# rough characters per token for the estimates
+CHARS_PER_TOKEN = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS generation_usage (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url_id INTEGER,
+    chamber TEXT NOT NULL,
+    bill_number TEXT NOT NULL,
+    filename TEXT,
+    model TEXT NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    cached_tokens INTEGER NOT NULL,
+    latency REAL,
+    cost REAL NOT NULL,
+    outcome TEXT NOT NULL,
+    created REAL NOT NULL,
+    estimated INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS generation_usage_created ON generation_usage (created);
+"""
+
+# opens the usage database, creating it on first use
+def get_usage_connection(path=USAGE_PATH):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.executescript(SCHEMA)
+    # databases created before the estimated column
+    if "estimated" not in {row[1] for row in conn.execute("PRAGMA table_info(generation_usage)")}:
+        conn.execute("ALTER TABLE generation_usage ADD COLUMN estimated INTEGER NOT NULL DEFAULT 0")
+    return conn
+
+# token counts for a call whose usage block never arrived, from the prompt messages and the text streamed so far
+def estimated_usage(messages, completion):
+    prompt_chars = sum(len(m.get("content") or "") for m in messages)
+    return {
+        "prompt_tokens": math.ceil(prompt_chars / CHARS_PER_TOKEN),
+        "completion_tokens": math.ceil(len(completion) / CHARS_PER_TOKEN),
+        "cached_tokens": 0,
+        "estimated": True,
+    }
+
+# dollar cost of a call (MODEL_PRICES are per million tokens, cached prompt tokens are billed at the cached rate)
+def call_cost(model, usage):
+    prices = MODEL_PRICES.get(model)
+    if not prices or not usage:
+        return 0.0
+    uncached = usage["prompt_tokens"] - usage["cached_tokens"]
+    return (
+        uncached * prices["input"]
+        + usage["cached_tokens"] * prices["cached_input"]
+        + usage["completion_tokens"] * prices["output"]
+    ) / 1_000_000
+
+# stores the usage of one generation call for a BillWork (outcome: "ok", "cancelled", "error"),
+# with no tokens when its usage is unknown
+def record_usage(work, model, outcome, latency=None):
+    usage = work.usage or {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "estimated": True}
+    conn = get_usage_connection()
+    try:
+        with conn:
+            conn.execute(
+                """
+                INSERT INTO generation_usage
+                (url_id, chamber, bill_number, filename, model, prompt_tokens, completion_tokens,
+                 cached_tokens, latency, cost, outcome, created, estimated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    work.url_id, work.bill.chamber, work.bill.number, work.filename, model,
+                    usage["prompt_tokens"], usage["completion_tokens"], usage["cached_tokens"],
+                    latency if latency is not None else usage.get("latency"), call_cost(model, usage), outcome,
+                    time.time(), int(bool(usage.get("estimated")))
+                )
+            )
+    finally:
+        conn.close()
+
+# usage section of the summary email for every call made since the given datetime
+def run_usage_summary(since, top=5):
+    conn = get_usage_connection()
+    try:
+        since_ts = since.timestamp()
+        calls, bills, prompt_tokens, completion_tokens, cached_tokens, cost, latency, estimated = conn.execute(
+            """
+            SELECT COUNT(*), COUNT(DISTINCT chamber || bill_number), COALESCE(SUM(prompt_tokens), 0),
+                   COALESCE(SUM(completion_tokens), 0), COALESCE(SUM(cached_tokens), 0),
+                   COALESCE(SUM(cost), 0), AVG(latency), COALESCE(SUM(estimated), 0)
+            FROM generation_usage WHERE created >= ?
+            """,
+            (since_ts,)
+        ).fetchone()
+        expensive = conn.execute(
+            """
+            SELECT chamber, bill_number, SUM(prompt_tokens + completion_tokens), SUM(cost)
+            FROM generation_usage WHERE created >= ?
+            GROUP BY chamber, bill_number ORDER BY SUM(cost) DESC LIMIT ?
+            """,
+            (since_ts, top)
+        ).fetchall()
+    finally:
+        conn.close()
+
+    if not calls:
+        return "Generation Usage: no OpenAI calls this run\n"
+
+    lines = [
+        f"Generation Usage: {calls} call(s) for {bills} bill(s)" + (f" ({estimated} cancelled or failed, estimated)" if estimated else ""),
+        f"  Tokens: {prompt_tokens} prompt ({cached_tokens} cached), {completion_tokens} completion",
+        f"  Cost: ${cost:.4f} total, ${cost / bills:.4f} per bill",
+        f"  Per bill: {(prompt_tokens + completion_tokens) / bills:.0f} tokens, {latency or 0:.1f}s average call latency",
+        "  Most expensive bills:",
+    ]
+    # past the first few concurrent calls of each chamber, every call should reuse the cached static prefix
+    if calls >= 10 and not cached_tokens:
+        lines.insert(2, "  No prompt tokens were served from the prefix cache (check the static prompt prefix)")
+    for chamber, number, tokens, bill_cost in expensive:
+        lines.append(f"    {'S.' if chamber == 'senate' else 'H.R.'} {number}: {tokens} tokens, ${bill_cost:.4f}")
+    return "\n".join(lines) + "\n"
+
+# cost and token report aggregated per day and chamber (used by main.py -r)
+def usage_report(days=30):
+    conn = get_usage_connection()
+    try:
+        rows = conn.execute(
+            """
+            SELECT date(created, 'unixepoch', 'localtime') AS day, chamber, COUNT(*),
+                   COUNT(DISTINCT bill_number), SUM(prompt_tokens), SUM(cached_tokens),
+                   SUM(completion_tokens), SUM(cost)
+            FROM generation_usage WHERE created >= ?
+            GROUP BY day, chamber ORDER BY day, chamber
+            """,
+            (time.time() - days * 86400,)
+        ).fetchall()
+    finally:
+        conn.close()
+
+    lines = [f"{'Day':<12}{'Chamber':<9}{'Calls':>7}{'Bills':>7}{'Prompt':>12}{'Cached':>12}{'Completion':>12}{'Cost':>11}"]
+    for day, chamber, calls, bills, prompt_tokens, cached_tokens, completion_tokens, cost in rows:
+        lines.append(
+            f"{day:<12}{chamber:<9}{calls:>7}{bills:>7}{prompt_tokens:>12}{cached_tokens:>12}{completion_tokens:>12}{cost:>11.4f}"
+        )
+    if not rows:
+        lines.append(f"(no generation calls in the last {days} days, as of {datetime.now():%Y-%m-%d})")
+    return "\n".join(lines)